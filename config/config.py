@@ -1,7 +1,7 @@
 # config/config.py
 import os
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import List, Optional
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -17,6 +17,30 @@ class Config:
     CAPTURE_SCREENSHOTS: bool = True
     ANALYZE_LAYOUT: bool = True
     CHROME_DRIVER_PATH: Optional[str] = None
+    CRAWL_CONCURRENCY: int = 1  # Number of pages crawled in parallel
+    CRAWL_PRIORITIZE_DEPTH: bool = False  # Visit shallower pages first
+    BROWSER_CONTEXTS: int = 0  # Contexts in the shared browser pool (0 = crawl concurrency + 1)
+    CRAWL_MAX_PER_HOST: int = 0  # Concurrent navigations per origin (0 = crawl concurrency)
+    CRAWL_MIN_DELAY: float = 0.0  # Minimum seconds between navigation starts on one origin
+    CRAWL_MAX_DELAY: float = 30.0  # Upper bound of the adaptive per-host delay
+    CRAWL_LATENCY_FACTOR: float = 3.0  # Back off when a host gets this much slower than its best
+    CRAWL_THROTTLE_RETRIES: int = 2  # Retries of a page answered with 429/503
+    CRAWL_RESPECT_ROBOTS: bool = False  # Skip robots.txt-disallowed URLs and honor Crawl-delay
+    SESSION_REUSE: bool = True  # Save the session after logging in (USERNAME/PASSWORD) and reuse it
+    SESSION_STATE_PATH: Optional[str] = None  # Defaults to <OUTPUT_DIR>/storage_state.json
+    CRAWL_BLOCK_RESOURCES: bool = True  # Block heavy resources on pages crawled without a screenshot
+    CRAWL_BLOCKED_RESOURCE_TYPES: List[str] = field(default_factory=lambda: ["image", "media", "font"])
+    CRAWL_BLOCKED_HOSTS: List[str] = field(default_factory=list)  # e.g. analytics/tag-manager hosts
+    CRAWL_WAIT_UNTIL: str = "domcontentloaded"  # wait_until for link/DOM-only navigation
+    SCREENSHOT_WAIT_UNTIL: str = "load"  # wait_until for pages that get a screenshot
+    SCREENSHOT_FORMAT: str = "jpeg"  # Capture format (jpeg or png); captures stay in memory
+    SCREENSHOT_CAPTURE_QUALITY: int = 80  # JPEG quality used at capture time
+    SAVE_SCREENSHOTS: bool = False  # Also save screenshots under output/screenshots
+    SCREENSHOT_MODE: str = "full_page"  # full_page, viewport (above the fold) or main (main content clip)
+    SCREENSHOT_MAIN_SELECTORS: List[str] = field(default_factory=lambda: ["main", "[role='main']", "#main", "#content", "article"])
+    SCREENSHOT_CLIP_MAX_HEIGHT: int = 3000  # Maximum height of a main content clip (0 = no limit)
+    SCREENSHOT_FORMS: bool = False  # Also capture each visible form with locator.screenshot
+    SCREENSHOT_MAX_FORMS: int = 3  # Form close-ups per page
 
     # Output settings
     OUTPUT_DIR: str = "output"
@@ -28,11 +52,55 @@ class Config:
     LLM_TEMPERATURE: float = 0.0
     LLM_MAX_TOKENS: int = 500  # Further reduced for split analysis
     LLM_MAX_CONTEXT: int = 8000  # Maximum context size for mini model
+    PROMPT_TOKEN_BUDGET: int = 2000  # Prompt tokens per analysis call; 0 = LLM_MAX_CONTEXT - LLM_MAX_TOKENS
+    ANALYSIS_BATCH_SIZE: int = 1  # Small pages packed into one text analysis request; 1 disables batching
+    ANALYSIS_BATCH_PAGE_TOKENS: int = 600  # Pages whose data fits this many tokens can be batched
+    SINGLE_PASS_GENERATION: bool = False  # One structured-output request per page for analysis and test files
+    SINGLE_PASS_MAX_TOKENS: int = 3000  # Completion limit of a single-pass request
     VISUAL_ANALYSIS_TOKENS: int = 300  # Specific limit for visual analysis
 
+    # LLM request scheduling (async analysis path)
+    LLM_MAX_CONCURRENCY: int = 8  # Maximum LLM requests in flight
+    LLM_REQUESTS_PER_MINUTE: int = 0  # 0 disables the request budget
+    LLM_TOKENS_PER_MINUTE: int = 0  # 0 disables the token budget
+    LLM_MAX_RETRIES: int = 5  # Retries after a 429 response
+
+    # Streaming pipeline settings (--pipeline)
+    PIPELINE_ANALYSIS_WORKERS: int = 4
+    PIPELINE_WRITER_WORKERS: int = 2
+    PIPELINE_QUEUE_SIZE: int = 16  # Pages buffered between stages
+
+    # LLM response cache settings
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_REFRESH: bool = False  # Ignore cached responses but store new ones
+    LLM_CACHE_PATH: Optional[str] = None  # Defaults to <OUTPUT_DIR>/llm_cache.sqlite
+    LLM_CACHE_TTL_SECONDS: int = 30 * 24 * 3600
+    LLM_CACHE_MAX_MB: int = 512
+
+    # Run ledger (per-URL stage status used by --resume)
+    RUN_LEDGER_PATH: Optional[str] = None  # Defaults to <OUTPUT_DIR>/run_ledger.sqlite
+
+    # Incremental regeneration (--incremental)
+    INCREMENTAL_CRAWL: bool = False  # Skip pages whose structure matches the previous run
+    PAGE_INDEX_PATH: Optional[str] = None  # Defaults to <OUTPUT_DIR>/page_index.sqlite
+
+    # Template clustering (--cluster-templates)
+    TEMPLATE_CLUSTERING: bool = False  # Analyze one representative page per DOM template
+    TEMPLATE_SIMILARITY_THRESHOLD: float = 0.8  # Estimated Jaccard similarity to share a template
+
     # Screenshot optimization settings
     SCREENSHOT_MAX_DIMENSION: int = 1280  # Maximum dimension in pixels
     SCREENSHOT_QUALITY: int = 75  # JPEG quality (1-100)
+    SCREENSHOT_WORKERS: int = 0  # Processes for screenshot optimization (0 = CPU count)
+    SCREENSHOT_TILING: bool = False  # Send tall pages as viewport-height tiles instead of one shrunk image
+    SCREENSHOT_TILE_WIDTH: int = 1024
+    SCREENSHOT_TILE_HEIGHT: int = 768
+    SCREENSHOT_TOKEN_BUDGET: int = 4000  # Estimated image tokens per page in tiling mode
+    SCREENSHOT_TILE_MIN_STDDEV: float = 3.0  # Tiles with less grayscale variation are dropped as blank
+
+    # Reuse vision analyses for visually identical screenshots (perceptual hash)
+    VISUAL_DEDUP_ENABLED: bool = True
+    VISUAL_DEDUP_MAX_DISTANCE: int = 4  # Maximum Hamming distance between 64-bit pHashes
 
     # Test generation settings
     USE_DIRECT_TEXT: bool = True  # Use direct text-based approach instead of JSON parsing
@@ -48,17 +116,81 @@ class Config:
         self.CHROME_DRIVER_PATH = os.getenv("CHROME_DRIVER_PATH", self.CHROME_DRIVER_PATH)
         self.OUTPUT_DIR = os.getenv("OUTPUT_DIR", self.OUTPUT_DIR)
         self.BASE_URL = os.getenv("BASE_URL", self.BASE_URL)
+        self.CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", str(self.CRAWL_CONCURRENCY)))
+        self.CRAWL_PRIORITIZE_DEPTH = os.getenv("CRAWL_PRIORITIZE_DEPTH", str(self.CRAWL_PRIORITIZE_DEPTH)).lower() == "true"
+        self.BROWSER_CONTEXTS = int(os.getenv("BROWSER_CONTEXTS", str(self.BROWSER_CONTEXTS)))
+        self.CRAWL_MAX_PER_HOST = int(os.getenv("CRAWL_MAX_PER_HOST", str(self.CRAWL_MAX_PER_HOST)))
+        self.CRAWL_MIN_DELAY = float(os.getenv("CRAWL_MIN_DELAY", str(self.CRAWL_MIN_DELAY)))
+        self.CRAWL_MAX_DELAY = float(os.getenv("CRAWL_MAX_DELAY", str(self.CRAWL_MAX_DELAY)))
+        self.CRAWL_LATENCY_FACTOR = float(os.getenv("CRAWL_LATENCY_FACTOR", str(self.CRAWL_LATENCY_FACTOR)))
+        self.CRAWL_THROTTLE_RETRIES = int(os.getenv("CRAWL_THROTTLE_RETRIES", str(self.CRAWL_THROTTLE_RETRIES)))
+        self.CRAWL_RESPECT_ROBOTS = os.getenv("CRAWL_RESPECT_ROBOTS", str(self.CRAWL_RESPECT_ROBOTS)).lower() == "true"
+        self.SESSION_REUSE = os.getenv("SESSION_REUSE", str(self.SESSION_REUSE)).lower() == "true"
+        self.CAPTURE_SCREENSHOTS = os.getenv("CAPTURE_SCREENSHOTS", str(self.CAPTURE_SCREENSHOTS)).lower() == "true"
+        self.CRAWL_BLOCK_RESOURCES = os.getenv("CRAWL_BLOCK_RESOURCES", str(self.CRAWL_BLOCK_RESOURCES)).lower() == "true"
+        self.CRAWL_BLOCKED_RESOURCE_TYPES = self._getenv_list("CRAWL_BLOCKED_RESOURCE_TYPES", self.CRAWL_BLOCKED_RESOURCE_TYPES)
+        self.CRAWL_BLOCKED_HOSTS = self._getenv_list("CRAWL_BLOCKED_HOSTS", self.CRAWL_BLOCKED_HOSTS)
+        self.CRAWL_WAIT_UNTIL = os.getenv("CRAWL_WAIT_UNTIL", self.CRAWL_WAIT_UNTIL)
+        self.SCREENSHOT_WAIT_UNTIL = os.getenv("SCREENSHOT_WAIT_UNTIL", self.SCREENSHOT_WAIT_UNTIL)
+        self.SCREENSHOT_FORMAT = os.getenv("SCREENSHOT_FORMAT", self.SCREENSHOT_FORMAT).lower()
+        self.SCREENSHOT_CAPTURE_QUALITY = int(os.getenv("SCREENSHOT_CAPTURE_QUALITY", str(self.SCREENSHOT_CAPTURE_QUALITY)))
+        self.SAVE_SCREENSHOTS = os.getenv("SAVE_SCREENSHOTS", str(self.SAVE_SCREENSHOTS)).lower() == "true"
+        self.SCREENSHOT_MODE = os.getenv("SCREENSHOT_MODE", self.SCREENSHOT_MODE).lower()
+        self.SCREENSHOT_MAIN_SELECTORS = self._getenv_list("SCREENSHOT_MAIN_SELECTORS", self.SCREENSHOT_MAIN_SELECTORS)
+        self.SCREENSHOT_CLIP_MAX_HEIGHT = int(os.getenv("SCREENSHOT_CLIP_MAX_HEIGHT", str(self.SCREENSHOT_CLIP_MAX_HEIGHT)))
+        self.SCREENSHOT_FORMS = os.getenv("SCREENSHOT_FORMS", str(self.SCREENSHOT_FORMS)).lower() == "true"
+        self.SCREENSHOT_MAX_FORMS = int(os.getenv("SCREENSHOT_MAX_FORMS", str(self.SCREENSHOT_MAX_FORMS)))
         self.LLM_MODEL = os.getenv("LLM_MODEL", self.LLM_MODEL)
         self.LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", str(self.LLM_TEMPERATURE)))
         self.LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", str(self.LLM_MAX_TOKENS)))
+        self.LLM_MAX_CONTEXT = int(os.getenv("LLM_MAX_CONTEXT", str(self.LLM_MAX_CONTEXT)))
+        self.PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", str(self.PROMPT_TOKEN_BUDGET)))
+        self.ANALYSIS_BATCH_SIZE = int(os.getenv("ANALYSIS_BATCH_SIZE", str(self.ANALYSIS_BATCH_SIZE)))
+        self.ANALYSIS_BATCH_PAGE_TOKENS = int(os.getenv("ANALYSIS_BATCH_PAGE_TOKENS", str(self.ANALYSIS_BATCH_PAGE_TOKENS)))
+        self.SINGLE_PASS_GENERATION = os.getenv("SINGLE_PASS_GENERATION", str(self.SINGLE_PASS_GENERATION)).lower() == "true"
+        self.SINGLE_PASS_MAX_TOKENS = int(os.getenv("SINGLE_PASS_MAX_TOKENS", str(self.SINGLE_PASS_MAX_TOKENS)))
         self.USE_DIRECT_TEXT = os.getenv("USE_DIRECT_TEXT", str(self.USE_DIRECT_TEXT)).lower() == "true"
         self.GENERATE_NEGATIVE_TESTS = os.getenv("GENERATE_NEGATIVE_TESTS", str(self.GENERATE_NEGATIVE_TESTS)).lower() == "true"
+        self.LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", str(self.LLM_MAX_CONCURRENCY)))
+        self.LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", str(self.LLM_REQUESTS_PER_MINUTE)))
+        self.LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", str(self.LLM_TOKENS_PER_MINUTE)))
+        self.LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", str(self.LLM_MAX_RETRIES)))
+        self.PIPELINE_ANALYSIS_WORKERS = int(os.getenv("PIPELINE_ANALYSIS_WORKERS", str(self.PIPELINE_ANALYSIS_WORKERS)))
+        self.PIPELINE_WRITER_WORKERS = int(os.getenv("PIPELINE_WRITER_WORKERS", str(self.PIPELINE_WRITER_WORKERS)))
+        self.PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", str(self.PIPELINE_QUEUE_SIZE)))
+        self.LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", str(self.LLM_CACHE_ENABLED)).lower() == "true"
+        self.LLM_CACHE_REFRESH = os.getenv("LLM_CACHE_REFRESH", str(self.LLM_CACHE_REFRESH)).lower() == "true"
+        self.LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", self.LLM_CACHE_PATH) or os.path.join(self.OUTPUT_DIR, "llm_cache.sqlite")
+        self.LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(self.LLM_CACHE_TTL_SECONDS)))
+        self.LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", str(self.LLM_CACHE_MAX_MB)))
+        self.SCREENSHOT_WORKERS = int(os.getenv("SCREENSHOT_WORKERS", str(self.SCREENSHOT_WORKERS)))
+        self.SCREENSHOT_TILING = os.getenv("SCREENSHOT_TILING", str(self.SCREENSHOT_TILING)).lower() == "true"
+        self.SCREENSHOT_TILE_WIDTH = int(os.getenv("SCREENSHOT_TILE_WIDTH", str(self.SCREENSHOT_TILE_WIDTH)))
+        self.SCREENSHOT_TILE_HEIGHT = int(os.getenv("SCREENSHOT_TILE_HEIGHT", str(self.SCREENSHOT_TILE_HEIGHT)))
+        self.SCREENSHOT_TOKEN_BUDGET = int(os.getenv("SCREENSHOT_TOKEN_BUDGET", str(self.SCREENSHOT_TOKEN_BUDGET)))
+        self.SCREENSHOT_TILE_MIN_STDDEV = float(os.getenv("SCREENSHOT_TILE_MIN_STDDEV", str(self.SCREENSHOT_TILE_MIN_STDDEV)))
+        self.VISUAL_DEDUP_ENABLED = os.getenv("VISUAL_DEDUP_ENABLED", str(self.VISUAL_DEDUP_ENABLED)).lower() == "true"
+        self.VISUAL_DEDUP_MAX_DISTANCE = int(os.getenv("VISUAL_DEDUP_MAX_DISTANCE", str(self.VISUAL_DEDUP_MAX_DISTANCE)))
+        self.SESSION_STATE_PATH = os.getenv("SESSION_STATE_PATH", self.SESSION_STATE_PATH) or os.path.join(self.OUTPUT_DIR, "storage_state.json")
+        self.RUN_LEDGER_PATH = os.getenv("RUN_LEDGER_PATH", self.RUN_LEDGER_PATH) or os.path.join(self.OUTPUT_DIR, "run_ledger.sqlite")
+        self.INCREMENTAL_CRAWL = os.getenv("INCREMENTAL_CRAWL", str(self.INCREMENTAL_CRAWL)).lower() == "true"
+        self.PAGE_INDEX_PATH = os.getenv("PAGE_INDEX_PATH", self.PAGE_INDEX_PATH) or os.path.join(self.OUTPUT_DIR, "page_index.sqlite")
+        self.TEMPLATE_CLUSTERING = os.getenv("TEMPLATE_CLUSTERING", str(self.TEMPLATE_CLUSTERING)).lower() == "true"
+        self.TEMPLATE_SIMILARITY_THRESHOLD = float(os.getenv("TEMPLATE_SIMILARITY_THRESHOLD", str(self.TEMPLATE_SIMILARITY_THRESHOLD)))
 
         # Create output directories
         self._create_output_directories()
 
         self.validate()
 
+    @staticmethod
+    def _getenv_list(name, default):
+        """Read a comma-separated list from the environment."""
+        value = os.getenv(name)
+        if value is None:
+            return default
+        return [item.strip() for item in value.split(",") if item.strip()]
+
     def validate(self):
         """Validate configuration."""
         if not self.OPENAI_API_KEY:
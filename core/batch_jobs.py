@@ -0,0 +1,337 @@
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+# Batch API statuses after which a batch no longer changes
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+# Dry-run answer of LocalBatchRunner: it carries every section the analyzer
+# and the test script parser look for, so a whole run can be exercised offline
+OFFLINE_RESPONSE = """Key elements:
+- Main heading
+Unique identifiers:
+- Page title
+Recommended smoke test steps:
+1. Open the page
+2. Verify the page loads
+Suggested locator strategies:
+- Main heading: css=h1
+
+FEATURE FILE:
+Feature: Page smoke test (offline dry run)
+  Scenario: Page loads
+    Given I open the page
+    Then the page loads
+
+STEP DEFINITIONS:
+// Offline dry run: no step definitions generated
+
+PAGE OBJECT:
+// Offline dry run: no page object generated
+"""
+
+
+class BatchDeferred(Exception):
+    """
+    Raised on an LLM cache miss while the analyzer collects requests for a
+    batch job. The analyzer's and TestGenerator's fallback handlers re-raise
+    it (`except BatchDeferred: raise`), so a deferred request skips the page
+    for the round instead of turning into a fallback result.
+    """
+
+    def __init__(self, key: str):
+        super().__init__(key)
+        self.key = key
+
+
+class BatchRequestFile:
+    """
+    JSONL file of chat completion requests in the Batch API input format.
+
+    Each line's custom_id is the LLM response cache key of the request, so
+    the batch results can be stored in the cache as they come back.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._keys = set()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Start every round from an empty file
+        open(path, "w", encoding="utf-8").close()
+
+    @property
+    def count(self) -> int:
+        return len(self._keys)
+
+    def add(self, key: str, body: Dict[str, Any]) -> None:
+        """Append a request; a request already in the file is not written twice."""
+        if key in self._keys:
+            return
+        self._keys.add(key)
+        line = {"custom_id": key, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(line) + "\n")
+
+
+def parse_batch_output(text: str) -> Dict[str, str]:
+    """Return {custom_id: response content} for the successful lines of a batch output file."""
+    results = {}
+    failed = 0
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        try:
+            if response.get("status_code") != 200:
+                raise ValueError(record.get("error") or f"status {response.get('status_code')}")
+            results[record["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            failed += 1
+            logger.debug(f"Batch request {record.get('custom_id')} failed: {e}")
+    if failed:
+        logger.warning(f"{failed} batch request(s) failed; they are retried in the next round")
+    return results
+
+
+def _output_path(path: str) -> str:
+    root, _ = os.path.splitext(path)
+    return root + ".output.jsonl"
+
+
+class OpenAIBatchRunner:
+    """Submits a request file to the OpenAI Batch API and waits for the results."""
+
+    def __init__(self, client, poll_interval: float = 60.0, completion_window: str = "24h",
+                 timeout: Optional[float] = None):
+        """
+        Initialize the runner.
+
+        Args:
+            client (openai.OpenAI): API client
+            poll_interval (float): Seconds between status checks
+            completion_window (str): Batch API completion window
+            timeout (float): Give up waiting after this many seconds (None waits for the window)
+        """
+        self.client = client
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.timeout = timeout
+
+    def run(self, path: str) -> Dict[str, str]:
+        """Submit path, wait for the batch to finish and return {custom_id: content}."""
+        with open(path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window,
+        )
+        logger.info(f"Submitted batch {batch.id} from {path}")
+        batch = self.wait(batch.id)
+        if not batch.output_file_id:
+            logger.error(f"Batch {batch.id} ended {batch.status} without results")
+            return {}
+        text = self.client.files.content(batch.output_file_id).text
+        with open(_output_path(path), "w", encoding="utf-8") as f:
+            f.write(text)
+        return parse_batch_output(text)
+
+    def wait(self, batch_id: str):
+        """Poll a batch until it reaches a final status and return it."""
+        started = time.monotonic()
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status in FINAL_STATUSES:
+                logger.info(f"Batch {batch_id} {batch.status}")
+                return batch
+            if self.timeout is not None and time.monotonic() - started > self.timeout:
+                raise TimeoutError(f"Batch {batch_id} still {batch.status} after {self.timeout}s")
+            counts = batch.request_counts
+            if counts is not None:
+                logger.info(f"Batch {batch_id} {batch.status}: {counts.completed}/{counts.total} done")
+            time.sleep(self.poll_interval)
+
+
+class LocalBatchRunner:
+    """
+    Offline stand-in for the Batch API: answers every request of the file
+    with responder(body) and writes a Batch API output file next to it, which
+    is then read back like a real batch's output.
+    """
+
+    def __init__(self, responder: Optional[Callable[[Dict[str, Any]], str]] = None):
+        """
+        Initialize the runner.
+
+        Args:
+            responder: Returns the response content for a request body;
+                defaults to the canned OFFLINE_RESPONSE (dry run)
+        """
+        self.responder = responder or (lambda body: OFFLINE_RESPONSE)
+
+    def run(self, path: str) -> Dict[str, str]:
+        """Process path offline and return {custom_id: content}."""
+        lines = []
+        with open(path, "r", encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                record = {"id": f"batch_req_{number}", "custom_id": request["custom_id"], "response": None, "error": None}
+                try:
+                    content = self.responder(request["body"])
+                    record["response"] = {
+                        "status_code": 200,
+                        "body": {"choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                              "finish_reason": "stop"}]},
+                    }
+                except Exception as e:
+                    record["error"] = {"code": "local_error", "message": str(e)}
+                lines.append(json.dumps(record))
+        text = "\n".join(lines) + "\n"
+        with open(_output_path(path), "w", encoding="utf-8") as f:
+            f.write(text)
+        logger.info(f"Processed {len(lines)} request(s) from {path} offline")
+        return parse_batch_output(text)
+
+
+def run_batch_generation(generator, runner, work_dir: str, max_rounds: int = 4, **generate_kwargs):
+    """
+    Run TestGenerator.generate_tests with its LLM requests answered by batch jobs.
+    Only the synchronous request methods defer; run.py's crawl-and-generate
+    flow makes its requests directly.
+
+    Each round runs generation while the analyzer writes every cache miss to
+    a request file instead of calling the API; pages waiting on a request are
+    skipped for the round. The file goes to runner, the responses are stored
+    in the LLM response cache, and the next round gets one step further: a
+    page needs a round per dependent request (vision, DOM analysis, test
+    script). The round that collects no request writes every page from the
+    cache. Requests still unanswered after max_rounds are made directly.
+
+    Args:
+        generator (TestGenerator): Generator whose analyzer makes the requests
+        runner: OpenAIBatchRunner or LocalBatchRunner
+        work_dir (str): Directory for the request and output files
+        max_rounds (int): Batch rounds before falling back to direct requests
+        **generate_kwargs: Arguments for generate_tests
+
+    Returns:
+        dict: Generated tests, as returned by generate_tests
+    """
+    analyzer = generator.llm_analyzer
+    if not analyzer.cache.enabled:
+        raise ValueError("Batch mode stores its results in the LLM response cache; enable LLM_CACHE_ENABLED")
+
+    for round_number in range(1, max_rounds + 1):
+        requests = BatchRequestFile(os.path.join(work_dir, f"requests_round{round_number}.jsonl"))
+        analyzer.batch_requests = requests
+        try:
+            generated = generator.generate_tests(**generate_kwargs)
+        finally:
+            analyzer.batch_requests = None
+        if not requests.count:
+            logger.info(f"Batch generation finished after {round_number - 1} batch round(s)")
+            return generated
+
+        logger.info(f"Batch round {round_number}: {requests.count} request(s) in {requests.path}")
+        results = runner.run(requests.path)
+        for key, content in results.items():
+            analyzer.cache.set(key, content)
+        # Later rounds read these responses even when the cache refreshes everything else
+        analyzer.cache.fresh_keys.update(results)
+        logger.info(f"Batch round {round_number}: {len(results)}/{requests.count} response(s) cached")
+        if not results:
+            break
+
+    logger.warning("Batch rounds exhausted; remaining requests are sent directly")
+    return generator.generate_tests(**generate_kwargs)
+
+
+@contextmanager
+def scratch_cache(analyzer):
+    """
+    Swap the analyzer's LLM response cache for an empty one in a temporary
+    directory, so a dry run's canned answers never reach the persistent cache.
+    """
+    from core.llm_cache import LLMResponseCache
+
+    persistent = analyzer.cache
+    with tempfile.TemporaryDirectory(prefix="batch_jobs_") as directory:
+        analyzer.cache = LLMResponseCache(os.path.join(directory, "llm_cache.sqlite"))
+        try:
+            yield analyzer.cache
+        finally:
+            analyzer.cache.close()
+            analyzer.cache = persistent
+
+
+def load_pages(path: str) -> Dict[str, Dict[str, Any]]:
+    """Load {url: page data} from a discovered pages JSON file or a crawl's page_data directory."""
+    if not os.path.isdir(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    pages = {}
+    for name in sorted(os.listdir(path)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(path, name), "r", encoding="utf-8") as f:
+            page_data = json.load(f)
+        if isinstance(page_data, dict) and page_data.get("url"):
+            pages[page_data["url"]] = page_data
+    return pages
+
+
+def main(argv=None):
+    """Generate tests for crawled pages through the Batch API (or offline with --local)."""
+    import argparse
+
+    from config.config import Config
+    from core.test_generator import TestGenerator
+
+    parser = argparse.ArgumentParser(description="Generate smoke tests with batched LLM requests")
+    parser.add_argument("pages", help="Discovered pages JSON ({url: page data}) or a crawl's page_data directory")
+    parser.add_argument("-o", "--output", default=None, help="Directory for generated tests")
+    parser.add_argument("-f", "--framework", default="cucumber", help="Test framework")
+    parser.add_argument("-l", "--language", default="java", help="Programming language")
+    parser.add_argument("--vision", action="store_true", help="Use vision analysis for pages with screenshots")
+    parser.add_argument("--work-dir", default=None, help="Directory for request/output files (default: <OUTPUT_DIR>/batch_jobs)")
+    parser.add_argument("--local", action="store_true", help="Process the request files offline with canned answers in a throwaway cache (dry run)")
+    parser.add_argument("--poll-interval", type=float, default=60.0, help="Seconds between batch status checks")
+    parser.add_argument("--max-rounds", type=int, default=4, help="Batch rounds before sending remaining requests directly")
+    args = parser.parse_args(argv)
+
+    config = Config()
+    generator = TestGenerator(config)
+    if args.local:
+        runner, cache = LocalBatchRunner(), scratch_cache(generator.llm_analyzer)
+    else:
+        runner, cache = OpenAIBatchRunner(generator.llm_analyzer.openai_client, poll_interval=args.poll_interval), nullcontext()
+    with cache:
+        generated = run_batch_generation(
+            generator,
+            runner,
+            args.work_dir or os.path.join(config.OUTPUT_DIR, "batch_jobs"),
+            max_rounds=args.max_rounds,
+            discovered_pages_data=load_pages(args.pages),
+            output_dir=args.output,
+            framework=args.framework,
+            language=args.language,
+            use_vision=args.vision,
+        )
+    logger.info(f"Generated tests for {len(generated)} page(s)")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,228 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+from playwright.async_api import async_playwright
+
+logger = logging.getLogger(__name__)
+
+
+def storage_state_expired(state: Dict[str, Any], now: Optional[float] = None) -> bool:
+    """True when a saved storage state has no cookies or one of its persistent cookies has expired."""
+    cookies = state.get("cookies") or []
+    if not cookies:
+        return True
+    now = time.time() if now is None else now
+    return any(0 < cookie.get("expires", -1) < now for cookie in cookies)
+
+
+def load_storage_state(path: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Load a storage state file written by context.storage_state, or None if missing, unreadable or expired."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except Exception as e:
+        logger.warning(f"Could not read saved session {path}: {e}")
+        return None
+    if storage_state_expired(state):
+        logger.info(f"Saved session {path} has expired")
+        return None
+    return state
+
+
+class BrowserPool:
+    """
+    One long-lived Playwright browser with a pool of leasable contexts.
+
+    Contexts are created lazily up to `size` and returned to the pool after
+    each lease, so the crawler workers and the analyzer's screenshot fallback
+    share one browser process instead of each launching their own. Leased
+    contexts keep their cookies and storage between leases.
+
+    With a storage_state_path, an authenticated session saved by
+    save_storage_state is loaded into every new context and reused by later
+    runs until it expires. Contexts created before a (re-)login get the new
+    session cookies the next time they are leased or synced.
+    """
+
+    def __init__(self, size: int = 4, headless: bool = True,
+                 context_options: Optional[Dict[str, Any]] = None,
+                 storage_state_path: Optional[str] = None):
+        """
+        Initialize the pool.
+
+        Args:
+            size (int): Maximum number of browser contexts
+            headless (bool): Launch the browser headless
+            context_options (dict): Keyword arguments for browser.new_context
+            storage_state_path (str): File the authenticated session is saved to and loaded from
+        """
+        self.size = max(1, size)
+        self.headless = headless
+        self.context_options = dict(context_options or {})
+        self.storage_state_path = storage_state_path
+        self.loop = None
+        self.stats = {"leases": 0, "contexts": 0, "waits": 0, "logins_saved": 0}
+        self._state = None
+        self._state_version = 0
+        self._context_versions = {}
+        self._playwright = None
+        self._browser = None
+        self._contexts = []
+        self._idle = []
+        self._reserved = 0
+        self._condition = None
+        self._thread_id = None
+
+    @property
+    def started(self) -> bool:
+        return self._browser is not None
+
+    @property
+    def has_session(self) -> bool:
+        """True when a saved authenticated session is loaded into the pool's contexts."""
+        return self._state is not None
+
+    @property
+    def state_version(self) -> int:
+        return self._state_version
+
+    async def save_storage_state(self, context) -> None:
+        """Save the session of a context that just logged in and share it with every pooled context."""
+        if not self.storage_state_path:
+            return
+        directory = os.path.dirname(self.storage_state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._state = await context.storage_state(path=self.storage_state_path)
+        self._state_version += 1
+        self._context_versions[context] = self._state_version
+        self.stats["logins_saved"] += 1
+        logger.info(f"Saved session to {self.storage_state_path}")
+
+    async def sync_context(self, context) -> None:
+        """Give a context created before the latest save the current session cookies."""
+        if self._state is None or self._context_versions.get(context, 0) >= self._state_version:
+            return
+        await context.clear_cookies()
+        await context.add_cookies(self._state.get("cookies") or [])
+        self._context_versions[context] = self._state_version
+
+    async def start(self) -> "BrowserPool":
+        """Launch the browser; calling start on a running pool is a no-op."""
+        if self.started:
+            return self
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(headless=self.headless)
+        self._condition = asyncio.Condition()
+        self.loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._state = load_storage_state(self.storage_state_path)
+        if self._state is not None:
+            self._state_version = 1
+            logger.info(f"Reusing saved session from {self.storage_state_path}")
+        logger.info(f"Browser pool started ({self.size} context(s) max)")
+        return self
+
+    async def close(self) -> None:
+        """Close every context, the browser and Playwright."""
+        if not self.started:
+            return
+        for context in self._contexts:
+            try:
+                await context.close()
+            except Exception as e:
+                logger.debug(f"Failed to close browser context: {e}")
+        self._contexts.clear()
+        self._idle.clear()
+        self._context_versions.clear()
+        self._reserved = 0
+        await self._browser.close()
+        await self._playwright.stop()
+        self._browser = None
+        self._playwright = None
+        logger.info(f"Browser pool closed: {self.stats}")
+
+    async def __aenter__(self) -> "BrowserPool":
+        return await self.start()
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def _acquire(self):
+        context = None
+        async with self._condition:
+            while not self._idle and self._reserved >= self.size:
+                self.stats["waits"] += 1
+                await self._condition.wait()
+            self.stats["leases"] += 1
+            if self._idle:
+                context = self._idle.pop()
+            else:
+                # Reserve the slot before awaiting so concurrent callers respect size
+                self._reserved += 1
+        if context is not None:
+            try:
+                await self.sync_context(context)
+            except Exception as e:
+                logger.warning(f"Could not refresh session cookies of a pooled context: {e}")
+            return context
+        options = dict(self.context_options)
+        if self._state is not None:
+            options["storage_state"] = self._state
+        try:
+            context = await self._browser.new_context(**options)
+        except Exception:
+            async with self._condition:
+                self._reserved -= 1
+                self._condition.notify()
+            raise
+        self._contexts.append(context)
+        self._context_versions[context] = self._state_version
+        self.stats["contexts"] += 1
+        return context
+
+    async def _release(self, context) -> None:
+        async with self._condition:
+            self._idle.append(context)
+            self._condition.notify()
+
+    @asynccontextmanager
+    async def lease(self):
+        """Lease a browser context for the duration of the block."""
+        if not self.started:
+            raise RuntimeError("BrowserPool.start() must be called before leasing a context")
+        context = await self._acquire()
+        try:
+            yield context
+        finally:
+            await self._release(context)
+
+    async def screenshot(self, url: str, timeout: int = 60000, **options) -> bytes:
+        """Load url in a leased context and return a screenshot taken with page.screenshot(**options)."""
+        async with self.lease() as context:
+            page = await context.new_page()
+            try:
+                await page.goto(url, wait_until="load", timeout=timeout)
+                return await page.screenshot(**options)
+            finally:
+                await page.close()
+
+    def screenshot_threadsafe(self, url: str, timeout: int = 60000, **options) -> bytes:
+        """
+        Blocking variant of screenshot for callers running in another thread
+        (e.g. through asyncio.to_thread) while the pool's event loop runs.
+        """
+        if not self.started or self.loop is None or not self.loop.is_running():
+            raise RuntimeError("Browser pool is not running")
+        if threading.get_ident() == self._thread_id:
+            raise RuntimeError("screenshot_threadsafe would block the browser pool's event loop")
+        future = asyncio.run_coroutine_threadsafe(self.screenshot(url, timeout=timeout, **options), self.loop)
+        return future.result(timeout=timeout / 1000 + 30)
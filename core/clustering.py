@@ -0,0 +1,285 @@
+import hashlib
+import logging
+import random
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Set
+
+logger = logging.getLogger(__name__)
+
+# Mersenne prime used for the MinHash permutations
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+DIGITS = re.compile(r"\d+")
+
+# Gherkin keywords scenario_outline rewrites around
+SCENARIO_KEYWORDS = ("Scenario:", "Scenario Outline:", "Scenario Template:", "Example:")
+EXAMPLES_KEYWORDS = ("Examples:", "Scenarios:")
+STEP_KEYWORDS = ("Given", "When", "Then", "And", "But", "*")
+
+
+@dataclass
+class PageCluster:
+    """Pages rendered from the same template; only the representative is analyzed."""
+    representative: str
+    urls: List[str] = field(default_factory=list)
+
+
+def structure_tokens(page_data: Dict) -> List[str]:
+    """
+    Turn a page's extracted structure into an ordered token sequence.
+
+    Interactive elements contribute their tag path (ancestor tags down to the
+    element) plus type and name, forms their method and inputs, and headings
+    their level. Text and numbers are ignored so pages of one template match.
+    """
+    tokens = []
+    for heading in page_data.get("headings", []):
+        tokens.append(f"h{heading.get('level')}")
+    for form in page_data.get("forms", []):
+        tokens.append(f"form:{(form.get('method') or 'get').lower()}")
+        for i in form.get("inputs", []):
+            tokens.append(f"input:{i.get('type', '')}:{DIGITS.sub('#', i.get('name', ''))}")
+    for el in page_data.get("elements", []):
+        path = el.get("path") or el.get("tag", "")
+        tokens.append(f"{path}:{el.get('type', '')}:{DIGITS.sub('#', el.get('name', ''))}")
+    return tokens
+
+
+def shingles(tokens: List[str], k: int = 3) -> Set[str]:
+    """Return the set of k-token shingles (the whole sequence if shorter than k)."""
+    if len(tokens) < k:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)}
+
+
+class MinHasher:
+    """MinHash signatures with seeded universal hash permutations."""
+
+    def __init__(self, num_perm: int = 32, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._perms = [
+            (rng.randint(1, MERSENNE_PRIME - 1), rng.randint(0, MERSENNE_PRIME - 1))
+            for _ in range(num_perm)
+        ]
+
+    def signature(self, items: Iterable[str]) -> List[int]:
+        hashes = [
+            int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=4).digest(), "big")
+            for item in items
+        ]
+        if not hashes:
+            return [MAX_HASH] * self.num_perm
+        return [
+            min(((a * h + b) % MERSENNE_PRIME) & MAX_HASH for h in hashes)
+            for a, b in self._perms
+        ]
+
+    @staticmethod
+    def similarity(sig_a: List[int], sig_b: List[int]) -> float:
+        """Estimate the Jaccard similarity of the underlying shingle sets."""
+        return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+def cluster_pages(pages: Dict[str, Dict], threshold: float = 0.8, num_perm: int = 32,
+                  bands: int = 8, shingle_size: int = 3) -> List[PageCluster]:
+    """
+    Group pages by DOM-structure similarity.
+
+    Each page's tag-path shingles are MinHashed and banded into LSH buckets,
+    so a page is only compared against cluster representatives it shares a
+    bucket with. A page joins the first representative whose estimated
+    similarity reaches the threshold and otherwise starts a new cluster.
+    Pages are visited in the given order, so with crawl order the shallowest
+    page of each template becomes its representative.
+
+    Args:
+        pages (dict): {url: page_data} as returned by the crawler
+        threshold (float): Minimum estimated Jaccard similarity to share a template
+        num_perm (int): MinHash permutations (must be divisible by bands)
+        bands (int): LSH bands
+        shingle_size (int): Tokens per shingle
+
+    Returns:
+        list: PageCluster objects in order of their representative
+    """
+    rows = num_perm // bands
+    hasher = MinHasher(num_perm)
+    buckets = defaultdict(list)
+    signatures = {}
+    clusters: Dict[str, PageCluster] = {}
+
+    for url, page_data in pages.items():
+        page_shingles = shingles(structure_tokens(page_data), shingle_size)
+        if not page_shingles:
+            # Nothing structural to compare; keep the page on its own
+            clusters[url] = PageCluster(url, [url])
+            continue
+        sig = hasher.signature(page_shingles)
+        keys = [(band, tuple(sig[band * rows:(band + 1) * rows])) for band in range(bands)]
+
+        match = None
+        checked = set()
+        for key in keys:
+            for rep in buckets[key]:
+                if rep in checked:
+                    continue
+                checked.add(rep)
+                if MinHasher.similarity(sig, signatures[rep]) >= threshold:
+                    match = rep
+                    break
+            if match:
+                break
+
+        if match:
+            clusters[match].urls.append(url)
+            continue
+        signatures[url] = sig
+        clusters[url] = PageCluster(url, [url])
+        for key in keys:
+            buckets[key].append(url)
+
+    result = list(clusters.values())
+    logger.info(f"Clustered {len(pages)} pages into {len(result)} templates")
+    return result
+
+
+def scenario_outline(feature_text: str, representative_url: str, urls: List[str]) -> str:
+    """
+    Parametrize a feature generated for one page over every page of its template.
+
+    Each Scenario becomes a Scenario Outline that opens "<url>". A scenario
+    without Examples gets a table listing the cluster's URLs; existing
+    Examples tables get a url column holding every URL/row combination.
+    A Background that opens the representative page cannot see the
+    Examples, so its steps move into each outline.
+
+    Args:
+        feature_text (str): Gherkin generated for the representative page
+        representative_url (str): URL the feature was generated for
+        urls (list): All URLs of the cluster, representative included
+
+    Returns:
+        str: The parametrized feature
+    """
+    if len(urls) < 2:
+        return feature_text
+
+    variants = sorted({representative_url, representative_url.rstrip("/")}, key=len, reverse=True)
+    sections = _split_sections(feature_text.splitlines())
+
+    # A Background that opens the page moves, whole, into every outline
+    navigation = []
+    for section in sections:
+        if section and section[0].strip().startswith("Background:"):
+            steps = [_replace_url(line, variants).strip() for line in section[1:] if _is_step(line)]
+            if any("<url>" in step for step in steps):
+                navigation.extend(steps)
+                del section[:]
+
+    output = []
+    for section in sections:
+        if section and section[0].strip().startswith(SCENARIO_KEYWORDS):
+            output.extend(_outline(section, variants, urls, navigation))
+        else:
+            output.extend(section)
+    return "\n".join(output).rstrip() + "\n"
+
+
+def _indent(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+
+def _is_step(line: str) -> bool:
+    return line.strip().split(" ", 1)[0] in STEP_KEYWORDS
+
+
+def _replace_url(line: str, variants: List[str]) -> str:
+    for variant in variants:
+        if variant and variant in line:
+            line = line.replace(variant, "<url>")
+    return line
+
+
+def _split_sections(lines: List[str]) -> List[List[str]]:
+    """Split a feature into Background, scenario and other (header, tags, Rule) sections."""
+    sections = [[]]
+    in_block = False
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith(SCENARIO_KEYWORDS + ("Background:",)):
+            sections.append([line])
+            in_block = True
+        elif in_block and stripped.startswith(("Feature:", "Rule:", "@")):
+            sections.append([line])
+            in_block = False
+        else:
+            sections[-1].append(line)
+    return sections
+
+
+def _outline(section: List[str], variants: List[str], urls: List[str], navigation: List[str]) -> List[str]:
+    """Rewrite one scenario section as a Scenario Outline over urls."""
+    header = section[0]
+    name = header.strip().split(":", 1)[1].strip()
+    output = [f"{_indent(header)}Scenario Outline: {name}"]
+    pending = list(navigation)
+    opens_url = bool(navigation)
+    has_examples = False
+    in_examples = False
+    rows = []
+
+    def flush_rows():
+        # Every URL runs every example row of the original table
+        for url in urls:
+            output.extend(f"{_indent(row)}| {url} {row.strip()}" for row in rows)
+        rows.clear()
+
+    for line in section[1:]:
+        stripped = line.strip()
+        if stripped.startswith(EXAMPLES_KEYWORDS):
+            flush_rows()
+            output.append(line)
+            in_examples = has_examples = True
+            table_header = None
+            continue
+        if in_examples:
+            if stripped.startswith("|"):
+                if table_header is None:
+                    table_header = line
+                    output.append(f"{_indent(line)}| url {stripped}")
+                else:
+                    rows.append(line)
+                continue
+            flush_rows()
+            output.append(line)
+            continue
+
+        line = _replace_url(line, variants)
+        if _is_step(line):
+            if pending:
+                output.extend(f"{_indent(line)}{step}" for step in pending)
+                pending = []
+                if line.strip().startswith("Given "):
+                    line = line.replace("Given ", "And ", 1)
+            if "<url>" in line:
+                opens_url = True
+            elif not opens_url:
+                # Make every example start on its own page
+                output.append(f"{_indent(line)}Given I open the url \"<url>\"")
+                opens_url = True
+                if line.strip().startswith("Given "):
+                    line = line.replace("Given ", "And ", 1)
+        output.append(line)
+    flush_rows()
+
+    if not has_examples:
+        # Drop trailing blank lines so the table attaches to its scenario
+        while output and not output[-1].strip():
+            output.pop()
+        output.extend(["", f"{_indent(header)}  Examples:", f"{_indent(header)}    | url |"])
+        output.extend(f"{_indent(header)}    | {url} |" for url in urls)
+        output.append("")
+    return output
@@ -2,13 +2,18 @@
 import json
 import logging
 import os
-from typing import Dict, Any, Set
+from typing import Dict, Any, Iterable, List, Optional, Set
+from urllib.parse import urlparse
 from datetime import datetime
 import asyncio
-from playwright.async_api import async_playwright
 from dotenv import load_dotenv
 import traceback
 import time
+from core.browser_pool import BrowserPool
+from core.fingerprint import page_fingerprint
+from core.frontier import CrawlFrontier
+from core.politeness import THROTTLE_STATUSES, HostPolitenessScheduler
+from core.run_ledger import STAGE_ANALYZED, STAGE_CRAWLED, STAGE_SCREENSHOT
 
 logger = logging.getLogger(__name__)
 
@@ -24,13 +29,222 @@ os.makedirs(PAGE_DATA_DIR, exist_ok=True)
 USERNAME = os.getenv("USERNAME")
 PASSWORD = os.getenv("PASSWORD")
 
+MAX_HTML_CHARS = 100000
+MAX_ELEMENTS = 200
+
+# Collects everything _extract_page_data needs in a single page.evaluate call
+# instead of one CDP round trip per field (content, title, forms, h1..h6, links).
+EXTRACT_PAGE_DATA_JS = """
+({maxHtml, maxElements}) => {
+    const text = (el) => (el.innerText || el.textContent || "").trim().replace(/\\s+/g, " ").slice(0, 200);
+    const tagPath = (el) => {
+        const parts = [];
+        for (let n = el; n && n !== document.body && parts.length < 5; n = n.parentElement) {
+            parts.unshift(n.tagName.toLowerCase());
+        }
+        return parts.join(">");
+    };
+    const describe = (el) => ({
+        id: el.id || "",
+        tag: el.tagName.toLowerCase(),
+        path: tagPath(el),
+        type: el.getAttribute("type") || "",
+        name: el.getAttribute("name") || "",
+        text: text(el) || el.getAttribute("aria-label") || el.getAttribute("placeholder") || el.value || "",
+        class: typeof el.className === "string" ? el.className : "",
+    });
+
+    const forms = Array.from(document.forms).map((f) => ({
+        id: f.id,
+        name: f.getAttribute("name") || "",
+        action: f.action,
+        method: f.method,
+        inputs: Array.from(f.querySelectorAll("input, select, textarea")).map((i) => ({
+            id: i.id || "",
+            name: i.getAttribute("name") || "",
+            type: i.getAttribute("type") || i.tagName.toLowerCase(),
+            required: i.required,
+        })),
+    }));
+
+    const headings = Array.from(document.querySelectorAll("h1, h2, h3, h4, h5, h6"))
+        .map((h) => ({level: Number(h.tagName[1]), text: (h.textContent || "").trim()}))
+        .filter((h) => h.text)
+        .sort((a, b) => a.level - b.level);
+
+    const interactive = "a[href], button, input, select, textarea, [role='button'], [role='link'], [onclick]";
+    const elements = Array.from(document.querySelectorAll(interactive))
+        .filter((el) => el.type !== "hidden")
+        .slice(0, maxElements)
+        .map(describe);
+
+    const links = Array.from(new Set(Array.from(document.querySelectorAll("a[href]"), (a) => a.href)));
+
+    return {
+        title: document.title,
+        html: document.documentElement.outerHTML.slice(0, maxHtml),
+        forms,
+        headings,
+        elements,
+        links,
+    };
+}
+"""
+
+DEFAULT_BLOCKED_RESOURCE_TYPES = ("image", "media", "font")
+
+# Screenshot capture modes: the whole scrollable page, the initial viewport
+# (above the fold), or a clip around the main content landmark
+SCREENSHOT_MODES = ("full_page", "viewport", "main")
+DEFAULT_MAIN_CONTENT_SELECTORS = ("main", "[role='main']", "#main", "#content", "article")
+
+# Returns the document-coordinate box of the first visible main content landmark
+MAIN_CONTENT_BOX_JS = """
+(selectors) => {
+    for (const selector of selectors) {
+        for (const el of document.querySelectorAll(selector)) {
+            const rect = el.getBoundingClientRect();
+            if (rect.width >= 50 && rect.height >= 50) {
+                return {
+                    x: Math.max(0, rect.left + window.scrollX),
+                    y: Math.max(0, rect.top + window.scrollY),
+                    width: rect.width,
+                    height: rect.height,
+                };
+            }
+        }
+    }
+    return null;
+}
+"""
+
+
 class PlaywrightCrawler:
-    def __init__(self, base_url: str, max_pages: int = 100):
+    def __init__(self, base_url: str, max_pages: int = 100, concurrency: int = 1,
+                 prioritize_depth: bool = False, capture_screenshots: bool = True,
+                 block_resources: bool = True,
+                 blocked_resource_types: Optional[Iterable[str]] = None,
+                 blocked_hosts: Optional[Iterable[str]] = None,
+                 crawl_wait_until: str = "domcontentloaded",
+                 screenshot_wait_until: str = "load",
+                 ledger=None, page_index=None, incremental: bool = False,
+                 screenshot_format: str = "jpeg", screenshot_quality: int = 80,
+                 persist_screenshots: bool = False, screenshot_mode: str = "full_page",
+                 main_content_selectors: Optional[Iterable[str]] = None,
+                 screenshot_max_height: int = 3000, capture_form_screenshots: bool = False,
+                 max_form_screenshots: int = 3, browser_pool: Optional[BrowserPool] = None,
+                 storage_state_path: Optional[str] = None,
+                 politeness: Optional[HostPolitenessScheduler] = None, throttle_retries: int = 2):
         self.base_url = base_url
         self.max_pages = max_pages
+        self.concurrency = max(1, concurrency)
+        self.prioritize_depth = prioritize_depth
+        self.capture_screenshots = capture_screenshots
+        # Lightweight navigation: pages crawled only for links/DOM skip heavy
+        # resources, pages that get a screenshot load fully.
+        self.block_resources = block_resources
+        self.blocked_resource_types = set(blocked_resource_types or DEFAULT_BLOCKED_RESOURCE_TYPES)
+        self.blocked_hosts = {h.strip().lower() for h in (blocked_hosts or []) if h.strip()}
+        self.crawl_wait_until = crawl_wait_until
+        self.screenshot_wait_until = screenshot_wait_until
+        # Screenshots stay in memory as encoded bytes; files are only written
+        # (in the background) when persist_screenshots is set
+        self.screenshot_format = "png" if screenshot_format.lower() == "png" else "jpeg"
+        self.screenshot_quality = screenshot_quality
+        self.persist_screenshots = persist_screenshots
+        # Smaller captures are faster to take and cost fewer image tokens;
+        # form close-ups are captured separately with locator.screenshot
+        if screenshot_mode not in SCREENSHOT_MODES:
+            logger.warning(f"Unknown screenshot mode {screenshot_mode!r}; using full_page")
+            screenshot_mode = "full_page"
+        self.screenshot_mode = screenshot_mode
+        self.main_content_selectors = list(main_content_selectors or DEFAULT_MAIN_CONTENT_SELECTORS)
+        self.screenshot_max_height = screenshot_max_height
+        self.capture_form_screenshots = capture_form_screenshots
+        self.max_form_screenshots = max_form_screenshots
+        # Optional shared BrowserPool (also used by the analyzer's screenshot
+        # fallback); contexts leased from it get the blocking route once
+        self.browser_pool = browser_pool
+        self._routed_contexts = set()
+        # Authenticated session: with USERNAME/PASSWORD set, one login is saved
+        # as storage state and reused by every context (and later runs); a
+        # shared pool brings its own storage_state_path
+        self.storage_state_path = storage_state_path
+        self._pool = None
+        self._login_lock = None
+        self._relogin = None
+        self._pending_writes = set()
+        self._light_pages = set()
+        self._on_page = None
+        # Optional RunLedger: records crawl/screenshot stages and, on resume,
+        # supplies stored page data so completed pages are not fetched again
+        self.ledger = ledger
+        self._known_pages = {}
+        # Optional PageIndex: in incremental mode pages whose structure matches
+        # the previous run are flagged "unchanged" so analysis can be skipped
+        self.page_index = page_index
+        self.incremental = incremental and page_index is not None
+        # Per-host politeness next to the frontier: the default only adds
+        # adaptive backoff, concurrency per host is capped by the workers
+        self.politeness = politeness or HostPolitenessScheduler(max_per_host=self.concurrency)
+        self.throttle_retries = max(0, throttle_retries)
         self.visited: Set[str] = set()
         self.page_data: Dict[str, Any] = {}
-        self.to_visit = [base_url]
+
+    async def _route_request(self, route):
+        """Abort blocked resources for pages navigated in lightweight mode."""
+        request = route.request
+        try:
+            light = request.frame.page in self._light_pages
+        except Exception:
+            light = False
+        if light and self._should_block(request):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    def _should_block(self, request) -> bool:
+        if request.resource_type in self.blocked_resource_types:
+            return True
+        if self.blocked_hosts:
+            host = (urlparse(request.url).hostname or "").lower()
+            return any(host == h or host.endswith("." + h) for h in self.blocked_hosts)
+        return False
+
+    async def _goto(self, page, url: str, screenshot: bool, **kwargs):
+        """
+        Navigate in full mode when a screenshot will be taken, otherwise in
+        lightweight mode with resource blocking and the crawl wait strategy.
+        """
+        if screenshot or not self.block_resources:
+            self._light_pages.discard(page)
+        else:
+            self._light_pages.add(page)
+        wait_until = self.screenshot_wait_until if screenshot else self.crawl_wait_until
+        # Navigations go through the per-host scheduler; a 429/503 backs the
+        # host off and the page is retried after the new delay
+        for attempt in range(self.throttle_retries + 1):
+            async with self.politeness.slot(url):
+                started = time.monotonic()
+                response = await page.goto(url, wait_until=wait_until, **kwargs)
+                latency = time.monotonic() - started
+            status = response.status if response is not None else None
+            retry_after = response.headers.get("retry-after") if response is not None else None
+            self.politeness.record(url, status, latency, retry_after)
+            if status not in THROTTLE_STATUSES or attempt == self.throttle_retries:
+                return response
+            logger.warning(f"{url} answered {status}; retrying ({attempt + 1}/{self.throttle_retries})")
+        return response
+
+    async def _fetch_robots(self, page, robots_url: str) -> Optional[str]:
+        """Return the text of a robots.txt, or None when the host has none."""
+        response = await page.context.request.get(robots_url, timeout=15000)
+        try:
+            if response.status != 200:
+                return None
+            return await response.text()
+        finally:
+            await response.dispose()
 
     async def _extract_links(self, page) -> Set[str]:
         links = set(await page.eval_on_selector_all(
@@ -54,42 +268,134 @@ class PlaywrightCrawler:
         return links
 
     async def _extract_page_data(self, page, url: str, screenshot: bool = True) -> Dict[str, Any]:
-        screenshot_path = os.path.join(SCREENSHOT_DIR, self._safe_filename(url) + ".png")
+        screenshot_bytes = None
+        screenshot_path = None
+        form_screenshots = []
+        form_screenshot_paths = []
         if screenshot:
-            try:
-                await page.screenshot(path=screenshot_path, full_page=True)
-                logger.info(f"Screenshot captured for {url}: {screenshot_path}")
-            except Exception as e:
-                logger.error(f"Failed to capture screenshot for {url}: {e}")
-                screenshot_path = None
-        dom = await page.content()
-        title = await page.title()
+            screenshot_bytes = await self._capture_screenshot(page, url)
+            if self.capture_form_screenshots:
+                form_screenshots = await self._capture_form_screenshots(page, url)
+            if self.persist_screenshots:
+                extension = "png" if self.screenshot_format == "png" else "jpg"
+                name = self._safe_filename(url)
+                if screenshot_bytes:
+                    screenshot_path = os.path.join(SCREENSHOT_DIR, f"{name}.{extension}")
+                    self._persist_screenshot(screenshot_path, screenshot_bytes)
+                for index, form_bytes in enumerate(form_screenshots):
+                    path = os.path.join(SCREENSHOT_DIR, f"{name}_form{index}.{extension}")
+                    self._persist_screenshot(path, form_bytes)
+                    form_screenshot_paths.append(path)
+        extracted = await page.evaluate(EXTRACT_PAGE_DATA_JS, {
+            "maxHtml": MAX_HTML_CHARS,
+            "maxElements": MAX_ELEMENTS,
+        })
+        title = extracted["title"]
         logger.info(f"Extracted title for {url}: {title}")
-        forms = await page.eval_on_selector_all(
-            "form", "forms => forms.map(f => ({id: f.id, name: f.name, action: f.action, method: f.method}))"
-        )
-        headings = []
-        for h in range(1, 7):
-            hs = await page.eval_on_selector_all(
-                f"h{h}", f"els => els.map(e => e.textContent.trim())"
-            )
-            for text in hs:
-                if text:
-                    headings.append({"level": h, "text": text})
         data = {
             "url": url,
             "title": title,
             "screenshot_path": screenshot_path,
-            "html_content": dom[:100000],
-            "forms": forms,
-            "headings": headings,
+            "form_screenshot_paths": form_screenshot_paths,
+            "html_content": extracted["html"],
+            "forms": extracted["forms"],
+            "headings": extracted["headings"],
+            "elements": extracted["elements"],
+            "links": extracted["links"],
         }
+        data["fingerprint"] = page_fingerprint(data)
         logger.info(f"Page data added for {url}")
-        page_data_path = os.path.join(PAGE_DATA_DIR, self._safe_filename(url) + ".json")
+        page_data_path = self._page_data_path(url)
         with open(page_data_path, "w", encoding="utf-8") as f:
             json.dump(data, f, indent=2)
+        if screenshot_bytes:
+            data["screenshot_bytes"] = screenshot_bytes
+        if form_screenshots:
+            data["form_screenshot_bytes"] = form_screenshots
         return data
 
+    def _image_options(self) -> Dict[str, Any]:
+        options = {"type": self.screenshot_format}
+        if self.screenshot_format == "jpeg":
+            options["quality"] = self.screenshot_quality
+        return options
+
+    async def _screenshot_clip(self, page) -> Optional[Dict[str, Any]]:
+        """Clip for the configured mode, or None for a plain full-page/viewport capture."""
+        if self.screenshot_mode != "main":
+            return None
+        box = await page.evaluate(MAIN_CONTENT_BOX_JS, self.main_content_selectors)
+        if not box:
+            return None
+        if self.screenshot_max_height:
+            box["height"] = min(box["height"], self.screenshot_max_height)
+        return box
+
+    async def _capture_screenshot(self, page, url: str) -> Optional[bytes]:
+        """Capture a screenshot in the configured mode as encoded bytes, without touching the disk."""
+        options = self._image_options()
+        mode = self.screenshot_mode
+        try:
+            clip = await self._screenshot_clip(page)
+            if clip is not None:
+                # Clip coordinates are relative to the whole page, not the viewport
+                options.update(full_page=True, clip=clip)
+            elif mode == "main":
+                # No main content landmark: fall back to the above-the-fold view
+                mode = "viewport"
+            else:
+                options["full_page"] = mode == "full_page"
+            data = await page.screenshot(**options)
+            logger.info(f"Screenshot captured for {url} ({mode}, {len(data) // 1024} KB {self.screenshot_format})")
+            return data
+        except Exception as e:
+            logger.error(f"Failed to capture screenshot for {url}: {e}")
+            return None
+
+    async def _capture_form_screenshots(self, page, url: str) -> List[bytes]:
+        """Capture up to max_form_screenshots visible forms with locator.screenshot."""
+        captures = []
+        forms = page.locator("form")
+        try:
+            count = await forms.count()
+        except Exception as e:
+            logger.error(f"Failed to locate forms for {url}: {e}")
+            return captures
+        for index in range(count):
+            if len(captures) >= self.max_form_screenshots:
+                break
+            form = forms.nth(index)
+            try:
+                if not await form.is_visible():
+                    continue
+                captures.append(await form.screenshot(timeout=5000, **self._image_options()))
+            except Exception as e:
+                logger.debug(f"Failed to capture form {index} on {url}: {e}")
+        if captures:
+            logger.info(f"Captured {len(captures)} form screenshot(s) for {url}")
+        return captures
+
+    def _persist_screenshot(self, path: str, data: bytes) -> None:
+        """Write a screenshot artifact in a background thread; crawl() waits for pending writes."""
+        def write():
+            with open(path, "wb") as f:
+                f.write(data)
+
+        task = asyncio.create_task(asyncio.to_thread(write))
+        self._pending_writes.add(task)
+        task.add_done_callback(self._pending_writes.discard)
+
+    async def _flush_screenshots(self) -> None:
+        if not self._pending_writes:
+            return
+        results = await asyncio.gather(*self._pending_writes, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Failed to save screenshot: {result}")
+
+    def _page_data_path(self, url: str) -> str:
+        return os.path.join(PAGE_DATA_DIR, self._safe_filename(url) + ".json")
+
     def _safe_filename(self, url: str) -> str:
         return url.replace("https://", "").replace("http://", "").replace("/", "_").replace("?", "_")
 
@@ -112,84 +418,323 @@ class PlaywrightCrawler:
                     await login_btn.click()
                 else:
                     await pass_input.press('Enter')
-                await page.wait_for_load_state('networkidle', timeout=5000)
-                return True
+                try:
+                    await page.wait_for_load_state('networkidle', timeout=5000)
+                except Exception:
+                    pass
+                # A login form that is still showing means the credentials were rejected
+                return not await self._shows_login_form(page)
         except Exception:
             pass
         return False
 
-    async def crawl(self, single_page_only=False, enable_tracing=False):
+    def _can_login(self) -> bool:
+        return bool(USERNAME and PASSWORD and self._pool is not None and self._pool.storage_state_path)
+
+    async def _shows_login_form(self, page) -> bool:
+        try:
+            return await page.locator('input[type="password"]').first.is_visible()
+        except Exception:
+            return False
+
+    async def _ensure_session(self, pool) -> None:
+        """
+        Log in once and save the session for every pooled context, unless a
+        saved session is still valid. Nothing happens without credentials.
+        """
+        if not self._can_login() or pool.has_session:
+            return
+        async with pool.lease() as context:
+            page = await context.new_page()
+            try:
+                await page.goto(self.base_url, wait_until=self.screenshot_wait_until, timeout=60000)
+                if not await self._shows_login_form(page):
+                    logger.info("No login form on the start page; crawling without a session")
+                    return
+                if await self._handle_login(page):
+                    await pool.save_storage_state(context)
+                else:
+                    logger.warning("Login failed; crawling without a session")
+            except Exception as e:
+                logger.warning(f"Login failed: {e}")
+            finally:
+                await page.close()
+
+    async def _recover_session(self, page) -> bool:
+        """
+        Log in again when a page shows a login form although a session was
+        saved (the session expired). This happens at most once per crawl; a
+        worker hitting the form after the re-login only picks up the new
+        session. Returns True when the page should be loaded again.
+        """
+        if not self._can_login() or not self._pool.has_session:
+            return False
+        if not await self._shows_login_form(page):
+            return False
+        async with self._login_lock:
+            if self._relogin is not None:
+                if self._relogin:
+                    await self._pool.sync_context(page.context)
+                return self._relogin
+            logger.info("Saved session appears to have expired; logging in again")
+            self._relogin = await self._handle_login(page)
+            if self._relogin:
+                await self._pool.save_storage_state(page.context)
+            else:
+                logger.warning("Re-login failed; continuing without a session")
+            return self._relogin
+
+    async def crawl(self, single_page_only=False, enable_tracing=False, on_page=None):
         """
         Crawl the website starting from base_url.
         If single_page_only is True, only visit the initial page and return its data.
+        Pages are fetched by `concurrency` workers, each driving its own page
+        in a context leased from the browser pool, over the shared to_visit
+        frontier. Without a shared browser_pool the crawler runs a private one
+        for the duration of the crawl.
+
+        If on_page is given, each new page's data is awaited through
+        `on_page(page_data)` as soon as it is extracted (a bounded queue put
+        applies back-pressure to the crawl). The returned dict then only holds
+        a small summary per page instead of the full page data.
         Returns a dict: {url: page_data}
         """
+        self._on_page = on_page
+        self._known_pages = self.ledger.completed(STAGE_CRAWLED) if self.ledger else {}
         results = {}
-        trace_path = None
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            context = await browser.new_context()
-            tracing_started = False
-            page = await context.new_page()
-            try:
-                logger.info(f"About to visit site: {self.base_url}")
-                await page.goto(self.base_url)
-                logger.info(f"Visited site: {self.base_url}")
-                page_data = await self._extract_page_data(page, self.base_url)
-                results[self.base_url] = page_data
-                if single_page_only:
-                    await browser.close()
-                    return results
-                # Otherwise, crawl all reachable pages (up to max_pages)
-                to_visit = [self.base_url]
-                visited = set()
-                while to_visit and len(results) < self.max_pages:
-                    url = to_visit.pop(0)
-                    if url in visited:
-                        logger.info(f"Skipping already visited URL: {url}")
-                        continue
-                    try:
-                        logger.info(f"About to visit page: {url} (crawled {len(results)}/{self.max_pages})")
-                        await page.goto(url, timeout=60000)
-                        logger.info(f"Visited page: {url}")
-                        page_data = await self._extract_page_data(page, url)
-                        results[url] = page_data
-                        visited.add(url)
-                        # Extract links to follow
-                        links = await page.eval_on_selector_all('a', 'elements => elements.map(e => e.href)')
-                        for link in links:
-                            if link.startswith(self.base_url) and link not in visited and link not in to_visit:
-                                to_visit.append(link)
-                    except Exception as e:
-                        logger.error(f"Error visiting {url}: {e}")
-                        # Start tracing if not already started and enabled
-                        if enable_tracing and not tracing_started:
-                            await context.tracing.start(screenshots=True, snapshots=True, sources=True)
-                            tracing_started = True
-                            logger.info("Playwright tracing started due to error.")
-                        # Save error page HTML for later analysis
-                        try:
-                            error_html = await page.content()
-                            error_file = os.path.join(PAGE_DATA_DIR, self._safe_filename(url) + "_error.html")
-                            with open(error_file, "w", encoding="utf-8") as f:
-                                f.write(error_html)
-                            logger.info(f"Saved error page HTML for {url} to {error_file}")
-                        except Exception as html_e:
-                            logger.error(f"Failed to save error HTML for {url}: {html_e}")
-                        logger.debug(traceback.format_exc())
-                        continue
-                # Stop tracing if it was started
-                if tracing_started:
-                    trace_path = f"playwright_trace_{int(time.time())}.zip"
-                    await context.tracing.stop(path=trace_path)
-                    logger.info(f"Playwright trace saved to {trace_path}")
-                await browser.close()
-            except KeyboardInterrupt:
-                logger.warning("Crawl interrupted by user. Cleaning up...")
-                if tracing_started:
-                    trace_path = f"playwright_trace_{int(time.time())}.zip"
-                    await context.tracing.stop(path=trace_path)
-                    logger.info(f"Playwright trace saved to {trace_path}")
-                await browser.close()
-                raise
+        pool = self.browser_pool or BrowserPool(
+            size=self.concurrency, headless=True, storage_state_path=self.storage_state_path
+        )
+        owns_pool = not pool.started
+        if owns_pool:
+            await pool.start()
+        self._pool = pool
+        self._login_lock = asyncio.Lock()
+        self._relogin = None
+        tracing = {"context": None}
+        try:
+            await self._ensure_session(pool)
+            async with pool.lease() as context:
+                await self._prepare_context(context)
+                page = await context.new_page()
+                try:
+                    logger.info(f"About to visit site: {self.base_url}")
+                    page_data = await self._fetch_page_data(page, self.base_url, screenshot=self.capture_screenshots)
+                    logger.info(f"Visited site: {self.base_url}")
+                    self.visited.add(self.base_url)
+                    start_links = page_data["links"]
+                    await self._record(results, self.base_url, page_data)
+                finally:
+                    self._light_pages.discard(page)
+                    await page.close()
+            if single_page_only:
+                return results
+            # Otherwise, crawl all reachable pages (up to max_pages)
+            await self._crawl_with_workers(pool, results, start_links, enable_tracing, tracing)
+        except KeyboardInterrupt:
+            logger.warning("Crawl interrupted by user. Cleaning up...")
+            raise
+        finally:
+            # Stop tracing if it was started
+            if tracing["context"] is not None:
+                trace_path = f"playwright_trace_{int(time.time())}.zip"
+                await tracing["context"].tracing.stop(path=trace_path)
+                logger.info(f"Playwright trace saved to {trace_path}")
+            await self._flush_screenshots()
+            self._pool = None
+            if owns_pool:
+                await pool.close()
         return results
+
+    async def _prepare_context(self, context):
+        """Install the resource-blocking route once per leased context."""
+        if self.block_resources and context not in self._routed_contexts:
+            await context.route("**/*", self._route_request)
+            self._routed_contexts.add(context)
+
+    async def _crawl_with_workers(self, pool, results, start_links, enable_tracing, tracing):
+        """
+        Run `concurrency` workers over one shared frontier until it is exhausted
+        or max_pages results have been collected. The frontier starts from the
+        links of the already fetched start page.
+
+        A worker only claims a URL while len(results) + in-flight pages is below
+        max_pages, so the cap holds exactly no matter how many pages are open.
+        """
+        frontier = CrawlFrontier(prioritize_depth=self.prioritize_depth)
+        frontier.mark_seen(self.base_url)
+        self._queue_links(frontier, start_links, 1)
+        in_progress = set()
+        condition = asyncio.Condition()
+
+        async def next_url():
+            async with condition:
+                while True:
+                    if len(results) >= self.max_pages:
+                        return None
+                    if frontier and len(results) + len(in_progress) < self.max_pages:
+                        url, depth = frontier.pop()
+                        in_progress.add(url)
+                        return url, depth
+                    if not frontier and not in_progress:
+                        return None
+                    await condition.wait()
+
+        async def worker(worker_id):
+            async with pool.lease() as context:
+                await self._prepare_context(context)
+                page = await context.new_page()
+                try:
+                    while True:
+                        claimed = await next_url()
+                        if claimed is None:
+                            return
+                        url, depth = claimed
+                        try:
+                            await self._visit(page, url, depth, results, frontier)
+                        except Exception as e:
+                            logger.error(f"Error visiting {url}: {e}")
+                            if self.ledger:
+                                self.ledger.mark_failed(url, STAGE_CRAWLED, e)
+                            # Start tracing if not already started and enabled
+                            if enable_tracing and tracing["context"] is None:
+                                tracing["context"] = context
+                                await context.tracing.start(screenshots=True, snapshots=True, sources=True)
+                                logger.info("Playwright tracing started due to error.")
+                            await self._save_error_page(page, url)
+                            logger.debug(traceback.format_exc())
+                        finally:
+                            async with condition:
+                                in_progress.discard(url)
+                                condition.notify_all()
+                finally:
+                    self._light_pages.discard(page)
+                    await page.close()
+
+        logger.info(f"Crawling with {self.concurrency} concurrent page(s), "
+                    f"at most {self.politeness.max_per_host} per host")
+        await asyncio.gather(*(worker(i) for i in range(self.concurrency)))
+        logger.info(f"Host politeness: {self.politeness.summary()}")
+
+    async def _visit(self, page, url, depth, results, frontier):
+        """Load a single URL, record its page data and queue its in-scope links."""
+        logger.info(f"About to visit page: {url} (crawled {len(results)}/{self.max_pages})")
+        if not await self.politeness.allowed(url, lambda robots_url: self._fetch_robots(page, robots_url)):
+            logger.info(f"Skipping {url}: disallowed by robots.txt")
+            return
+        page_data = await self._fetch_page_data(page, url, screenshot=self.capture_screenshots, timeout=60000)
+        logger.info(f"Visited page: {url}")
+        self.visited.add(url)
+        self._queue_links(frontier, page_data["links"], depth + 1)
+        await self._record(results, url, page_data)
+
+    def _queue_links(self, frontier, links, depth):
+        """Queue in-scope links to follow; the frontier drops anything already seen."""
+        for link in links:
+            if link.startswith(self.base_url):
+                frontier.add(link, depth)
+
+    async def _fetch_page_data(self, page, url: str, screenshot: bool, **goto_kwargs) -> Dict[str, Any]:
+        """
+        Return stored page data for a page completed in a resumed run or, in
+        incremental mode, one the server reports as not modified; otherwise
+        load and extract it.
+        """
+        stored = self._load_known_page(url, screenshot)
+        if stored is not None:
+            logger.info(f"Reusing page data from run ledger for {url}")
+        elif self.incremental:
+            stored = await self._load_not_modified_page(page, url, screenshot)
+        if stored is not None:
+            page_data = stored
+        else:
+            await self._pool.sync_context(page.context)
+            response = await self._goto(page, url, screenshot=screenshot, **goto_kwargs)
+            if await self._recover_session(page):
+                response = await self._goto(page, url, screenshot=screenshot, **goto_kwargs)
+            page_data = await self._extract_page_data(page, url, screenshot=screenshot)
+            if response is not None:
+                page_data["etag"] = response.headers.get("etag")
+                page_data["last_modified"] = response.headers.get("last-modified")
+        if "fingerprint" not in page_data:
+            page_data["fingerprint"] = page_fingerprint(page_data)
+        if self.incremental:
+            page_data["unchanged"] = self.page_index.is_unchanged(url, page_data["fingerprint"])
+        return page_data
+
+    async def _load_not_modified_page(self, page, url: str, screenshot: bool) -> Optional[Dict[str, Any]]:
+        """
+        Send a conditional request using the validators from the previous run
+        and reuse the stored page data when the server answers 304.
+        """
+        record = self.page_index.get(url)
+        if not record or not (record["etag"] or record["last_modified"]):
+            return None
+        headers = {}
+        if record["etag"]:
+            headers["If-None-Match"] = record["etag"]
+        if record["last_modified"]:
+            headers["If-Modified-Since"] = record["last_modified"]
+        try:
+            async with self.politeness.slot(url):
+                response = await page.context.request.get(url, headers=headers, timeout=30000)
+            status = response.status
+            await response.dispose()
+        except Exception as e:
+            logger.debug(f"Conditional request failed for {url}: {e}")
+            return None
+        if status != 304:
+            return None
+        stored = self._load_page_data_file(url, self._page_data_path(url), screenshot)
+        if stored is not None:
+            self.page_index.stats["not_modified"] += 1
+            logger.info(f"Server reports {url} not modified; reusing stored page data")
+        return stored
+
+    def _load_known_page(self, url: str, screenshot: bool) -> Optional[Dict[str, Any]]:
+        return self._load_page_data_file(url, self._known_pages.get(url), screenshot)
+
+    def _load_page_data_file(self, url: str, page_data_path: Optional[str], screenshot: bool) -> Optional[Dict[str, Any]]:
+        if not page_data_path or not os.path.exists(page_data_path):
+            return None
+        try:
+            with open(page_data_path, "r", encoding="utf-8") as f:
+                page_data = json.load(f)
+        except Exception as e:
+            logger.warning(f"Could not reload stored page data for {url}: {e}")
+            return None
+        # Screenshots are only on disk with persist_screenshots; without one the
+        # stored data is still reused and the analyzer captures the screenshot
+        # if the page gets analyzed at all (screenshot_pending)
+        has_screenshot = page_data.get("screenshot_path") and os.path.exists(page_data["screenshot_path"])
+        analyzed = self.ledger is not None and self.ledger.is_done(url, STAGE_ANALYZED)
+        if screenshot and not has_screenshot and not analyzed:
+            page_data["screenshot_pending"] = True
+        return page_data
+
+    async def _record(self, results, url, page_data):
+        """Store a crawled page, or hand it to the on_page consumer and keep a summary."""
+        if self.ledger:
+            self.ledger.mark_done(url, STAGE_CRAWLED, self._page_data_path(url))
+            if page_data.get("screenshot_path"):
+                self.ledger.mark_done(url, STAGE_SCREENSHOT, page_data["screenshot_path"])
+        if self._on_page is None:
+            results[url] = page_data
+            return
+        results[url] = {
+            "url": url,
+            "title": page_data.get("title", ""),
+            "screenshot_path": page_data.get("screenshot_path"),
+        }
+        await self._on_page(page_data)
+
+    async def _save_error_page(self, page, url):
+        """Save error page HTML for later analysis."""
+        try:
+            error_html = await page.content()
+            error_file = os.path.join(PAGE_DATA_DIR, self._safe_filename(url) + "_error.html")
+            with open(error_file, "w", encoding="utf-8") as f:
+                f.write(error_html)
+            logger.info(f"Saved error page HTML for {url} to {error_file}")
+        except Exception as html_e:
+            logger.error(f"Failed to save error HTML for {url}: {html_e}")
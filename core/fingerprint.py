@@ -0,0 +1,158 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+DIGITS = re.compile(r"\d+")
+WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize_text(text: str) -> str:
+    # Counters, dates and prices change between visits without changing the page's structure
+    return DIGITS.sub("#", WHITESPACE.sub(" ", text or "").strip().lower())
+
+
+def page_fingerprint(page_data: Dict[str, Any]) -> str:
+    """
+    Hash the structural features of a page that its smoke tests depend on.
+
+    Forms (method, action path, input names and types), heading levels and
+    text, and interactive elements (tag, type, name, control labels) are
+    normalized before hashing. Link text, element ids, raw HTML and numbers
+    are left out so volatile content does not register as a change.
+
+    Args:
+        page_data (dict): Page data extracted by the crawler
+
+    Returns:
+        str: Hex digest identifying the page structure
+    """
+    forms = [
+        {
+            "method": (form.get("method") or "get").lower(),
+            "action": urlsplit(form.get("action") or "").path,
+            "inputs": [
+                (i.get("type", ""), i.get("name", ""), bool(i.get("required")))
+                for i in form.get("inputs", [])
+            ],
+        }
+        for form in page_data.get("forms", [])
+    ]
+    headings = [
+        (h.get("level"), _normalize_text(h.get("text", "")))
+        for h in page_data.get("headings", [])
+    ]
+    elements = []
+    for el in page_data.get("elements", []):
+        tag = el.get("tag", "")
+        # Anchor text follows the content it links to; only controls keep their label
+        label = "" if tag == "a" else _normalize_text(el.get("text", ""))
+        elements.append((tag, el.get("type", ""), el.get("name", ""), label))
+
+    payload = json.dumps({"forms": forms, "headings": headings, "elements": elements},
+                         sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PageIndex:
+    """
+    Cross-run SQLite index of each URL's structural fingerprint.
+
+    Stores the fingerprint, HTTP validators (ETag / Last-Modified) and the
+    test files generated from the page, so an incremental run can tell which
+    pages changed since the last successful generation.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Open (or create) the index.
+
+        Args:
+            db_path (str): SQLite database file
+        """
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self.stats = {"unchanged": 0, "changed": 0, "new": 0, "not_modified": 0}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                test_files TEXT,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """Return the stored record for a URL, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint, etag, last_modified, test_files FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "fingerprint": row[0],
+            "etag": row[1],
+            "last_modified": row[2],
+            "test_files": json.loads(row[3]) if row[3] else [],
+        }
+
+    def is_unchanged(self, url: str, fingerprint: str) -> bool:
+        """
+        Return True if the page still has the fingerprint its existing tests
+        were generated from and those test files are still on disk.
+        """
+        record = self.get(url)
+        if record is None:
+            self.stats["new"] += 1
+            return False
+        files = record["test_files"]
+        if record["fingerprint"] != fingerprint or not files or not all(os.path.exists(f) for f in files):
+            self.stats["changed"] += 1
+            return False
+        self.stats["unchanged"] += 1
+        return True
+
+    def generated_since(self, url: str, timestamp: float) -> bool:
+        """
+        Return True if the page's tests were generated at or after timestamp
+        (e.g. a sitemap lastmod) and are still on disk.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT test_files, updated_at FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None or row[1] < timestamp:
+            return False
+        files = json.loads(row[0]) if row[0] else []
+        return bool(files) and all(os.path.exists(f) for f in files)
+
+    def record(self, url: str, fingerprint: str, test_files: List[str],
+               etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        """Store the fingerprint a page's tests were generated from."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (url, fingerprint, etag, last_modified, test_files, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (url, fingerprint, etag, last_modified, json.dumps(test_files), time.time()),
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,118 @@
+import heapq
+import itertools
+import logging
+from collections import deque
+from typing import Iterator, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Return the canonical form of a URL used for de-duplication.
+
+    URLs that differ only by fragment, trailing slash, query-parameter order,
+    host case or an explicit default port map to the same key.
+
+    Args:
+        url (str): URL to normalize
+
+    Returns:
+        str: Canonical URL
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host
+    if port and DEFAULT_PORTS.get(scheme) != port:
+        netloc = f"{host}:{port}"
+    if parts.username:
+        userinfo = parts.username + (f":{parts.password}" if parts.password else "")
+        netloc = f"{userinfo}@{netloc}"
+
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/") or "/"
+
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+class CrawlFrontier:
+    """
+    Queue of URLs still to crawl, backed by a set-based seen index.
+
+    Adding and popping are O(1) (O(log n) with depth priority). Every URL is
+    keyed by its normalized form, so a page is only ever queued once per crawl
+    no matter how many equivalent links point at it.
+    """
+
+    def __init__(self, prioritize_depth: bool = False):
+        """
+        Initialize the frontier.
+
+        Args:
+            prioritize_depth (bool): Pop shallower URLs first instead of FIFO order
+        """
+        self.prioritize_depth = prioritize_depth
+        self._queue = deque()
+        self._heap = []
+        self._counter = itertools.count()
+        self._seen = set()
+
+    def add(self, url: str, depth: int = 0) -> bool:
+        """
+        Queue a URL unless an equivalent URL has already been seen.
+
+        Returns:
+            bool: True if the URL was queued
+        """
+        key = normalize_url(url)
+        if key in self._seen:
+            return False
+        self._seen.add(key)
+        if self.prioritize_depth:
+            heapq.heappush(self._heap, (depth, next(self._counter), url))
+        else:
+            self._queue.append((url, depth))
+        return True
+
+    def pop(self) -> Optional[Tuple[str, int]]:
+        """
+        Remove and return the next (url, depth) pair, or None if empty.
+        """
+        if self.prioritize_depth:
+            if not self._heap:
+                return None
+            depth, _, url = heapq.heappop(self._heap)
+            return url, depth
+        if not self._queue:
+            return None
+        return self._queue.popleft()
+
+    def mark_seen(self, url: str) -> None:
+        """Record a URL as seen without queueing it."""
+        self._seen.add(normalize_url(url))
+
+    def seen(self, url: str) -> bool:
+        """Return True if an equivalent URL has been queued or marked seen."""
+        return normalize_url(url) in self._seen
+
+    def __len__(self) -> int:
+        return len(self._heap) if self.prioritize_depth else len(self._queue)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over queued URLs without removing them."""
+        if self.prioritize_depth:
+            return (url for _, _, url in sorted(self._heap))
+        return (url for url, _ in self._queue)
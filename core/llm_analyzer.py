@@ -6,33 +6,121 @@ import os
 import json
 import logging
 from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
 from langchain.output_parsers import StructuredOutputParser, ResponseSchema
 from config.config import Config
 import openai
 import re
-from .screenshot_utils import optimize_screenshot
+from .screenshot_utils import (optimize_screenshot, optimize_screenshot_async, page_form_screenshots,
+                               page_screenshot, screenshot_exists, screenshot_label, screenshot_phash,
+                               tile_screenshot, tile_screenshot_async)
+from .batch_jobs import BatchDeferred
+from .browser_pool import load_storage_state
+from .visual_index import VisualAnalysisIndex
+from .llm_cache import LLMResponseCache
+from .llm_scheduler import LLMScheduler, estimate_tokens
+from .prompt_builder import PromptBuilder, compact_items, compact_lines, count_tokens
+from .structured_generation import locator_map, parse_test_script, test_script_response_format, validate_test_script
 from dotenv import load_dotenv
 import base64
+import asyncio
 
 logger = logging.getLogger(__name__)
 
+ANALYSIS_ITEMS = """1. KEY ELEMENTS: the most important elements that should be tested.
+2. UNIQUE IDENTIFIERS: unique ways to identify this page in tests (title, URL patterns, unique elements).
+3. RECOMMENDED SMOKE TEST STEPS: 5-10 concise steps for smoke testing this page.
+4. SUGGESTED LOCATOR STRATEGIES: element: locator pairs for important elements (use best practice selectors)."""
+# Prompts are sent as a static system message (instructions, examples) followed by
+# the page payload, so every call of a stage shares a byte-identical prefix that
+# the provider's prompt cache can serve
+ANALYSIS_SYSTEM_PROMPT = (
+    "I'm an expert web tester analyzing a webpage to generate smoke test information.\n"
+    "For the page described in the next message, I need to provide:\n" + ANALYSIS_ITEMS
+)
+
+SINGLE_PASS_INSTRUCTIONS = """You are an expert test automation engineer. From the web page in the next message, produce its smoke test in one step:
+- key_elements, unique_identifiers, smoke_test_steps (5-10 concise steps) and locator_strategies (best practice selectors) for the page;
+- feature_file: a Gherkin feature file with a smoke test scenario for the page;
+- step_definitions: {language} step definitions for Selenium with Cucumber annotations, implementing every step of the feature file;
+- page_object: a {language} Page Object class for the page, used by the step definitions.
+Answer with the JSON object only; put each file's complete source in its string field."""
+
+# Examples of well-formed feature files and step definitions for the Cucumber generation prompt
+EXAMPLE_FEATURES = """
+        Feature: Smoke-QA
+
+            Scenario: verify home page
+                Given user launches browser in "Edge"
+                And user opens URL "QA_URL"
+                And user verifies "My Tasks" is "present" on screen
+                And user verifies "My Products" is "present" on screen
+
+            Scenario: verify new product page
+                Given user launches browser in "Edge"
+                And user opens URL "QA_URL"
+                When user mouse hover the link "Products"
+                And user click on the link "New Product"
+                And user verifies "New Product Steps" is "present" on screen
+
+            Background: User Logged in
+                Given I open the url "SOMEURL"
+                When I add "UserName" to the inputfield "UserName"
+                When I add "pwd" to the inputfield "word"
+                And I click on the Login element "Login"
+                And I pause for 2000 ms
+                Then I expect that the url is "SOMEURL"
+        """
+
+EXAMPLE_STEPS = """
+            @Given("I am on the login page")
+            public void iAmOnTheLoginPage() {
+                loginPage.navigateTo();
+                Assert.assertTrue(loginPage.isPageLoaded());
+            }
+
+            @When("I enter {string} into the username field")
+            public void iEnterIntoTheUsernameField(String username) {
+                loginPage.enterUsername(username);
+            }
+        """
+
+# Batched analysis: several small pages per request, answers delimited by page markers
+BATCH_MARKER = "=== PAGE {number} ==="
+BATCH_SYSTEM_PROMPT = (
+    "I'm an expert web tester analyzing several webpages to generate smoke test information for each.\n"
+    "The next message describes the pages, each after a marker line such as \"=== PAGE 1 ===\".\n"
+    "Answer for each page separately. Start each answer with the page's marker line exactly as given "
+    "and provide, for that page only:\n" + ANALYSIS_ITEMS
+)
+BATCH_MARKER_PATTERN = re.compile(r"^[\s#*>]*=+\s*PAGE\s+(\d+)\s*=+[\s*]*$", re.MULTILINE | re.IGNORECASE)
+BATCH_ANSWER_PATTERN = re.compile(r"key elements|smoke test steps|locator strateg", re.IGNORECASE)
+
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
+
+def _holds_bytes(value):
+    """True for bytes values and lists of them (in-memory screenshot captures)."""
+    if isinstance(value, (list, tuple)):
+        return any(isinstance(item, (bytes, bytearray)) for item in value)
+    return isinstance(value, (bytes, bytearray))
+
+
 class LLMAnalyzer:
     """
     LLM-based analyzer that processes page data and generates test information.
     """
 
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, browser_pool=None):
         """
         Initialize the LLM analyzer.
 
         Args:
             config (Config): Configuration object
+            browser_pool (BrowserPool): Optional shared browser used to capture missing screenshots
         """
         self.config = config
+        self.browser_pool = browser_pool
         self.config.validate()  # Ensure required settings are present
 
         # Initialize OpenAI client
@@ -46,178 +134,520 @@ class LLMAnalyzer:
         # Direct OpenAI client for vision capabilities
         self.openai_client = openai.OpenAI(api_key=self.config.OPENAI_API_KEY)
 
+        # Async client and shared scheduler for the *_async analysis path
+        self.async_openai_client = openai.AsyncOpenAI(api_key=self.config.OPENAI_API_KEY)
+        self.scheduler = LLMScheduler(
+            max_concurrency=self.config.LLM_MAX_CONCURRENCY,
+            requests_per_minute=self.config.LLM_REQUESTS_PER_MINUTE,
+            tokens_per_minute=self.config.LLM_TOKENS_PER_MINUTE,
+            max_retries=self.config.LLM_MAX_RETRIES,
+        )
+
+        # Persistent response cache shared by all LLM calls
+        self.cache = LLMResponseCache(
+            self.config.LLM_CACHE_PATH,
+            ttl_seconds=self.config.LLM_CACHE_TTL_SECONDS,
+            max_bytes=self.config.LLM_CACHE_MAX_MB * 1024 * 1024,
+            enabled=self.config.LLM_CACHE_ENABLED,
+            refresh=self.config.LLM_CACHE_REFRESH,
+        )
+
+        # Reuses vision analyses across visually identical screenshots
+        self.visual_index = None
+        if self.config.VISUAL_DEDUP_ENABLED:
+            self.visual_index = VisualAnalysisIndex(max_distance=self.config.VISUAL_DEDUP_MAX_DISTANCE)
+
+        # Batched text analysis (analyze_pages): requests sent, pages answered, pages re-sent alone
+        self.batch_stats = {"requests": 0, "pages": 0, "fallbacks": 0}
+
+        # Token usage reported by the API; cached_tokens are prompt tokens served
+        # from the provider's prompt cache (the shared static prefixes)
+        self.usage_stats = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
+        # Set by batch_jobs.run_batch_generation: cache misses of the synchronous
+        # request methods are written here and raise BatchDeferred
+        self.batch_requests = None
+
+    def _record_usage(self, usage):
+        """Add the token usage of an API response (OpenAI usage object or LangChain token_usage dict)."""
+        if not usage:
+            return
+        if not isinstance(usage, dict):
+            usage = usage.model_dump() if hasattr(usage, "model_dump") else vars(usage)
+        details = usage.get("prompt_tokens_details") or {}
+        self.usage_stats["requests"] += 1
+        self.usage_stats["prompt_tokens"] += usage.get("prompt_tokens") or 0
+        self.usage_stats["completion_tokens"] += usage.get("completion_tokens") or 0
+        self.usage_stats["cached_tokens"] += details.get("cached_tokens") or 0
+
+    def usage_summary(self):
+        """Token usage counters plus the share of prompt tokens served from the provider's prompt cache."""
+        prompt_tokens = self.usage_stats["prompt_tokens"]
+        cached_share = self.usage_stats["cached_tokens"] / prompt_tokens if prompt_tokens else 0.0
+        return dict(self.usage_stats, cached_share=round(cached_share, 3))
+
+    @staticmethod
+    def _message_parts(message):
+        """(type, content) of a LangChain message or a ("system" | "human", text) tuple."""
+        if isinstance(message, tuple):
+            return message
+        return getattr(message, "type", ""), getattr(message, "content", message)
+
+    @classmethod
+    def _prompt_cache_repr(cls, prompt):
+        """Return a JSON-serializable form of a string or chat-message prompt."""
+        if isinstance(prompt, str):
+            return prompt
+        return [dict(zip(("role", "content"), cls._message_parts(m))) for m in prompt]
+
+    @classmethod
+    def _prompt_messages(cls, prompt):
+        """Chat completion messages for a string or chat-message prompt."""
+        if isinstance(prompt, str):
+            return [{"role": "user", "content": prompt}]
+        roles = {"human": "user", "ai": "assistant", "system": "system"}
+        messages = []
+        for message in prompt:
+            kind, content = cls._message_parts(message)
+            messages.append({"role": roles.get(kind, "user"), "content": content})
+        return messages
+
+    def _defer(self, key, body):
+        """Write a cache miss to the batch job's request file instead of calling the API."""
+        self.batch_requests.add(key, body)
+        raise BatchDeferred(key)
+
+    def _chat_model(self, max_tokens=None):
+        """The chat model, bound to a different completion limit when max_tokens is given."""
+        if max_tokens is None or max_tokens == self.config.LLM_MAX_TOKENS:
+            return self.llm
+        return self.llm.bind(max_tokens=max_tokens)
+
+    def _invoke_llm(self, prompt, max_tokens=None):
+        """
+        Invoke the chat model through the response cache.
+
+        Args:
+            prompt (str or list): Prompt text or formatted chat messages
+            max_tokens (int): Completion limit for this call (default LLM_MAX_TOKENS)
+
+        Returns:
+            str: Response content
+        """
+        key = self.cache.make_key(
+            model=self.config.LLM_MODEL,
+            temperature=self.config.LLM_TEMPERATURE,
+            max_tokens=max_tokens or self.config.LLM_MAX_TOKENS,
+            prompt=self._prompt_cache_repr(prompt),
+        )
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.info("LLM cache hit")
+            return cached
+        if self.batch_requests is not None:
+            self._defer(key, {
+                "model": self.config.LLM_MODEL,
+                "messages": self._prompt_messages(prompt),
+                "max_tokens": max_tokens or self.config.LLM_MAX_TOKENS,
+                "temperature": self.config.LLM_TEMPERATURE,
+            })
+
+        response = self._chat_model(max_tokens).invoke(prompt)
+        self._record_usage(response.response_metadata.get("token_usage"))
+        self.cache.set(key, response.content)
+        return response.content
+
+    @staticmethod
+    def _completion_options(response_format=None):
+        """Optional chat completion arguments; also part of the cache key when set."""
+        return {"response_format": response_format} if response_format else {}
+
+    def _create_chat_completion(self, model, messages, max_tokens, response_format=None):
+        """
+        Call the OpenAI chat completions API through the response cache.
+
+        The messages (including any base64 image data) are part of the cache key.
+
+        Args:
+            response_format (dict): Optional structured-output format (JSON schema)
+
+        Returns:
+            str: Response content
+        """
+        options = self._completion_options(response_format)
+        key = self.cache.make_key(model=model, temperature=None, max_tokens=max_tokens, prompt=messages, **options)
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.info("LLM cache hit (chat completion)")
+            return cached
+        if self.batch_requests is not None:
+            self._defer(key, {"model": model, "messages": messages, "max_tokens": max_tokens, **options})
+
+        response = self.openai_client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            **options,
+        )
+        self._record_usage(response.usage)
+        content = response.choices[0].message.content
+        self.cache.set(key, content)
+        return content
+
+    async def _ainvoke_llm(self, prompt, max_tokens=None):
+        """Async variant of _invoke_llm, admitted by the shared scheduler."""
+        prompt_repr = self._prompt_cache_repr(prompt)
+        max_tokens = max_tokens or self.config.LLM_MAX_TOKENS
+        key = self.cache.make_key(
+            model=self.config.LLM_MODEL,
+            temperature=self.config.LLM_TEMPERATURE,
+            max_tokens=max_tokens,
+            prompt=prompt_repr,
+        )
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.info("LLM cache hit")
+            return cached
+
+        estimated = estimate_tokens(json.dumps(prompt_repr)) + max_tokens
+        llm = self._chat_model(max_tokens)
+        response = await self.scheduler.run(lambda: llm.ainvoke(prompt), estimated)
+        self._record_usage(response.response_metadata.get("token_usage"))
+        self.cache.set(key, response.content)
+        return response.content
+
+    async def _acreate_chat_completion(self, model, messages, max_tokens, response_format=None):
+        """Async variant of _create_chat_completion, admitted by the shared scheduler."""
+        options = self._completion_options(response_format)
+        key = self.cache.make_key(model=model, temperature=None, max_tokens=max_tokens, prompt=messages, **options)
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.info("LLM cache hit (chat completion)")
+            return cached
+
+        # Image parts are budgeted by their text only; vision requests are small in count
+        text = " ".join(
+            part.get("text", "") if isinstance(part, dict) else str(part)
+            for message in messages
+            for part in (message["content"] if isinstance(message["content"], list) else [message["content"]])
+        )
+        response = await self.scheduler.run(
+            lambda: self.async_openai_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                **options,
+            ),
+            estimate_tokens(text) + max_tokens,
+        )
+        self._record_usage(response.usage)
+        content = response.choices[0].message.content
+        self.cache.set(key, content)
+        return content
+
     def analyze_page(self, page_data):
         """Analyze page data to identify key elements for testing."""
         try:
-            # More aggressive data simplification
-            def truncate_text(text, max_length=500):
-                return text[:max_length] if isinstance(text, str) and len(text) > max_length else text
-
-            # Create a simplified version of the page data to stay within token limits
-            simplified_data = {
-                "url": page_data.get("url", ""),
-                "title": page_data.get("title", ""),
-            }
-
-            # Process elements - only keep key interactive elements
-            if "elements" in page_data:
-                # Sort elements by importance (prefer elements with IDs, then with text content)
-                def element_importance(elem):
-                    has_id = elem.get('id', '') != ''
-                    has_text = elem.get('text', '') != ''
-                    has_name = elem.get('name', '') != ''
-                    interactive = elem.get('tag', '') in ['button', 'a', 'input', 'select']
-                    return (interactive, has_id, has_text, has_name)
-
-                elements = page_data.get("elements", [])
-                sorted_elements = sorted(elements, key=element_importance, reverse=True)
-
-                # Take the top N elements and simplify them
-                simplified_elements = []
-                for elem in sorted_elements[:20]:  # Increased from 10 to 20 elements
-                    simple_elem = {}
-                    # Only keep the most important attributes
-                    for key in ['id', 'tag', 'type', 'name', 'text', 'class']:
-                        if key in elem and elem[key]:
-                            # Truncate text values to reduce token count
-                            if isinstance(elem[key], str) and len(elem[key]) > 100:
-                                simple_elem[key] = elem[key][:100] + "..."
-                            else:
-                                simple_elem[key] = elem[key]
-                    simplified_elements.append(simple_elem)
-
-                simplified_data["elements"] = simplified_elements
-
-            # Process forms - very important for testing
-            if "forms" in page_data:
-                forms = page_data.get("forms", [])
-                simplified_forms = []
-                for form in forms[:3]:  # Limit to top 3 forms
-                    simple_form = {
-                        "id": form.get("id", ""),
-                        "action": form.get("action", ""),
-                        "method": form.get("method", ""),
-                        "inputs": []
-                    }
-                    # Process form inputs
-                    for input_field in form.get("inputs", [])[:5]:  # Limit to top 5 inputs per form
-                        simple_input = {}
-                        for key in ['id', 'name', 'type', 'required']:
-                            if key in input_field and input_field[key]:
-                                simple_input[key] = input_field[key]
-                        simple_form["inputs"].append(simple_input)
-                    simplified_forms.append(simple_form)
-
-                simplified_data["forms"] = simplified_forms
-
-            # Process headings - helpful for understanding page structure
-            if "headings" in page_data:
-                headings = page_data.get("headings", [])
-                simplified_headings = []
-                for heading in headings[:5]:  # Limit to top 5 headings
-                    simplified_headings.append({
-                        "level": heading.get("level", ""),
-                        "text": truncate_text(heading.get("text", ""), 100)
-                    })
-                simplified_data["headings"] = simplified_headings
-
-            # Make the prompt clearer and more structured
-            prompt_template = """
-            I'm an expert web tester analyzing a webpage to generate smoke test information.
-
-            PAGE URL: {url}
-            PAGE TITLE: {title}
-
-            ELEMENTS:
-            {elements_info}
-
-            FORMS:
-            {forms_info}
-
-            HEADINGS:
-            {headings_info}
-
-            Based on this data, I need to provide:
-
-            1. KEY ELEMENTS:
-            List the most important elements that should be tested.
-
-            2. UNIQUE IDENTIFIERS:
-            List unique ways to identify this page in tests (title, URL patterns, unique elements).
-
-            3. RECOMMENDED SMOKE TEST STEPS:
-            List 5-10 concise steps for smoke testing this page.
-
-            4. SUGGESTED LOCATOR STRATEGIES:
-            List element: locator pairs for important elements (use best practice selectors).
-            """
-
-            # Format element info
-            elements_info = "ELEMENTS:\n"
-            for elem in simplified_data.get("elements", []):
-                elements_info += f"- {elem.get('tag', '')}"
-                if elem.get('id'):
-                    elements_info += f" id='{elem.get('id')}'"
-                if elem.get('type'):
-                    elements_info += f" type='{elem.get('type')}'"
-                if elem.get('text'):
-                    elements_info += f" text='{elem.get('text')}'"
-                elements_info += "\n"
-
-            # Format form info
-            forms_info = "FORMS:\n"
-            for form in simplified_data.get("forms", []):
-                forms_info += f"- Form"
-                if form.get('id'):
-                    forms_info += f" id='{form.get('id')}'"
-                forms_info += f" method='{form.get('method', '')}'\n"
-                for input_field in form.get("inputs", []):
-                    forms_info += f"  - Input"
-                    if input_field.get('id'):
-                        forms_info += f" id='{input_field.get('id')}'"
-                    if input_field.get('type'):
-                        forms_info += f" type='{input_field.get('type')}'"
-                    if input_field.get('name'):
-                        forms_info += f" name='{input_field.get('name')}'"
-                    forms_info += "\n"
-
-            # Format headings info
-            headings_info = "HEADINGS:\n"
-            for heading in simplified_data.get("headings", []):
-                headings_info += f"- H{heading.get('level', '')}: {heading.get('text', '')}\n"
-
-            # Format the prompt
-            formatted_prompt = prompt_template.format(
-                url=simplified_data.get("url", ""),
-                title=simplified_data.get("title", ""),
-                elements_info=elements_info,
-                forms_info=forms_info,
-                headings_info=headings_info
-            )
+            formatted_prompt, simplified_data = self._build_analysis_prompt(page_data)
 
             # Get LLM response
             logger.info(f"Sending analysis request to LLM for {simplified_data.get('url', '')}")
-            response = self.llm.invoke(formatted_prompt)
+            response_content = self._invoke_llm(formatted_prompt)
 
             # Log response for debugging
-            logger.info(f"Raw LLM output:\n{response.content}")
+            logger.info(f"Raw LLM output:\n{response_content}")
 
             # Process the response
-            return self._process_analysis_response(response.content, simplified_data)
+            return self._process_analysis_response(response_content, simplified_data)
 
+        except BatchDeferred:
+            raise
         except Exception as e:
             logger.error(f"Error analyzing page with LLM: {str(e)}")
-            return {
-                "url": page_data.get("url", ""),
-                "title": page_data.get("title", ""),
-                "error": str(e),
-                "page_title_validation": page_data.get("title", ""),
-                "unique_identifiers": ["URL: " + page_data.get("url", "")],
-                "key_elements": [],
-                "smoke_test_steps": ["Visit the page and verify it loads",
-                                   f"Check page title is '{page_data.get('title', '')}'"],
-                "locator_strategies": {},
-            }
+            return self._analysis_fallback(page_data, e)
+
+    async def analyze_page_async(self, page_data):
+        """Async variant of analyze_page, scheduled through the shared LLM scheduler."""
+        try:
+            formatted_prompt, simplified_data = self._build_analysis_prompt(page_data)
+
+            logger.info(f"Sending analysis request to LLM for {simplified_data.get('url', '')}")
+            response_content = await self._ainvoke_llm(formatted_prompt)
+            logger.info(f"Raw LLM output:\n{response_content}")
+
+            return self._process_analysis_response(response_content, simplified_data)
+
+        except Exception as e:
+            logger.error(f"Error analyzing page with LLM: {str(e)}")
+            return self._analysis_fallback(page_data, e)
+
+    @staticmethod
+    def _analysis_fallback(page_data, error):
+        """Minimal analysis used when the LLM request fails."""
+        return {
+            "url": page_data.get("url", ""),
+            "title": page_data.get("title", ""),
+            "error": str(error),
+            "page_title_validation": page_data.get("title", ""),
+            "unique_identifiers": ["URL: " + page_data.get("url", "")],
+            "key_elements": [],
+            "smoke_test_steps": ["Visit the page and verify it loads",
+                               f"Check page title is '{page_data.get('title', '')}'"],
+            "locator_strategies": {},
+        }
+
+    def _prompt_budget(self) -> int:
+        """
+        Prompt tokens per call: PROMPT_TOKEN_BUDGET within the context left
+        after the completion, or all of that context when the budget is 0.
+        """
+        budget = max(1, self.config.LLM_MAX_CONTEXT - self.config.LLM_MAX_TOKENS)
+        if self.config.PROMPT_TOKEN_BUDGET:
+            budget = min(budget, self.config.PROMPT_TOKEN_BUDGET)
+        return budget
+
+    @staticmethod
+    def _describe_element(elem):
+        """One prompt line for an interactive element."""
+        line = f"- {elem.get('tag', '')}"
+        for key in ("id", "type", "name", "text"):
+            value = elem.get(key)
+            if value:
+                value = value[:100] + "..." if isinstance(value, str) and len(value) > 100 else value
+                line += f" {key}='{value}'"
+        return line
+
+    @staticmethod
+    def _describe_form(form):
+        """Prompt lines for a form and its inputs."""
+        line = "- Form"
+        if form.get("id"):
+            line += f" id='{form.get('id')}'"
+        line += f" method='{form.get('method', '')}'"
+        if form.get("action"):
+            line += f" action='{form.get('action')}'"
+        lines = [line]
+        for input_field in form.get("inputs", []):
+            field = "  - Input"
+            for key in ("id", "type", "name"):
+                if input_field.get(key):
+                    field += f" {key}='{input_field.get(key)}'"
+            if input_field.get("required"):
+                field += " required"
+            lines.append(field)
+        return "\n".join(lines)
+
+    def _add_page_sections(self, builder, page_data):
+        """
+        Add a page's URL, title, forms, elements and headings to a PromptBuilder.
+
+        Forms fill first, then elements (most testable first), then headings;
+        whatever does not fit the builder's budget is left out.
+
+        Returns:
+            dict: The items offered per section, for _simplified_page
+        """
+        # Sort elements by importance (interactive, then with IDs, text, names)
+        def element_importance(elem):
+            has_id = elem.get('id', '') != ''
+            has_text = elem.get('text', '') != ''
+            has_name = elem.get('name', '') != ''
+            interactive = elem.get('tag', '') in ['button', 'a', 'input', 'select']
+            return (interactive, has_id, has_text, has_name)
+
+        elements = sorted(page_data.get("elements", []) or [], key=element_importance, reverse=True)
+        forms = page_data.get("forms", []) or []
+        headings = [h for h in page_data.get("headings", []) or [] if h.get("text")]
+
+        builder.add_text("page", f"PAGE URL: {page_data.get('url', '')}\nPAGE TITLE: {page_data.get('title', '')}")
+        builder.add_items("elements", [self._describe_element(e) for e in elements], priority=1, header="ELEMENTS:")
+        builder.add_items("forms", [self._describe_form(f) for f in forms], priority=0, header="FORMS:")
+        builder.add_items("headings", [f"- H{h.get('level', '')}: {h['text'][:100]}" for h in headings],
+                          priority=2, header="HEADINGS:")
+        return {"elements": elements, "forms": forms, "headings": headings}
+
+    @staticmethod
+    def _simplified_page(page_data, offered, result):
+        """The page data that made it into a prompt; _process_analysis_response falls back on it."""
+        simplified_data = {"url": page_data.get("url", ""), "title": page_data.get("title", "")}
+        for name, items in offered.items():
+            simplified_data[name] = items[:result["sections"][name]["kept"]]
+        return simplified_data
+
+    def _build_analysis_prompt(self, page_data):
+        """
+        Build the page analysis prompt within the prompt token budget.
+
+        Returns:
+            tuple: (messages, simplified_data) where simplified_data holds the
+            elements, forms and headings that made it into the prompt
+        """
+        budget = self._prompt_budget() - count_tokens(ANALYSIS_SYSTEM_PROMPT, self.config.LLM_MODEL)
+        builder = PromptBuilder(budget, model=self.config.LLM_MODEL)
+        offered = self._add_page_sections(builder, page_data)
+        result = builder.build()
+        PromptBuilder.log_breakdown(page_data.get("url", ""), result)
+        messages = [("system", ANALYSIS_SYSTEM_PROMPT), ("human", result["prompt"])]
+        return messages, self._simplified_page(page_data, offered, result)
+
+    def _batch_prompt_budget(self, pages: int) -> int:
+        """
+        Prompt tokens left for a batch of pages, each of which needs its own
+        completion room; a batch spends no more than PROMPT_TOKEN_BUDGET per page.
+        """
+        budget = self.config.LLM_MAX_CONTEXT - pages * self.config.LLM_MAX_TOKENS
+        if self.config.PROMPT_TOKEN_BUDGET:
+            budget = min(budget, pages * self.config.PROMPT_TOKEN_BUDGET)
+        return budget
+
+    def _page_block(self, page_data):
+        """
+        Prompt block of a page small enough to be batched.
+
+        Returns:
+            tuple: (block, tokens, simplified_data), or None if the page does
+            not fit ANALYSIS_BATCH_PAGE_TOKENS without dropping items
+        """
+        builder = PromptBuilder(self.config.ANALYSIS_BATCH_PAGE_TOKENS, model=self.config.LLM_MODEL)
+        offered = self._add_page_sections(builder, page_data)
+        result = builder.build()
+        sections = result["sections"]
+        if any(sections[name]["kept"] < sections[name]["total"] for name in offered):
+            return None
+        return result["prompt"], result["tokens"], self._simplified_page(page_data, offered, result)
+
+    def _plan_analysis_batches(self, pages):
+        """
+        Pack small pages into batches of at most ANALYSIS_BATCH_SIZE pages
+        whose prompt fits the context left after every page's completion.
+
+        Returns:
+            list: Batches of (index, block, simplified_data); pages in no
+            batch are analyzed on their own
+        """
+        fixed = count_tokens(BATCH_SYSTEM_PROMPT, self.config.LLM_MODEL)
+        marker = count_tokens(BATCH_MARKER.format(number=0) + "\n", self.config.LLM_MODEL)
+        batches = []
+        current = []
+        used = fixed
+        for index, page_data in enumerate(pages):
+            block = self._page_block(page_data)
+            if block is None:
+                continue
+            text, tokens, simplified_data = block
+            tokens += marker
+            if current and (len(current) >= self.config.ANALYSIS_BATCH_SIZE
+                            or used + tokens > self._batch_prompt_budget(len(current) + 1)):
+                batches.append(current)
+                current = []
+                used = fixed
+            current.append((index, text, simplified_data))
+            used += tokens
+        if current:
+            batches.append(current)
+        # A batch of one saves nothing over a plain analyze_page call
+        return [batch for batch in batches if len(batch) > 1]
+
+    @staticmethod
+    def _build_batch_prompt(batch):
+        parts = []
+        for number, (_, block, _) in enumerate(batch, 1):
+            parts.append(BATCH_MARKER.format(number=number))
+            parts.append(block)
+        return [("system", BATCH_SYSTEM_PROMPT), ("human", "\n".join(parts))]
+
+    def _split_batch_response(self, response_content, batch):
+        """
+        Split a batched response at its page markers and process each
+        page's part with _process_analysis_response.
+
+        Returns:
+            dict: page index -> analysis result, for the pages answered
+        """
+        markers = list(BATCH_MARKER_PATTERN.finditer(response_content))
+        parts = {}
+        for marker, following in zip(markers, markers[1:] + [None]):
+            end = following.start() if following else len(response_content)
+            parts.setdefault(int(marker.group(1)), response_content[marker.end():end])
+
+        results = {}
+        for number, (index, _, simplified_data) in enumerate(batch, 1):
+            part = parts.get(number, "")
+            if not BATCH_ANSWER_PATTERN.search(part):
+                logger.warning(f"Batched analysis has no answer for {simplified_data.get('url', '')}; analyzing it alone")
+                continue
+            results[index] = self._process_analysis_response(part, simplified_data)
+        return results
+
+    def _analyze_batch(self, batch):
+        prompt = self._build_batch_prompt(batch)
+        logger.info(f"Sending batched analysis request to LLM for {len(batch)} pages")
+        try:
+            response_content = self._invoke_llm(prompt, max_tokens=self.config.LLM_MAX_TOKENS * len(batch))
+        except BatchDeferred:
+            raise
+        except Exception as e:
+            logger.error(f"Batched analysis request failed: {str(e)}")
+            return {}
+        logger.info(f"Raw LLM output:\n{response_content}")
+        return self._split_batch_response(response_content, batch)
+
+    async def _analyze_batch_async(self, batch):
+        prompt = self._build_batch_prompt(batch)
+        logger.info(f"Sending batched analysis request to LLM for {len(batch)} pages")
+        try:
+            response_content = await self._ainvoke_llm(prompt, max_tokens=self.config.LLM_MAX_TOKENS * len(batch))
+        except Exception as e:
+            logger.error(f"Batched analysis request failed: {str(e)}")
+            return {}
+        logger.info(f"Raw LLM output:\n{response_content}")
+        return self._split_batch_response(response_content, batch)
+
+    def _record_batches(self, batches, answered):
+        self.batch_stats["requests"] += len(batches)
+        self.batch_stats["pages"] += answered
+        self.batch_stats["fallbacks"] += sum(len(batch) for batch in batches) - answered
+
+    def analyze_pages(self, pages):
+        """
+        Analyze several pages, packing small ones into shared requests.
+
+        With ANALYSIS_BATCH_SIZE above 1, pages whose data fits
+        ANALYSIS_BATCH_PAGE_TOKENS are sent together, so the fixed
+        instructions are paid once per batch rather than once per page.
+        Large pages, and pages a batched response does not answer, get a
+        regular analyze_page call.
+
+        Args:
+            pages (list): Page data dicts
+
+        Returns:
+            list: Analysis results in the order of pages
+        """
+        results = [None] * len(pages)
+        if self.config.ANALYSIS_BATCH_SIZE > 1 and len(pages) > 1:
+            batches = self._plan_analysis_batches(pages)
+            for batch in batches:
+                for index, analysis in self._analyze_batch(batch).items():
+                    results[index] = analysis
+            self._record_batches(batches, sum(r is not None for r in results))
+        return [result if result is not None else self.analyze_page(page_data)
+                for result, page_data in zip(results, pages)]
+
+    async def analyze_pages_async(self, pages):
+        """Async variant of analyze_pages; batches and single pages run concurrently."""
+        results = [None] * len(pages)
+        if self.config.ANALYSIS_BATCH_SIZE > 1 and len(pages) > 1:
+            batches = self._plan_analysis_batches(pages)
+            for answered in await asyncio.gather(*(self._analyze_batch_async(batch) for batch in batches)):
+                for index, analysis in answered.items():
+                    results[index] = analysis
+            self._record_batches(batches, sum(r is not None for r in results))
+        missing = [index for index, result in enumerate(results) if result is None]
+        for index, analysis in zip(missing, await asyncio.gather(
+                *(self.analyze_page_async(pages[index]) for index in missing))):
+            results[index] = analysis
+        return results
 
     def _process_analysis_response(self, response_content, page_data):
         """Process the LLM response to extract structured information."""
@@ -391,19 +821,20 @@ class LLMAnalyzer:
         4. Combine visual and DOM insights
         """
         try:
-            # Step 1: Ensure we have a screenshot
-            if "screenshot_path" not in page_data or not os.path.exists(page_data["screenshot_path"]):
+            # Step 1: Ensure we have a screenshot (in-memory capture or file)
+            screenshot = page_screenshot(page_data)
+            if screenshot is None:
                 logger.info("Screenshot not found in page data. Capturing screenshot.")
-                screenshot_path = self._capture_screenshot(page_data)
-                if screenshot_path:
-                    page_data["screenshot_path"] = screenshot_path
+                screenshot = self._capture_screenshot(page_data)
+                if screenshot:
+                    page_data["screenshot_bytes"] = screenshot
                 else:
                     logger.warning("Failed to capture screenshot. Proceeding with DOM-only analysis.")
                     return self.analyze_page(page_data)
 
             # Step 2: Analyze screenshot with vision capabilities
-            logger.info(f"Starting vision analysis of screenshot: {page_data['screenshot_path']}")
-            visual_analysis = self._analyze_screenshot(page_data["screenshot_path"])
+            logger.info(f"Starting vision analysis of screenshot: {screenshot_label(screenshot)}")
+            visual_analysis = self._analyze_screenshot(screenshot, page_form_screenshots(page_data))
 
             if not visual_analysis:
                 logger.warning("Vision analysis failed or returned empty results. Proceeding with DOM-only analysis.")
@@ -419,137 +850,335 @@ class LLMAnalyzer:
 
             return combined_analysis
 
+        except BatchDeferred:
+            raise
         except Exception as e:
             logger.error(f"Error in vision-enhanced analysis: {str(e)}", exc_info=True)
             logger.info("Falling back to standard DOM analysis")
             return self.analyze_page(page_data)
 
-    def _capture_screenshot(self, page_data):
-        """
-        Capture a screenshot if driver is available, otherwise return None.
-        """
+    async def analyze_page_with_vision_async(self, page_data):
+        """Async variant of analyze_page_with_vision."""
         try:
-            # Check if we have access to a WebDriver instance
-            from selenium import webdriver
-            from selenium.webdriver.chrome.options import Options
-            from selenium.webdriver.chrome.service import Service
+            screenshot = page_screenshot(page_data)
+            if screenshot is None:
+                logger.info("Screenshot not found in page data. Capturing screenshot.")
+                screenshot = await self._capture_screenshot_async(page_data)
+                if screenshot:
+                    page_data["screenshot_bytes"] = screenshot
+                else:
+                    logger.warning("Failed to capture screenshot. Proceeding with DOM-only analysis.")
+                    return await self.analyze_page_async(page_data)
 
-            # Create output directory for screenshots if it doesn't exist
-            screenshot_dir = os.path.join(self.config.OUTPUT_DIR, "screenshots")
-            os.makedirs(screenshot_dir, exist_ok=True)
+            logger.info(f"Starting vision analysis of screenshot: {screenshot_label(screenshot)}")
+            # Visual and DOM analyses are independent, so run them concurrently
+            visual_analysis, dom_analysis = await asyncio.gather(
+                self._analyze_screenshot_async(screenshot, page_form_screenshots(page_data)),
+                self._analyze_dom_structure_async(page_data),
+            )
 
-            # Generate a safe filename from the URL
-            from urllib.parse import urlparse
-            url = page_data.get("url", "unknown_page")
-            parsed_url = urlparse(url)
-            filename = parsed_url.netloc.replace(".", "_") + parsed_url.path.replace("/", "_")
-            if not filename:
-                filename = "unknown_page"
+            if not visual_analysis:
+                logger.warning("Vision analysis failed or returned empty results. Proceeding with DOM-only analysis.")
+                return await self.analyze_page_async(page_data)
 
-            screenshot_path = os.path.join(screenshot_dir, f"{filename}.png")
+            logger.info("Combining vision and DOM analyses")
+            return self._combine_analyses(visual_analysis, dom_analysis)
 
-            # Initialize Chrome in headless mode
-            chrome_options = Options()
-            chrome_options.add_argument("--headless")
-            chrome_options.add_argument("--window-size=1920,1080")
+        except Exception as e:
+            logger.error(f"Error in vision-enhanced analysis: {str(e)}", exc_info=True)
+            logger.info("Falling back to standard DOM analysis")
+            return await self.analyze_page_async(page_data)
+
+    def _fallback_screenshot_options(self) -> dict:
+        """page.screenshot options for pages captured by the analyzer itself."""
+        options = {"full_page": True, "type": "png" if self.config.SCREENSHOT_FORMAT == "png" else "jpeg"}
+        if options["type"] == "jpeg":
+            options["quality"] = self.config.SCREENSHOT_CAPTURE_QUALITY
+        return options
 
-            service = None
-            if self.config.CHROME_DRIVER_PATH:
-                service = Service(executable_path=self.config.CHROME_DRIVER_PATH)
+    def _capture_screenshot(self, page_data):
+        """
+        Capture a screenshot of the page as encoded bytes, or return None.
 
-            driver = webdriver.Chrome(service=service, options=chrome_options)
+        Uses the shared browser pool when it is running (this method then has to
+        be called off the pool's event loop, e.g. through asyncio.to_thread),
+        otherwise a one-off Playwright browser with the saved session, if any.
+        """
+        url = page_data.get("url")
+        if not url:
+            return None
+        options = self._fallback_screenshot_options()
+        timeout = self.config.PAGE_LOAD_TIMEOUT * 1000
+        try:
+            if self.browser_pool is not None and self.browser_pool.started:
+                data = self.browser_pool.screenshot_threadsafe(url, timeout=timeout, **options)
+            else:
+                from playwright.sync_api import sync_playwright
 
-            # Navigate to the URL and capture screenshot
-            driver.get(url)
-            driver.save_screenshot(screenshot_path)
-            driver.quit()
+                state = load_storage_state(self.config.SESSION_STATE_PATH) if self.config.SESSION_REUSE else None
+                with sync_playwright() as p:
+                    browser = p.chromium.launch(headless=self.config.HEADLESS)
+                    try:
+                        page = browser.new_page(storage_state=state)
+                        page.goto(url, wait_until="load", timeout=timeout)
+                        data = page.screenshot(**options)
+                    finally:
+                        browser.close()
+            logger.info(f"Captured screenshot for {url} ({len(data) // 1024} KB)")
+            return data
 
-            logger.info(f"Captured screenshot: {screenshot_path}")
-            return screenshot_path
+        except Exception as e:
+            logger.error(f"Failed to capture screenshot: {str(e)}", exc_info=True)
+            return None
 
+    async def _capture_screenshot_async(self, page_data):
+        """Async variant of _capture_screenshot; leases a context from the shared browser pool."""
+        url = page_data.get("url")
+        if self.browser_pool is None or not self.browser_pool.started or not url:
+            return await asyncio.to_thread(self._capture_screenshot, page_data)
+        try:
+            data = await self.browser_pool.screenshot(
+                url,
+                timeout=self.config.PAGE_LOAD_TIMEOUT * 1000,
+                **self._fallback_screenshot_options(),
+            )
+            logger.info(f"Captured screenshot for {url} ({len(data) // 1024} KB)")
+            return data
         except Exception as e:
             logger.error(f"Failed to capture screenshot: {str(e)}", exc_info=True)
             return None
 
-    def _analyze_screenshot(self, screenshot_path: str) -> dict:
+    async def capture_pending_screenshot_async(self, page_data):
+        """
+        Capture the screenshot of a page whose stored data the crawler reused
+        without one (screenshot_pending), keeping it in page_data's
+        screenshot_bytes. Returns the screenshot bytes or None.
+        """
+        page_data.pop("screenshot_pending", None)
+        screenshot = await self._capture_screenshot_async(page_data)
+        if screenshot:
+            page_data["screenshot_bytes"] = screenshot
+        return screenshot
+
+    def _analyze_screenshot(self, screenshot, form_screenshots=None) -> dict:
         """
         Analyze screenshot using GPT-4o-mini's vision capabilities to identify visual elements and layout.
+
+        Args:
+            screenshot (str | bytes): Screenshot file path or in-memory capture
+            form_screenshots (list): Optional close-up captures of the page's forms
         """
         try:
-            if not os.path.exists(screenshot_path):
-                logger.error(f"Screenshot file not found: {screenshot_path}")
+            visual_hash, size = self._screenshot_hash(screenshot, form_screenshots)
+            reused = self._reuse_visual_analysis(screenshot, visual_hash, size)
+            if reused is not None:
+                return reused
+
+            messages = self._build_screenshot_messages(screenshot, form_screenshots)
+            if messages is None:
+                return {}
+
+            # Use the OpenAI client directly with vision capabilities
+            analysis_text = self._create_chat_completion(
+                model="gpt-4o",  # Using vision-capable model
+                messages=messages,
+                max_tokens=self.config.VISUAL_ANALYSIS_TOKENS,
+            )
+            logger.info("Screenshot analysis completed successfully")
+            analysis = self._parse_screenshot_analysis(analysis_text)
+            if self.visual_index:
+                self.visual_index.add(visual_hash, size, analysis)
+            return analysis
+
+        except BatchDeferred:
+            raise
+        except Exception as e:
+            logger.error(f"Error analyzing screenshot with vision: {str(e)}", exc_info=True)
+            return {}
+
+    async def _analyze_screenshot_async(self, screenshot, form_screenshots=None) -> dict:
+        """Async variant of _analyze_screenshot."""
+        try:
+            # Image decoding and resizing is CPU bound: encode in a worker process,
+            # after which building the messages only reads the cached result
+            if screenshot_exists(screenshot):
+                if self.config.SCREENSHOT_TILING:
+                    await tile_screenshot_async(
+                        screenshot,
+                        max_workers=self.config.SCREENSHOT_WORKERS or None,
+                        **self._tile_options(),
+                    )
+                else:
+                    await optimize_screenshot_async(
+                        screenshot,
+                        max_dimension=self.config.SCREENSHOT_MAX_DIMENSION,
+                        quality=self.config.SCREENSHOT_QUALITY,
+                        max_workers=self.config.SCREENSHOT_WORKERS or None,
+                    )
+            visual_hash, size = await asyncio.to_thread(self._screenshot_hash, screenshot, form_screenshots)
+            reused = self._reuse_visual_analysis(screenshot, visual_hash, size)
+            if reused is not None:
+                return reused
+
+            messages = await asyncio.to_thread(self._build_screenshot_messages, screenshot, form_screenshots)
+            if messages is None:
                 return {}
 
+            analysis_text = await self._acreate_chat_completion(
+                model="gpt-4o",
+                messages=messages,
+                max_tokens=self.config.VISUAL_ANALYSIS_TOKENS,
+            )
+            logger.info("Screenshot analysis completed successfully")
+            analysis = self._parse_screenshot_analysis(analysis_text)
+            if self.visual_index:
+                self.visual_index.add(visual_hash, size, analysis)
+            return analysis
+
+        except Exception as e:
+            logger.error(f"Error analyzing screenshot with vision: {str(e)}", exc_info=True)
+            return {}
+
+    def _screenshot_hash(self, screenshot, form_screenshots=None):
+        """
+        Perceptual hash and size of a screenshot, or (None, None) when dedup is off.
+
+        Requests with form close-ups are not deduplicated: a clipped main capture
+        can match while the forms below it differ.
+        """
+        if not self.visual_index or form_screenshots or not screenshot_exists(screenshot):
+            return None, None
+        return screenshot_phash(
+            screenshot,
+            max_dimension=self.config.SCREENSHOT_MAX_DIMENSION,
+            quality=self.config.SCREENSHOT_QUALITY,
+        )
+
+    def _reuse_visual_analysis(self, screenshot, visual_hash, size):
+        """Return the analysis of a visually identical screenshot, or None."""
+        if not self.visual_index:
+            return None
+        analysis = self.visual_index.lookup(visual_hash, size)
+        if analysis is not None:
+            logger.info(f"Reusing vision analysis of a visually identical page for {screenshot_label(screenshot)}")
+        return analysis
+
+    def _screenshot_images(self, screenshot, form_screenshots=None):
+        """
+        Encode a screenshot (file path or in-memory bytes) for a vision request,
+        followed by close-ups of the page's forms when given.
+
+        Returns:
+            tuple: ([(base64, format), ...], number of images showing the page),
+            or None if the screenshot does not exist
+        """
+        if not screenshot_exists(screenshot):
+            logger.error(f"Screenshot file not found: {screenshot}")
+            return None
+
+        images = []
+        if self.config.SCREENSHOT_TILING:
+            # Viewport-height tiles keep tall pages readable; blank and repeated tiles are dropped
+            images = tile_screenshot(screenshot, **self._tile_options())
+
+        if not images:
             # Optimize the screenshot before sending to API
-            from .screenshot_utils import optimize_screenshot  # Use the new utility function
             screenshot_base64, image_format = optimize_screenshot(
-                screenshot_path,
+                screenshot,
                 max_dimension=self.config.SCREENSHOT_MAX_DIMENSION,  # Cap max dimension at 1280px
                 quality=self.config.SCREENSHOT_QUALITY  # Use 75% JPEG quality
             )
 
             if not screenshot_base64:
                 logger.warning("Failed to optimize screenshot. Vision analysis may be limited.")
-                # Fallback to reading the original file
-                with open(screenshot_path, "rb") as image_file:
-                    screenshot_base64 = base64.b64encode(image_file.read()).decode("utf-8")
-                    image_format = "png"
-
-            logger.info(f"Analyzing optimized screenshot from: {screenshot_path}")
-
-            # Create the prompt for visual analysis
-            prompt = """
-            Analyze this webpage screenshot for smoke testing purposes. Identify:
-
-            1. Main UI sections and their layout
-            2. Interactive elements (buttons, forms, links, inputs)
-            3. Navigation elements and their positions
-            4. Potential test scenarios based on visual elements
-            5. Suggested element locators (IDs, classes, or XPaths)
-
-            Format your response with these sections:
-            - VISUAL_SECTIONS: List the main visual sections
-            - INTERACTIVE_ELEMENTS: List interactive elements with descriptions
-            - TEST_SCENARIOS: Suggest 3-5 smoke test scenarios
-            - ELEMENT_LOCATORS: Suggest locator strategies for key elements
-            """
-
-            # Use the OpenAI client directly with vision capabilities
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4o",  # Using vision-capable model
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/{image_format};base64,{screenshot_base64}",
-                                },
-                            },
-                        ],
-                    }
-                ],
-                max_tokens=self.config.VISUAL_ANALYSIS_TOKENS,
+                # Fallback to sending the original capture
+                if isinstance(screenshot, (bytes, bytearray)):
+                    raw = bytes(screenshot)
+                else:
+                    with open(screenshot, "rb") as image_file:
+                        raw = image_file.read()
+                screenshot_base64 = base64.b64encode(raw).decode("utf-8")
+                image_format = "png" if raw.startswith(b"\x89PNG") else "jpeg"
+            images = [(screenshot_base64, image_format)]
+        page_images = len(images)
+
+        for form_screenshot in form_screenshots or []:
+            form_base64, form_format = optimize_screenshot(
+                form_screenshot,
+                max_dimension=self.config.SCREENSHOT_MAX_DIMENSION,
+                quality=self.config.SCREENSHOT_QUALITY,
             )
+            if form_base64:
+                images.append((form_base64, form_format))
 
-            # Extract the content from the response
-            analysis_text = response.choices[0].message.content
-            logger.info("Screenshot analysis completed successfully")
+        return images, page_images
 
-            # Parse the structured sections from the response
-            return {
-                "visual_sections": self._extract_sections_from_response(analysis_text),
-                "visual_elements": self._extract_elements_from_response(analysis_text),
-                "test_scenarios": self._extract_test_scenarios_from_response(analysis_text),
-                "element_locators": self._extract_locators_from_response(analysis_text),
-                "raw_analysis": analysis_text  # Store the full analysis for reference
-            }
+    @staticmethod
+    def _image_parts(images):
+        """Chat message content parts for encoded images."""
+        return [
+            {"type": "image_url", "image_url": {"url": f"data:image/{image_format};base64,{image_base64}"}}
+            for image_base64, image_format in images
+        ]
 
-        except Exception as e:
-            logger.error(f"Error analyzing screenshot with vision: {str(e)}", exc_info=True)
-            return {}
+    def _build_screenshot_messages(self, screenshot, form_screenshots=None):
+        """
+        Build the vision request messages for a screenshot (file path or in-memory bytes),
+        followed by close-ups of the page's forms when given.
+
+        Returns:
+            list: Chat messages, or None if the screenshot does not exist
+        """
+        encoded = self._screenshot_images(screenshot, form_screenshots)
+        if encoded is None:
+            return None
+        images, page_images = encoded
+        logger.info(f"Analyzing optimized screenshot from: {screenshot_label(screenshot)} ({len(images)} image(s))")
+
+        # Static instructions first; the tile note varies per page and goes with the images
+        prompt = """
+        Analyze this webpage screenshot for smoke testing purposes. Identify:
+
+        1. Main UI sections and their layout
+        2. Interactive elements (buttons, forms, links, inputs)
+        3. Navigation elements and their positions
+        4. Potential test scenarios based on visual elements
+        5. Suggested element locators (IDs, classes, or XPaths)
+
+        Format your response with these sections:
+        - VISUAL_SECTIONS: List the main visual sections
+        - INTERACTIVE_ELEMENTS: List interactive elements with descriptions
+        - TEST_SCENARIOS: Suggest 3-5 smoke test scenarios
+        - ELEMENT_LOCATORS: Suggest locator strategies for key elements
+        """
+        note = ""
+        if page_images > 1:
+            note += f"The screenshot is split into {page_images} tiles of the same page, in top-to-bottom order.\n"
+        if len(images) > page_images:
+            note += f"The last {len(images) - page_images} image(s) are close-ups of the page's forms.\n"
+
+        content = ([{"type": "text", "text": note}] if note else []) + self._image_parts(images)
+        return [{"role": "system", "content": prompt}, {"role": "user", "content": content}]
+
+    def _tile_options(self) -> dict:
+        """Tiling settings passed to tile_screenshot."""
+        return {
+            "tile_width": self.config.SCREENSHOT_TILE_WIDTH,
+            "tile_height": self.config.SCREENSHOT_TILE_HEIGHT,
+            "quality": self.config.SCREENSHOT_QUALITY,
+            "token_budget": self.config.SCREENSHOT_TOKEN_BUDGET,
+            "min_stddev": self.config.SCREENSHOT_TILE_MIN_STDDEV,
+        }
+
+    def _parse_screenshot_analysis(self, analysis_text: str) -> dict:
+        """Parse the structured sections from a vision analysis response."""
+        return {
+            "visual_sections": self._extract_sections_from_response(analysis_text),
+            "visual_elements": self._extract_elements_from_response(analysis_text),
+            "test_scenarios": self._extract_test_scenarios_from_response(analysis_text),
+            "element_locators": self._extract_locators_from_response(analysis_text),
+            "raw_analysis": analysis_text  # Store the full analysis for reference
+        }
 
     def _extract_test_scenarios_from_response(self, response: str) -> list:
         """Extract test scenarios from the formatted response."""
@@ -587,27 +1216,30 @@ class LLMAnalyzer:
         """Analyze DOM structure with minimal data."""
         try:
             # Use existing analyze_page but with reduced scope
-            simplified_data = {
-                "url": page_data["url"],
-                "title": page_data["title"],
-                "elements": self._simplify_elements_for_analysis(page_data.get("elements", []), max_elements=3),
-                "forms": self._simplify_elements_for_analysis(page_data.get("forms", []), max_elements=2)
-            }
-
-            # Analyze with reduced prompt
-            dom_prompt = ChatPromptTemplate.from_template(
-                """
-                Analyze these DOM elements and identify key testing points.
-                Focus only on the most critical elements.
-                {format_instructions}
-                """
-            )
+            return self.analyze_page(self._dom_structure_data(page_data))
+        except BatchDeferred:
+            raise
+        except Exception as e:
+            logger.error(f"Error in DOM structure analysis: {str(e)}", exc_info=True)
+            return {}
 
-            return self.analyze_page(simplified_data)
+    async def _analyze_dom_structure_async(self, page_data: dict) -> dict:
+        """Async variant of _analyze_dom_structure."""
+        try:
+            return await self.analyze_page_async(self._dom_structure_data(page_data))
         except Exception as e:
             logger.error(f"Error in DOM structure analysis: {str(e)}", exc_info=True)
             return {}
 
+    def _dom_structure_data(self, page_data: dict) -> dict:
+        """Reduce page data to the few elements and forms used for DOM structure analysis."""
+        return {
+            "url": page_data["url"],
+            "title": page_data["title"],
+            "elements": self._simplify_elements_for_analysis(page_data.get("elements", []), max_elements=3),
+            "forms": self._simplify_elements_for_analysis(page_data.get("forms", []), max_elements=2)
+        }
+
     def _simplify_elements_for_analysis(self, elements, max_elements=3):
         """Helper method to simplify elements for DOM analysis."""
         if not isinstance(elements, list):
@@ -894,6 +1526,15 @@ class LLMAnalyzer:
         Generate both Gherkin feature file, step definitions, and page object for the given framework (default: selenium in Java).
         """
         feature_result = self._generate_cucumber_script(page_analysis, language=language)
+        return self._test_script_result(feature_result, page_analysis, framework, language)
+
+    async def generate_test_script_async(self, page_analysis, framework="selenium", language="java"):
+        """Async variant of generate_test_script, scheduled through the shared LLM scheduler."""
+        feature_result = await self._generate_cucumber_script_async(page_analysis, language=language)
+        return self._test_script_result(feature_result, page_analysis, framework, language)
+
+    @staticmethod
+    def _test_script_result(feature_result, page_analysis, framework, language):
         return {
             "feature_file": feature_result.get("feature_file", ""),
             "step_definitions": feature_result.get("step_definitions", ""),
@@ -904,20 +1545,118 @@ class LLMAnalyzer:
             "title": page_analysis.get("title", "")
         }
 
-    def _generate_automation_script(self, page_analysis, framework="selenium", language="java"):
+    def _single_pass_messages(self, page_data, language="java", use_vision=False):
         """
-        Use the LLM to generate an automation script for the specified framework and language.
+        Build the single-pass request: page features within the prompt budget,
+        plus the screenshot when use_vision is set and one is available.
+
+        Returns:
+            tuple: (model, messages)
         """
-        prompt = f"""
-You are an expert test automation engineer. Given the following web page analysis, generate a complete {framework} automation script in {language} that implements a smoke test for this page. The script should cover login if required, navigation, and basic assertions. Use best practices for the chosen framework and language.
+        max_tokens = self.config.SINGLE_PASS_MAX_TOKENS
+        budget = self.config.LLM_MAX_CONTEXT - max_tokens
+        if self.config.PROMPT_TOKEN_BUDGET:
+            budget = min(budget, self.config.PROMPT_TOKEN_BUDGET)
+        system = {"role": "system", "content": SINGLE_PASS_INSTRUCTIONS.format(language=language.capitalize())}
+        builder = PromptBuilder(budget - count_tokens(system["content"], self.config.LLM_MODEL), model=self.config.LLM_MODEL)
+        self._add_page_sections(builder, page_data)
+        result = builder.build()
+        PromptBuilder.log_breakdown(page_data.get("url", ""), result)
+
+        screenshot = page_screenshot(page_data) if use_vision else None
+        encoded = self._screenshot_images(screenshot, page_form_screenshots(page_data)) if screenshot is not None else None
+        if encoded is None:
+            return self.config.LLM_MODEL, [system, {"role": "user", "content": result["prompt"]}]
+        images, page_images = encoded
+        note = f"The page screenshot follows ({page_images} tile(s), top to bottom"
+        note += f", then {len(images) - page_images} form close-up(s))." if len(images) > page_images else ")."
+        content = [{"type": "text", "text": result["prompt"] + "\n" + note}] + self._image_parts(images)
+        return "gpt-4o", [system, {"role": "user", "content": content}]
+
+    def _single_pass_result(self, content, page_data, framework, language):
+        """Validate a single-pass response; None means the caller should use the two-step path."""
+        url = page_data.get("url", "")
+        try:
+            data = parse_test_script(content)
+        except ValueError as e:
+            logger.warning(f"Single-pass response for {url} is not valid JSON: {e}")
+            return None
+        problems = validate_test_script(data, language)
+        if problems:
+            logger.warning(f"Single-pass response for {url} rejected: {'; '.join(problems)}")
+            return None
+        analysis = {
+            "url": url,
+            "title": page_data.get("title", ""),
+            "page_title_validation": page_data.get("title", ""),
+            "unique_identifiers": data["unique_identifiers"][:5],
+            "key_elements": data["key_elements"][:10],
+            "smoke_test_steps": data["smoke_test_steps"][:10],
+            "locator_strategies": locator_map(data["locator_strategies"]),
+        }
+        result = self._test_script_result(data, analysis, framework, language)
+        result["analysis"] = analysis
+        return result
 
-PAGE ANALYSIS:
-{json.dumps(page_analysis, indent=2)}
+    def generate_test_script_single_pass(self, page_data, framework="selenium", language="java", use_vision=False):
+        """
+        Generate the feature file, step definitions and page object straight
+        from the page features in one structured-output (JSON schema) request,
+        instead of analyze_page followed by test script generation.
+
+        Args:
+            page_data (dict): Crawled page data
+            framework (str): Test framework
+            language (str): Programming language
+            use_vision (bool): Attach the page screenshot when one is available
+
+        Returns:
+            dict: Same keys as generate_test_script plus "analysis", or None if
+            the request failed or its response did not pass validate_test_script
+        """
+        try:
+            model, messages = self._single_pass_messages(page_data, language, use_vision)
+            logger.info(f"Sending single-pass generation request to LLM for {page_data.get('url', '')}")
+            content = self._create_chat_completion(
+                model, messages, self.config.SINGLE_PASS_MAX_TOKENS, response_format=test_script_response_format()
+            )
+        except BatchDeferred:
+            raise
+        except Exception as e:
+            logger.warning(f"Single-pass generation failed for {page_data.get('url', '')}: {str(e)}")
+            return None
+        return self._single_pass_result(content, page_data, framework, language)
+
+    async def generate_test_script_single_pass_async(self, page_data, framework="selenium", language="java",
+                                                     use_vision=False):
+        """Async variant of generate_test_script_single_pass."""
+        try:
+            model, messages = self._single_pass_messages(page_data, language, use_vision)
+            logger.info(f"Sending single-pass generation request to LLM for {page_data.get('url', '')}")
+            content = await self._acreate_chat_completion(
+                model, messages, self.config.SINGLE_PASS_MAX_TOKENS, response_format=test_script_response_format()
+            )
+        except Exception as e:
+            logger.warning(f"Single-pass generation failed for {page_data.get('url', '')}: {str(e)}")
+            return None
+        return self._single_pass_result(content, page_data, framework, language)
 
-Return only the code, no explanation.
-"""
-        response = self.llm.invoke(prompt)
-        return response.content.strip()
+    def _generate_automation_script(self, page_analysis, framework="selenium", language="java"):
+        """
+        Use the LLM to generate an automation script for the specified framework and language.
+        """
+        system = (
+            f"You are an expert test automation engineer. Given the web page analysis in the next message, "
+            f"generate a complete {framework} automation script in {language} that implements a smoke test for "
+            "this page. The script should cover login if required, navigation, and basic assertions. Use best "
+            "practices for the chosen framework and language.\n\nReturn only the code, no explanation."
+        )
+        budget = self._prompt_budget() - count_tokens(system, self.config.LLM_MODEL)
+        builder = PromptBuilder(budget, model=self.config.LLM_MODEL)
+        builder.add_items("analysis", compact_lines(page_analysis), header="PAGE ANALYSIS:")
+        result = builder.build()
+        PromptBuilder.log_breakdown(page_analysis.get("url", ""), result)
+        return self._invoke_llm([("system", system), ("human", result["prompt"])]).strip()
 
     def _generate_cucumber_script(self, page_analysis, language="java"):
         """
@@ -931,80 +1670,121 @@ Return only the code, no explanation.
             dict: Generated scripts
         """
         try:
-            # Setup response schemas
-            response_schemas = [
-                ResponseSchema(
-                    name="feature_file",
-                    description="Cucumber feature file with scenarios based on page analysis",
-                    type="string",
-                ),
-                ResponseSchema(
-                    name="step_definitions",
-                    description=f"Step definitions in {language} to implement the scenarios",
-                    type="string",
-                ),
-                ResponseSchema(
-                    name="page_object",
-                    description=f"Page object in {language} for interacting with UI elements",
-                    type="string",
-                ),
-            ]
-
-            # Setup output parser
-            output_parser = StructuredOutputParser.from_response_schemas(response_schemas)
-            format_instructions = output_parser.get_format_instructions()
-
-            # Format the prompt with the page analysis
-            formatted_prompt = self._format_test_generation_prompt(
-                page_analysis,
-                language=language,
-                format_instructions=format_instructions,
-            )
+            output_parser, formatted_prompt = self._prepare_cucumber_request(page_analysis, language)
 
             try:
                 # Get response from LLM
-                response = self.llm.invoke(formatted_prompt)
+                response_content = self._invoke_llm(formatted_prompt)
+                return self._parse_cucumber_response(response_content, output_parser, page_analysis, language)
 
-                try:
-                    # Try to parse the structured output
-                    parsed_output = output_parser.parse(response.content)
-                except Exception as parse_error:
-                    logger.error(f"JSON parsing error: {str(parse_error)}")
-
-                    # Log the actual response content for debugging
-                    logger.info(f"Response content: {response.content}")
+            except BatchDeferred:
+                raise
+            except Exception as e:
+                logger.error(f"Error generating Cucumber script: {str(e)}")
+                return self._cucumber_error_result(page_analysis, e)
 
-                    # Fall back to simple extraction of code blocks
-                    parsed_output = self._extract_code_blocks_with_enhanced_regex(response.content)
+        except BatchDeferred:
+            raise
+        except Exception as outer_e:
+            logger.error(f"Outer error in Cucumber script generation: {str(outer_e)}")
+            return self._cucumber_error_result(page_analysis, outer_e, outer=True)
 
-                # Add metadata
-                parsed_output["url"] = page_analysis.get("url", "")
-                parsed_output["title"] = page_analysis.get("title", "")
-                parsed_output["language"] = language
+    async def _generate_cucumber_script_async(self, page_analysis, language="java"):
+        """Async variant of _generate_cucumber_script."""
+        try:
+            output_parser, formatted_prompt = self._prepare_cucumber_request(page_analysis, language)
 
-                return parsed_output
+            try:
+                response_content = await self._ainvoke_llm(formatted_prompt)
+                return self._parse_cucumber_response(response_content, output_parser, page_analysis, language)
 
             except Exception as e:
                 logger.error(f"Error generating Cucumber script: {str(e)}")
-                return {
-                    "url": page_analysis.get("url", ""),
-                    "title": page_analysis.get("title", ""),
-                    "error": str(e),
-                    "feature_file": f"# Error generating feature file: {str(e)}",
-                    "step_definitions": f"// Error generating step definitions: {str(e)}",
-                    "page_object": f"// Error generating page object: {str(e)}",
-                }
+                return self._cucumber_error_result(page_analysis, e)
 
         except Exception as outer_e:
             logger.error(f"Outer error in Cucumber script generation: {str(outer_e)}")
+            return self._cucumber_error_result(page_analysis, outer_e, outer=True)
+
+    def _prepare_cucumber_request(self, page_analysis, language="java"):
+        """
+        Build the output parser and prompt messages for Cucumber script generation.
+
+        Returns:
+            tuple: (output_parser, formatted_prompt)
+        """
+        # Setup response schemas
+        response_schemas = [
+            ResponseSchema(
+                name="feature_file",
+                description="Cucumber feature file with scenarios based on page analysis",
+                type="string",
+            ),
+            ResponseSchema(
+                name="step_definitions",
+                description=f"Step definitions in {language} to implement the scenarios",
+                type="string",
+            ),
+            ResponseSchema(
+                name="page_object",
+                description=f"Page object in {language} for interacting with UI elements",
+                type="string",
+            ),
+        ]
+
+        # Setup output parser
+        output_parser = StructuredOutputParser.from_response_schemas(response_schemas)
+        format_instructions = output_parser.get_format_instructions()
+
+        # Format the prompt with the page analysis
+        formatted_prompt = self._format_test_generation_prompt(
+            page_analysis,
+            language=language,
+            format_instructions=format_instructions,
+        )
+
+        return output_parser, formatted_prompt
+
+    def _parse_cucumber_response(self, response_content, output_parser, page_analysis, language):
+        """Parse a Cucumber generation response, falling back to code block extraction."""
+        try:
+            # Try to parse the structured output
+            parsed_output = output_parser.parse(response_content)
+        except Exception as parse_error:
+            logger.error(f"JSON parsing error: {str(parse_error)}")
+
+            # Log the actual response content for debugging
+            logger.info(f"Response content: {response_content}")
+
+            # Fall back to simple extraction of code blocks
+            parsed_output = self._extract_code_blocks_with_enhanced_regex(response_content)
+
+        # Add metadata
+        parsed_output["url"] = page_analysis.get("url", "")
+        parsed_output["title"] = page_analysis.get("title", "")
+        parsed_output["language"] = language
+
+        return parsed_output
+
+    @staticmethod
+    def _cucumber_error_result(page_analysis, error, outer=False):
+        if outer:
             return {
                 "url": page_analysis.get("url", ""),
                 "title": page_analysis.get("title", ""),
-                "error": str(outer_e),
+                "error": str(error),
                 "feature_file": "# Error in test generation",
                 "step_definitions": "// Error in test generation",
                 "page_object": "// Error in test generation",
             }
+        return {
+            "url": page_analysis.get("url", ""),
+            "title": page_analysis.get("title", ""),
+            "error": str(error),
+            "feature_file": f"# Error generating feature file: {str(error)}",
+            "step_definitions": f"// Error generating step definitions: {str(error)}",
+            "page_object": f"// Error generating page object: {str(error)}",
+        }
 
     def _extract_interactions_from_user_flow(self, page_data):
         """
@@ -1102,47 +1882,9 @@ Return only the code, no explanation.
             format_instructions (str): Format instructions for the output parser
 
         Returns:
-            list: Formatted messages for the LLM
+            list: (role, content) messages: the static system prompt, then the
+            page details within the prompt token budget
         """
-        # Add examples of well-formed feature files and step definitions
-        example_features = """
-        Feature: Smoke-QA
-
-            Scenario: verify home page
-                Given user launches browser in "Edge"
-                And user opens URL "QA_URL"
-                And user verifies "My Tasks" is "present" on screen
-                And user verifies "My Products" is "present" on screen
-
-            Scenario: verify new product page
-                Given user launches browser in "Edge"
-                And user opens URL "QA_URL"
-                When user mouse hover the link "Products"
-                And user click on the link "New Product"
-                And user verifies "New Product Steps" is "present" on screen
-
-            Background: User Logged in
-                Given I open the url "SOMEURL"
-                When I add "UserName" to the inputfield "UserName"
-                When I add "pwd" to the inputfield "word"
-                And I click on the Login element "Login"
-                And I pause for 2000 ms
-                Then I expect that the url is "SOMEURL"
-        """
-
-        example_steps = """
-            @Given("I am on the login page")
-            public void iAmOnTheLoginPage() {
-                loginPage.navigateTo();
-                Assert.assertTrue(loginPage.isPageLoaded());
-            }
-
-            @When("I enter {string} into the username field")
-            public void iEnterIntoTheUsernameField(String username) {
-                loginPage.enterUsername(username);
-            }
-        """
-
         # Extract user flow data if available
         interactions = self._extract_interactions_from_user_flow(page_analysis.get("raw_page_data", {}))
 
@@ -1178,83 +1920,55 @@ Return only the code, no explanation.
             # Create scenarios from steps if dedicated scenarios not available
             test_scenarios = ["Verify " + step for step in page_analysis.get("smoke_test_steps", [])[:3]]
 
-        # Format data for the prompt
-        unique_identifiers_str = json.dumps(page_analysis.get("unique_identifiers", []), indent=2)
-        key_elements_str = json.dumps(page_analysis.get("key_elements", []), indent=2)
-        test_scenarios_str = json.dumps(test_scenarios, indent=2)
-        smoke_test_steps_str = json.dumps(page_analysis.get("smoke_test_steps", []), indent=2)
-        locator_strategies_str = json.dumps(page_analysis.get("locator_strategies", {}), indent=2)
-
-        # Prepare the prompt with extra emphasis on proper JSON formatting
-        prompt = ChatPromptTemplate.from_template(
-            """
-            You are an expert in automated testing using Cucumber with {language}.
-
-            EXAMPLE FEATURE FILE:
-            {example_features}
-
-            EXAMPLE STEP DEFINITIONS:
-            {example_steps}
-
-            Generate Cucumber test scripts for the following page based on the analysis:
-
-            PAGE URL: {url}
-            PAGE TITLE: {title}
-
-            PAGE ANALYSIS:
-            {page_analysis_summary}
-
-            {user_flow}
+        # Everything but the page is in the system message, identical for every page of a run;
+        # the page details fill the prompt budget it leaves
+        system = f"""You are an expert in automated testing using Cucumber with {language}.
 
-            UNIQUE IDENTIFIERS:
-            {unique_identifiers}
+EXAMPLE FEATURE FILE:
+{EXAMPLE_FEATURES}
 
-            KEY ELEMENTS:
-            {key_elements}
+EXAMPLE STEP DEFINITIONS:
+{EXAMPLE_STEPS}
 
-            TEST SCENARIOS:
-            {test_scenarios}
+For the page in the next message, generate the following files:
+1. A Cucumber feature file (.feature) for smoke testing this page
+2. Step definitions that implement the feature file steps
+3. A page object model for this page
 
-            SMOKE TEST STEPS:
-            {smoke_test_steps}
+IMPORTANT GUIDELINES:
+- If verified credentials are provided, use them in your test scenarios
+- Create tests based on the successful user flow actions if available
+- Do NOT assume this is a login page unless explicitly mentioned in the analysis
+- Create tests based on the actual page purpose and elements discovered
+- The code should follow best practices for the {language} framework and include appropriate comments
+- Handle potential errors and edge cases
+- Keep scenarios focused on main user flows for the specific page type
 
-            LOCATOR STRATEGIES:
-            {locator_strategies}
+{format_instructions}""".rstrip()
+        budget = self._prompt_budget() - count_tokens(system, self.config.LLM_MODEL)
+        builder = PromptBuilder(budget, model=self.config.LLM_MODEL, separator="\n\n")
+        builder.add_text("header", f"""Generate Cucumber test scripts for the following page based on the analysis:
 
-            Generate the following files:
-            1. A Cucumber feature file (.feature) for smoke testing this page
-            2. Step definitions that implement the feature file steps
-            3. A page object model for this page
+PAGE URL: {url}
+PAGE TITLE: {title}
 
-            IMPORTANT GUIDELINES:
-            - If verified credentials are provided, use them in your test scenarios
-            - Create tests based on the successful user flow actions if available
-            - Do NOT assume this is a login page unless explicitly mentioned in the analysis
-            - Create tests based on the actual page purpose and elements discovered
-            - The code should follow best practices for the {language} framework and include appropriate comments
-            - Handle potential errors and edge cases
-            - Keep scenarios focused on main user flows for the specific page type
-
-            {format_instructions}
-            """
-        )
-
-        # Create the formatted prompt and return it
-        return prompt.format_messages(
-            url=url,
-            title=title,
-            example_features=example_features,
-            example_steps=example_steps,
-            page_analysis_summary=page_analysis_summary,
-            unique_identifiers=unique_identifiers_str,
-            key_elements=key_elements_str,
-            test_scenarios=test_scenarios_str,
-            smoke_test_steps=smoke_test_steps_str,
-            locator_strategies=locator_strategies_str,
-            language=language,
-            format_instructions=format_instructions,
-            user_flow=user_flow_str,
-        )
+PAGE ANALYSIS:
+{page_analysis_summary}""")
+        if user_flow_str:
+            builder.add_text("user_flow", user_flow_str.strip())
+        # The short lists fill first; key elements and locators take what is left
+        builder.add_items("unique_identifiers", compact_items(page_analysis.get("unique_identifiers", [])),
+                          priority=0, header="UNIQUE IDENTIFIERS:")
+        builder.add_items("key_elements", compact_items(page_analysis.get("key_elements", [])),
+                          priority=2, header="KEY ELEMENTS:")
+        builder.add_items("test_scenarios", compact_items(test_scenarios), priority=0, header="TEST SCENARIOS:")
+        builder.add_items("smoke_test_steps", compact_items(page_analysis.get("smoke_test_steps", [])),
+                          priority=1, header="SMOKE TEST STEPS:")
+        builder.add_items("locator_strategies", compact_items(page_analysis.get("locator_strategies", {})),
+                          priority=3, header="LOCATOR STRATEGIES:")
+        result = builder.build()
+        PromptBuilder.log_breakdown(url, result)
+        return [("system", system), ("human", result["prompt"])]
 
     def parse_json_safely(self, json_str):
         """
@@ -1433,6 +2147,8 @@ Return only the code, no explanation.
             raw_response = self.generate_test_script_raw(page_analysis, framework, language)
             # Parse the raw response into sections
             return self._parse_raw_test_script(raw_response, page_analysis)
+        except BatchDeferred:
+            raise
         except Exception as e:
             logger.error(f"Error with raw test script generation: {str(e)}")
             # Create a fallback response
@@ -1452,8 +2168,7 @@ Return only the code, no explanation.
         This avoids JSON parsing issues by returning the direct LLM output.
         """
         try:
-            prompt = f"""
-You are an expert test automation engineer. Given the following web page analysis, generate:
+            instructions = """You are an expert test automation engineer. Given the web page analysis in the next message, generate:
 
 1. A Gherkin feature file for a smoke test of the page.
 2. Java step definitions for Selenium using Cucumber annotations, implementing the steps in the feature file.
@@ -1470,15 +2185,19 @@ STEP DEFINITIONS:
 PAGE OBJECT:
 [Place the Java Page Object class here]
 
-Do not include any explanation or extra text. Only output the code in the specified sections.
-
-WEB PAGE ANALYSIS:
-{json.dumps(page_analysis, indent=2)}
-"""
+Do not include any explanation or extra text. Only output the code in the specified sections."""
+            budget = self._prompt_budget() - count_tokens(instructions, self.config.LLM_MODEL)
+            builder = PromptBuilder(budget, model=self.config.LLM_MODEL)
+            builder.add_items("analysis", compact_lines(page_analysis), header="WEB PAGE ANALYSIS:")
+            result = builder.build()
+            PromptBuilder.log_breakdown(page_analysis.get("url", ""), result)
+            prompt = [("system", instructions), ("human", result["prompt"])]
             logger.info(f"Generating test script for {page_analysis.get('url', '')} with framework {framework}")
-            response = self.llm.invoke(prompt)
-            logger.info(f"Raw LLM output:\n{response.content}")
-            return response.content
+            response_content = self._invoke_llm(prompt)
+            logger.info(f"Raw LLM output:\n{response_content}")
+            return response_content
+        except BatchDeferred:
+            raise
         except Exception as e:
             logger.error(f"Error generating raw test script: {str(e)}")
             # Return a basic fallback script
@@ -1531,14 +2250,26 @@ WEB PAGE ANALYSIS:
         Use the LLM to determine if the given page is a login page.
         Args:
             page_data (dict): The extracted page data
-            screenshot_path (str): Path to the screenshot file
+            screenshot_path (str | bytes): Path to the screenshot file, or the in-memory capture
         Returns:
             bool: True if the page is a login page, False otherwise
         """
-        # Read screenshot as bytes
-        with open(screenshot_path, "rb") as f:
-            screenshot_bytes = f.read()
-        screenshot_base64 = base64.b64encode(screenshot_bytes).decode("utf-8")
+        # Reuse the cached optimized encoding; fall back to the raw capture
+        screenshot_base64, image_format = optimize_screenshot(
+            screenshot_path,
+            max_dimension=self.config.SCREENSHOT_MAX_DIMENSION,
+            quality=self.config.SCREENSHOT_QUALITY
+        )
+        if not screenshot_base64:
+            if isinstance(screenshot_path, (bytes, bytearray)):
+                raw = bytes(screenshot_path)
+            else:
+                with open(screenshot_path, "rb") as f:
+                    raw = f.read()
+            screenshot_base64 = base64.b64encode(raw).decode("utf-8")
+            image_format = "png" if raw.startswith(b"\x89PNG") else "jpeg"
+        # In-memory captures (screenshot bytes, lists of form screenshot bytes) are not JSON serializable
+        page_data = {k: v for k, v in page_data.items() if not _holds_bytes(v)}
 
         # Prepare prompt
         prompt = (
@@ -1551,22 +2282,22 @@ WEB PAGE ANALYSIS:
 
         # Use OpenAI vision model if available, else fallback to text only
         try:
-            response = self.openai_client.chat.completions.create(
+            answer = self._create_chat_completion(
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": "You are a helpful assistant."},
                     {"role": "user", "content": [
                         {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{screenshot_base64}"}}
+                        {"type": "image_url", "image_url": {"url": f"data:image/{image_format};base64,{screenshot_base64}"}}
                     ]}
                 ],
                 max_tokens=10,
-            )
-            answer = response.choices[0].message.content.strip().lower()
+            ).strip().lower()
+        except BatchDeferred:
+            raise
         except Exception as e:
             logger.warning(f"Vision model failed, falling back to text only: {e}")
             # Fallback: text only
-            response = self.llm.invoke(prompt)
-            answer = response.content.strip().lower()
+            answer = self._invoke_llm(prompt).strip().lower()
 
         return answer.startswith("yes")
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import random
+import re
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SECONDS = 60.0
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parse an OpenAI rate-limit reset header ("1s", "6m0s", "250ms", "12") into seconds.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    return sum(float(amount) * scale[unit] for amount, unit in parts)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (about four characters per token) used for budgeting."""
+    return max(1, len(text) // 4)
+
+
+class LLMScheduler:
+    """
+    Shared admission control for async LLM requests.
+
+    Enforces a maximum number of in-flight requests plus rolling one-minute
+    request and token budgets. A 429 response pauses all callers for the
+    delay advertised in its headers (retry-after / x-ratelimit-reset-*),
+    then the request is retried with exponential backoff.
+    """
+
+    def __init__(self, max_concurrency: int = 8, requests_per_minute: Optional[int] = None,
+                 tokens_per_minute: Optional[int] = None, max_retries: int = 5,
+                 base_backoff: float = 1.0):
+        """
+        Initialize the scheduler.
+
+        Args:
+            max_concurrency (int): Maximum requests in flight
+            requests_per_minute (int): Request budget per minute, None or 0 for no limit
+            tokens_per_minute (int): Token budget per minute, None or 0 for no limit
+            max_retries (int): Retries after a rate-limit error
+            base_backoff (float): Backoff in seconds used when no header gives a delay
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.requests_per_minute = requests_per_minute or None
+        self.tokens_per_minute = tokens_per_minute or None
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.stats = {"requests": 0, "rate_limited": 0, "retries": 0}
+        self._semaphore = None
+        self._budget_lock = None
+        self._requests = deque()
+        self._tokens = deque()
+        self._token_total = 0
+        self._paused_until = 0.0
+
+    def _ensure_primitives(self):
+        # Created lazily so they bind to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._budget_lock = asyncio.Lock()
+
+    async def run(self, call: Callable[[], Awaitable[Any]], estimated_tokens: int = 0) -> Any:
+        """
+        Run an async LLM call once capacity and budget allow, retrying on 429.
+
+        Args:
+            call: Zero-argument coroutine factory performing the request
+            estimated_tokens (int): Prompt plus completion tokens charged to the budget
+
+        Returns:
+            The result of the call
+        """
+        self._ensure_primitives()
+        attempt = 0
+        while True:
+            await self._wait_for_pause()
+            await self._reserve(estimated_tokens)
+            async with self._semaphore:
+                try:
+                    self.stats["requests"] += 1
+                    return await call()
+                except Exception as e:
+                    if not self._is_rate_limit(e) or attempt >= self.max_retries:
+                        raise
+                    delay = self._retry_delay(e, attempt)
+                    self.stats["rate_limited"] += 1
+                    self.stats["retries"] += 1
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                    logger.warning(f"Rate limited by LLM API, retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+            attempt += 1
+
+    async def _wait_for_pause(self):
+        while True:
+            remaining = self._paused_until - time.monotonic()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(remaining)
+
+    async def _reserve(self, tokens: int):
+        """Wait until the rolling request/token windows have room, then record the request."""
+        if not self.requests_per_minute and not self.tokens_per_minute:
+            return
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            async with self._budget_lock:
+                now = time.monotonic()
+                self._prune(now)
+                requests_ok = not self.requests_per_minute or len(self._requests) < self.requests_per_minute
+                tokens_ok = not self.tokens_per_minute or self._token_total + tokens <= self.tokens_per_minute
+                if requests_ok and tokens_ok:
+                    self._requests.append(now)
+                    self._tokens.append((now, tokens))
+                    self._token_total += tokens
+                    return
+                oldest = min(
+                    self._requests[0] if self._requests else now,
+                    self._tokens[0][0] if self._tokens else now,
+                )
+                wait = max(0.05, oldest + WINDOW_SECONDS - now)
+            await asyncio.sleep(wait)
+
+    def _prune(self, now: float):
+        cutoff = now - WINDOW_SECONDS
+        while self._requests and self._requests[0] <= cutoff:
+            self._requests.popleft()
+        while self._tokens and self._tokens[0][0] <= cutoff:
+            self._token_total -= self._tokens.popleft()[1]
+
+    @staticmethod
+    def _is_rate_limit(error: Exception) -> bool:
+        status = getattr(error, "status_code", None)
+        if status is None:
+            status = getattr(getattr(error, "response", None), "status_code", None)
+        return status == 429 or type(error).__name__ == "RateLimitError"
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """Prefer the delay advertised by the API; fall back to jittered exponential backoff."""
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        delay = None
+        if headers.get("retry-after-ms"):
+            parsed = parse_reset_duration(headers.get("retry-after-ms"))
+            delay = parsed / 1000.0 if parsed is not None else None
+        if delay is None:
+            delay = parse_reset_duration(headers.get("retry-after"))
+        if delay is None:
+            # Wait for whichever budget is exhausted to reset
+            resets = [
+                parse_reset_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                for kind in ("requests", "tokens")
+                if headers.get(f"x-ratelimit-remaining-{kind}") == "0"
+            ]
+            resets = [r for r in resets if r is not None]
+            delay = max(resets) if resets else None
+        if delay is not None:
+            return delay + random.uniform(0, 0.25)
+        return self.base_backoff * (2 ** attempt) + random.uniform(0, self.base_backoff)
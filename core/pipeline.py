@@ -0,0 +1,310 @@
+import asyncio
+import logging
+import os
+import time
+
+from core.run_ledger import STAGE_ANALYZED, STAGE_FILES_WRITTEN, STAGE_SCRIPT_GENERATED
+from core.screenshot_utils import page_screenshot, screenshot_label
+
+logger = logging.getLogger(__name__)
+
+# Queue sentinel telling a worker to stop
+_DONE = object()
+
+
+def safe_test_name(url):
+    """Turn a URL into the file name prefix used for generated test files."""
+    return url.replace("https://", "").replace("http://", "").replace("/", "_").replace("?", "_")
+
+
+async def batch_analyze(llm_analyzer, pages, ledger=None):
+    """
+    Analyze the text-only pages (those without a screenshot) among pages
+    with LLMAnalyzer.analyze_pages_async, packing small ones into shared
+    requests. Pages the ledger already holds an analysis for are skipped;
+    new analyses are stored in it like those of analyze_and_generate.
+
+    Returns:
+        dict: url -> page analysis, to pass on to analyze_and_generate
+    """
+    pending = [
+        page_data for page_data in pages
+        if page_screenshot(page_data) is None and not page_data.get("screenshot_pending")
+        and not (ledger and ledger.load_json(page_data.get("url", ""), STAGE_ANALYZED) is not None)
+    ]
+    if len(pending) < 2:
+        return {}
+    analyses = await llm_analyzer.analyze_pages_async(pending)
+    logger.info(f"Batched analysis: {llm_analyzer.batch_stats}")
+    results = {}
+    for page_data, analysis in zip(pending, analyses):
+        url = page_data.get("url", "")
+        results[url] = analysis
+        if ledger and "error" not in analysis:
+            ledger.store_json(url, STAGE_ANALYZED, analysis)
+    return results
+
+
+async def analyze_and_generate(llm_analyzer, page_data, ledger=None, page_analysis=None):
+    """
+    Analyze one crawled page and generate its test script.
+
+    With a RunLedger, stages completed by an earlier attempt of the run are
+    reloaded from their artifacts instead of calling the LLM again. A
+    page_analysis computed beforehand (e.g. by batch_analyze) skips the
+    analysis stage. Reused page data still waiting for its screenshot
+    (screenshot_pending) gets it captured before the page is analyzed.
+
+    Returns:
+        dict: Test script info (feature_file, step_definitions, page_object, ...)
+    """
+    url = page_data.get("url", "")
+
+    if ledger:
+        test_script_info = ledger.load_json(url, STAGE_SCRIPT_GENERATED)
+        if test_script_info is not None:
+            logger.info(f"Reusing generated test script from run ledger for {url}")
+            return test_script_info
+
+    if page_analysis is None and ledger:
+        page_analysis = ledger.load_json(url, STAGE_ANALYZED)
+        if page_analysis is not None:
+            logger.info(f"Reusing page analysis from run ledger for {url}")
+
+    if page_analysis is None and page_data.get("screenshot_pending"):
+        await llm_analyzer.capture_pending_screenshot_async(page_data)
+    screenshot = page_screenshot(page_data)
+
+    # Single pass: page features to test files in one structured-output request
+    if page_analysis is None and llm_analyzer.config.SINGLE_PASS_GENERATION:
+        test_script_info = await llm_analyzer.generate_test_script_single_pass_async(
+            page_data, framework="selenium", language="java", use_vision=screenshot is not None
+        )
+        if test_script_info is not None:
+            if ledger:
+                ledger.store_json(url, STAGE_ANALYZED, test_script_info["analysis"])
+                ledger.store_json(url, STAGE_SCRIPT_GENERATED, test_script_info)
+            return test_script_info
+        logger.info(f"Falling back to separate analysis and test generation for {url}")
+
+    if page_analysis is None:
+        # 1. Perform analysis (vision-based if screenshot is available)
+        try:
+            if screenshot is not None:
+                logger.info(f"Performing vision-based analysis for {url} using screenshot: {screenshot_label(screenshot)}")
+                page_analysis = await llm_analyzer.analyze_page_with_vision_async(page_data)
+            else:
+                logger.info(f"Performing standard analysis for {url} (no screenshot available)")
+                page_analysis = await llm_analyzer.analyze_page_async(page_data)
+        except Exception as e:
+            if ledger:
+                ledger.mark_failed(url, STAGE_ANALYZED, e)
+            raise
+        # Analyses that fell back after an LLM error are not stored, so a resume retries them
+        if ledger and "error" not in page_analysis:
+            ledger.store_json(url, STAGE_ANALYZED, page_analysis)
+
+    # 2. Generate test script from analysis (force Selenium/Java)
+    logger.info(f"Generating test script for {url}...")
+    try:
+        test_script_info = await llm_analyzer.generate_test_script_async(page_analysis, framework="selenium", language="java")
+    except Exception as e:
+        if ledger:
+            ledger.mark_failed(url, STAGE_SCRIPT_GENERATED, e)
+        raise
+    logger.info(f"LLM test_script_info: {test_script_info}")
+    logger.info(f"Raw LLM output:\n{test_script_info.get('feature_file', '')}")
+    if ledger and "error" not in test_script_info:
+        ledger.store_json(url, STAGE_SCRIPT_GENERATED, test_script_info)
+    return test_script_info
+
+
+def files_already_written(url, ledger):
+    """Return True if a ledger records this page's test files and they all still exist."""
+    if not ledger:
+        return False
+    written = ledger.artifact(url, STAGE_FILES_WRITTEN)
+    return bool(written) and all(os.path.exists(path) for path in written)
+
+
+def write_test_files_recorded(url, test_script_info, tests_dir, ledger=None,
+                              page_index=None, page_meta=None, members=None):
+    """
+    Write a page's test files and record the files_written stage.
+
+    With a PageIndex, the page's fingerprint and HTTP validators (page_meta)
+    are stored against the written files for the next incremental run.
+    members maps the other pages the files cover (a template cluster) to
+    their page_meta; they are recorded against the same files.
+    """
+    try:
+        written = write_test_files(url, test_script_info, tests_dir)
+    except Exception as e:
+        if ledger:
+            ledger.mark_failed(url, STAGE_FILES_WRITTEN, e)
+        raise
+    if ledger:
+        ledger.mark_done(url, STAGE_FILES_WRITTEN, written)
+    if page_index and "error" not in test_script_info:
+        for page_url, meta in {**(members or {}), url: page_meta}.items():
+            if meta and meta.get("fingerprint"):
+                page_index.record(page_url, meta["fingerprint"], written,
+                                  etag=meta.get("etag"), last_modified=meta.get("last_modified"))
+    return written
+
+
+def page_meta(page_data):
+    """Return the fingerprint and HTTP validators a PageIndex records for a page."""
+    return {key: page_data.get(key) for key in ("fingerprint", "etag", "last_modified")}
+
+
+def write_test_files(url, test_script_info, tests_dir):
+    """
+    Save the feature file, step definitions and page object for a page.
+
+    Returns:
+        list: Paths of the files written
+    """
+    safe_name = safe_test_name(url)
+    written = []
+
+    # 3. Save feature file
+    test_file = os.path.join(tests_dir, f"{safe_name}_smoketest.feature")
+    with open(test_file, "w", encoding="utf-8") as f:
+        f.write(test_script_info.get("feature_file", ""))
+    written.append(test_file)
+    logger.info(f"Saved smoke test for {url} to {test_file}")
+
+    # 4. Save step definitions (Java example)
+    if "step_definitions" in test_script_info:
+        steps_file = os.path.join(tests_dir, f"{safe_name}_steps.java")
+        with open(steps_file, "w", encoding="utf-8") as f:
+            f.write(test_script_info["step_definitions"])
+        written.append(steps_file)
+        logger.info(f"Saved step definitions for {url} to {steps_file}")
+
+    # 5. Save page object (Java example)
+    if "page_object" in test_script_info:
+        page_file = os.path.join(tests_dir, f"{safe_name}_page.java")
+        with open(page_file, "w", encoding="utf-8") as f:
+            f.write(test_script_info["page_object"])
+        written.append(page_file)
+        logger.info(f"Saved page object for {url} to {page_file}")
+
+    return written
+
+
+class SmokeTestPipeline:
+    """
+    Streams crawled pages through analysis and file emission.
+
+    The crawler, analysis workers and writer workers are connected by bounded
+    asyncio queues, so each stage has its own concurrency and a full queue
+    slows the stage before it. Tests are written while the crawl is still
+    running and only queue-size pages are held in memory at any time.
+    """
+
+    def __init__(self, crawler, llm_analyzer, tests_dir, analysis_workers=4,
+                 writer_workers=2, queue_size=16, ledger=None, page_index=None):
+        """
+        Initialize the pipeline.
+
+        Args:
+            crawler (PlaywrightCrawler): Crawler producing page data
+            llm_analyzer (LLMAnalyzer): Analyzer used for analysis and generation
+            tests_dir (str): Directory for generated test files
+            analysis_workers (int): Concurrent analysis/generation workers
+            writer_workers (int): Concurrent file-writing workers
+            queue_size (int): Capacity of each inter-stage queue
+            ledger (RunLedger): Optional ledger used to skip completed stages
+            page_index (PageIndex): Optional index updated with each page's fingerprint
+        """
+        self.crawler = crawler
+        self.llm_analyzer = llm_analyzer
+        self.tests_dir = tests_dir
+        self.analysis_workers = max(1, analysis_workers)
+        self.writer_workers = max(1, writer_workers)
+        self.queue_size = max(1, queue_size)
+        self.ledger = ledger
+        self.page_index = page_index
+        self.stats = {"crawled": 0, "analyzed": 0, "written": 0, "unchanged": 0, "failed": 0}
+
+    async def run(self, single_page_only=False, enable_tracing=False):
+        """
+        Run the crawl and stream every page through analysis and writing.
+
+        Returns:
+            dict: Per-stage counters
+        """
+        page_queue = asyncio.Queue(maxsize=self.queue_size)
+        write_queue = asyncio.Queue(maxsize=self.queue_size)
+        started = time.monotonic()
+
+        async def on_page(page_data):
+            self.stats["crawled"] += 1
+            await page_queue.put(page_data)
+
+        analyzers = [asyncio.create_task(self._analysis_worker(page_queue, write_queue))
+                     for _ in range(self.analysis_workers)]
+        writers = [asyncio.create_task(self._writer_worker(write_queue, started))
+                   for _ in range(self.writer_workers)]
+
+        try:
+            await self.crawler.crawl(
+                single_page_only=single_page_only,
+                enable_tracing=enable_tracing,
+                on_page=on_page,
+            )
+        finally:
+            # Drain each stage in order, then stop its workers
+            for _ in analyzers:
+                await page_queue.put(_DONE)
+            await asyncio.gather(*analyzers)
+            for _ in writers:
+                await write_queue.put(_DONE)
+            await asyncio.gather(*writers)
+
+        logger.info(f"Pipeline finished in {time.monotonic() - started:.1f}s: {self.stats}")
+        return self.stats
+
+    async def _analysis_worker(self, page_queue, write_queue):
+        while True:
+            page_data = await page_queue.get()
+            if page_data is _DONE:
+                return
+            url = page_data.get("url", "")
+            if files_already_written(url, self.ledger):
+                logger.info(f"Skipping {url}: test files already written in this run")
+                continue
+            if page_data.get("unchanged"):
+                logger.info(f"Skipping {url}: structure unchanged since its tests were generated")
+                self.stats["unchanged"] += 1
+                continue
+            meta = page_meta(page_data)
+            try:
+                test_script_info = await analyze_and_generate(self.llm_analyzer, page_data, self.ledger)
+                self.stats["analyzed"] += 1
+            except Exception as e:
+                logger.error(f"Pipeline analysis failed for {url}: {str(e)}", exc_info=True)
+                self.stats["failed"] += 1
+                continue
+            finally:
+                # Drop the reference to the (potentially large) page data
+                del page_data
+            await write_queue.put((url, test_script_info, meta))
+
+    async def _writer_worker(self, write_queue, started):
+        while True:
+            item = await write_queue.get()
+            if item is _DONE:
+                return
+            url, test_script_info, meta = item
+            try:
+                await asyncio.to_thread(write_test_files_recorded, url, test_script_info, self.tests_dir,
+                                        self.ledger, self.page_index, meta)
+                self.stats["written"] += 1
+                if self.stats["written"] == 1:
+                    logger.info(f"First test files written {time.monotonic() - started:.1f}s after crawl start")
+            except Exception as e:
+                logger.error(f"Pipeline failed to write tests for {url}: {str(e)}", exc_info=True)
+                self.stats["failed"] += 1
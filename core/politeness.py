@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Optional
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+logger = logging.getLogger(__name__)
+
+# Responses that mean the host wants us to slow down
+THROTTLE_STATUSES = (429, 503)
+
+
+def host_key(url: str) -> str:
+    """Scheme and host[:port] of a URL; politeness limits apply per origin."""
+    parts = urlsplit(url)
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}"
+
+
+class _HostState:
+    def __init__(self, max_concurrency: int, delay: float):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.lock = asyncio.Lock()
+        self.base_delay = delay
+        self.delay = delay
+        self.next_start = 0.0
+        self.latency = None
+        self.best_latency = None
+        self.robots = None
+        self.robots_loaded = False
+
+
+class HostPolitenessScheduler:
+    """
+    Per-origin admission control for crawler navigations.
+
+    Each origin gets at most max_per_host navigations in flight, started at
+    least its current delay apart. The delay starts at min_delay (or the
+    robots.txt Crawl-delay when robots are respected), doubles on 429/503
+    responses or when the smoothed response time rises above latency_factor
+    times the best seen, and decays back once the host recovers. A
+    Retry-After header pauses the origin for the advertised time.
+    """
+
+    def __init__(self, max_per_host: int = 2, min_delay: float = 0.0, max_delay: float = 30.0,
+                 latency_factor: float = 3.0, respect_robots: bool = False, user_agent: str = "*"):
+        """
+        Initialize the scheduler.
+
+        Args:
+            max_per_host (int): Maximum concurrent navigations per origin
+            min_delay (float): Minimum seconds between navigation starts on an origin
+            max_delay (float): Upper bound of the adaptive delay
+            latency_factor (float): Slowdown over the best smoothed latency that triggers a backoff
+            respect_robots (bool): Skip URLs disallowed by robots.txt and apply its Crawl-delay
+            user_agent (str): User agent matched against robots.txt rules
+        """
+        self.max_per_host = max(1, max_per_host)
+        self.min_delay = max(0.0, min_delay)
+        self.max_delay = max(self.min_delay, max_delay)
+        self.latency_factor = latency_factor
+        self.respect_robots = respect_robots
+        self.user_agent = user_agent
+        self.stats = {"navigations": 0, "throttled": 0, "slow": 0, "robots_blocked": 0}
+        self._hosts: Dict[str, _HostState] = {}
+
+    def _host(self, url: str) -> _HostState:
+        key = host_key(url)
+        state = self._hosts.get(key)
+        if state is None:
+            state = self._hosts[key] = _HostState(self.max_per_host, self.min_delay)
+        return state
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """Hold a navigation slot on the URL's origin, waiting for its delay first."""
+        state = self._host(url)
+        async with state.semaphore:
+            async with state.lock:
+                wait = state.next_start - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                state.next_start = time.monotonic() + state.delay
+            self.stats["navigations"] += 1
+            yield
+
+    def record(self, url: str, status: Optional[int], latency: float,
+               retry_after: Optional[str] = None) -> None:
+        """Adapt the origin's delay to the status and response time of a navigation."""
+        state = self._host(url)
+        if status in THROTTLE_STATUSES:
+            self.stats["throttled"] += 1
+            state.delay = min(self.max_delay, max(state.delay * 2, state.base_delay, 1.0))
+            pause = self._parse_retry_after(retry_after)
+            if pause is not None:
+                state.next_start = max(state.next_start, time.monotonic() + min(pause, self.max_delay))
+            logger.warning(f"{host_key(url)} answered {status}; delay between requests now {state.delay:.1f}s")
+            return
+
+        state.latency = latency if state.latency is None else 0.7 * state.latency + 0.3 * latency
+        if state.best_latency is None or state.latency < state.best_latency:
+            state.best_latency = state.latency
+        if state.latency > self.latency_factor * state.best_latency:
+            self.stats["slow"] += 1
+            state.delay = min(self.max_delay, max(state.delay * 2, state.base_delay, 0.5))
+            logger.info(f"{host_key(url)} is slowing down ({state.latency:.1f}s); delay now {state.delay:.1f}s")
+        elif state.delay > state.base_delay:
+            state.delay = max(state.base_delay, state.delay * 0.8)
+
+    @staticmethod
+    def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            from email.utils import parsedate_to_datetime
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    async def allowed(self, url: str, fetch_robots: Callable[[str], Awaitable[Optional[str]]]) -> bool:
+        """
+        Return False if robots.txt disallows the URL. The origin's robots.txt
+        is fetched once through fetch_robots(robots_url), which returns its
+        text or None when there is none.
+        """
+        if not self.respect_robots:
+            return True
+        state = self._host(url)
+        if not state.robots_loaded:
+            async with state.lock:
+                if not state.robots_loaded:
+                    await self._load_robots(url, state, fetch_robots)
+        if state.robots is None or state.robots.can_fetch(self.user_agent, url):
+            return True
+        self.stats["robots_blocked"] += 1
+        return False
+
+    async def _load_robots(self, url, state, fetch_robots):
+        robots_url = host_key(url) + "/robots.txt"
+        try:
+            text = await fetch_robots(robots_url)
+        except Exception as e:
+            logger.debug(f"Could not fetch {robots_url}: {e}")
+            text = None
+        state.robots_loaded = True
+        if not text:
+            return
+        parser = RobotFileParser(robots_url)
+        parser.parse(text.splitlines())
+        state.robots = parser
+        crawl_delay = parser.crawl_delay(self.user_agent)
+        if crawl_delay:
+            state.base_delay = max(state.base_delay, float(crawl_delay))
+            state.delay = max(state.delay, state.base_delay)
+            logger.info(f"Honoring Crawl-delay of {crawl_delay}s for {host_key(url)}")
+
+    def summary(self) -> Dict[str, object]:
+        """Counters plus the current delay per origin."""
+        delays = {key: round(state.delay, 2) for key, state in self._hosts.items()}
+        return dict(self.stats, delays=delays)
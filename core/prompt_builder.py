@@ -0,0 +1,214 @@
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from .llm_scheduler import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken ships with langchain-openai
+    tiktoken = None
+
+FALLBACK_ENCODING = "o200k_base"
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    """The model's tokenizer, or None if tiktoken is missing or cannot load it."""
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding(FALLBACK_ENCODING)
+    except Exception as e:
+        # Encodings are downloaded on first use, which fails offline; the
+        # cached None keeps this warning to once per model
+        logger.warning(f"tiktoken encoding for {model} unavailable, estimating tokens instead: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """
+    Count the tokens of text with the model's tokenizer (tiktoken), falling
+    back to the four-characters-per-token estimate if tiktoken is missing
+    or its encoding cannot be loaded.
+    """
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def compact_lines(value: Any, indent: str = "") -> List[str]:
+    """
+    Render a JSON-like value as compact "- item" / "key: value" lines
+    instead of indented JSON; empty values produce no lines.
+    """
+    if value in (None, "", [], {}):
+        return []
+    if isinstance(value, dict):
+        lines = []
+        for key, item in value.items():
+            if isinstance(item, (dict, list)):
+                nested = compact_lines(item, indent + "  ")
+                if nested:
+                    lines.append(f"{indent}{key}:")
+                    lines.extend(nested)
+            elif item not in (None, ""):
+                lines.append(f"{indent}{key}: {item}")
+        return lines
+    if isinstance(value, list):
+        lines = []
+        for item in value:
+            if isinstance(item, (dict, list)):
+                nested = compact_lines(item, indent + "  ")
+                if nested:
+                    lines.append(f"{indent}- " + nested[0].strip())
+                    lines.extend(nested[1:])
+            elif item not in (None, ""):
+                lines.append(f"{indent}- {item}")
+        return lines
+    return [f"{indent}{value}"]
+
+
+
+def compact_items(value: Any) -> List[str]:
+    """
+    Split a list or dict into one compact_lines item per entry, so a
+    PromptBuilder section keeps or drops whole entries.
+    """
+    if isinstance(value, dict):
+        entries = (compact_lines({key: item}) for key, item in value.items())
+    elif isinstance(value, list):
+        entries = (compact_lines([item]) for item in value)
+    else:
+        return compact_lines(value)
+    return ["\n".join(lines) for lines in entries if lines]
+
+class PromptBuilder:
+    """
+    Assemble a prompt from named sections within a token budget.
+
+    Fixed text (instructions, URL, title) is always included. Item sections
+    are filled in priority order, one item at a time, skipping items that
+    no longer fit; items are counted with the model's tokenizer and the assembled
+    prompt is measured again, so it never exceeds the budget (only the fixed
+    text can) and small pages are not padded. Sections left empty
+    are omitted entirely. The prompt keeps the order in which sections were
+    added, whatever their priority.
+    """
+
+    def __init__(self, budget: int, model: str = "gpt-4o-mini", separator: str = "\n"):
+        """
+        Initialize the builder.
+
+        Args:
+            budget (int): Maximum prompt tokens
+            model (str): Model whose tokenizer counts the tokens
+            separator (str): Text placed between sections
+        """
+        self.budget = budget
+        self.model = model
+        self.separator = separator
+        self._sections = []
+
+    def add_text(self, name: str, text: str) -> "PromptBuilder":
+        """Add fixed text that is always part of the prompt."""
+        self._sections.append({"name": name, "fixed": True, "text": text})
+        return self
+
+    def add_items(self, name: str, items: List[str], priority: int = 0,
+                  header: Optional[str] = None) -> "PromptBuilder":
+        """
+        Add a section of items (one line each, multi-line items allowed)
+        filled while the budget allows. Lower priority values fill first.
+        """
+        self._sections.append({
+            "name": name, "fixed": False, "items": [i for i in items if i],
+            "priority": priority, "header": header,
+        })
+        return self
+
+    def build(self) -> Dict[str, Any]:
+        """
+        Assemble the prompt.
+
+        Returns:
+            dict: {"prompt": str, "tokens": int, "sections": {name: {"tokens", "kept", "total"}}}
+        """
+        used = 0
+        report = {}
+        kept = {}
+        for section in self._sections:
+            if section["fixed"]:
+                tokens = count_tokens(section["text"] + self.separator, self.model)
+                used += tokens
+                report[section["name"]] = {"tokens": tokens}
+
+        for index, section in sorted(
+            ((i, s) for i, s in enumerate(self._sections) if not s["fixed"]),
+            key=lambda pair: (pair[1]["priority"], pair[0]),
+        ):
+            lines = []
+            tokens = 0
+            items = section["items"]
+            if items and section["header"]:
+                tokens = count_tokens(section["header"] + "\n" + self.separator, self.model)
+                if used + tokens > self.budget:
+                    items = []
+            for item in items:
+                cost = count_tokens(item + "\n", self.model)
+                if used + tokens + cost > self.budget:
+                    # A smaller item further down may still fit
+                    continue
+                lines.append(item)
+                tokens += cost
+            if not lines:
+                tokens = 0
+            used += tokens
+            kept[index] = lines
+            report[section["name"]] = {"tokens": tokens, "kept": len(lines), "total": len(section["items"])}
+
+        prompt = self._render(kept)
+        total = count_tokens(prompt, self.model)
+        # Token counts of the pieces need not add up to the count of the whole
+        # prompt; trim the lowest-priority items until the whole fits too.
+        fill_order = sorted(kept, key=lambda i: (self._sections[i]["priority"], i))
+        while total > self.budget:
+            index = next((i for i in reversed(fill_order) if kept[i]), None)
+            if index is None:
+                break
+            item = kept[index].pop()
+            info = report[self._sections[index]["name"]]
+            info["kept"] -= 1
+            info["tokens"] = max(0, info["tokens"] - count_tokens(item + "\n", self.model)) if kept[index] else 0
+            prompt = self._render(kept)
+            total = count_tokens(prompt, self.model)
+        return {"prompt": prompt, "tokens": total, "sections": report}
+
+    def _render(self, kept: Dict[int, List[str]]) -> str:
+        parts = []
+        for index, section in enumerate(self._sections):
+            if section["fixed"]:
+                parts.append(section["text"])
+            elif kept.get(index):
+                header = [section["header"]] if section["header"] else []
+                parts.append("\n".join(header + kept[index]))
+        return self.separator.join(parts)
+
+    @staticmethod
+    def log_breakdown(label: str, result: Dict[str, Any]) -> None:
+        """Log the prompt-token breakdown of a build() result."""
+        parts = []
+        for name, info in result["sections"].items():
+            if "kept" in info:
+                parts.append(f"{name}={info['tokens']} ({info['kept']}/{info['total']})")
+            else:
+                parts.append(f"{name}={info['tokens']}")
+        logger.info(f"Prompt tokens for {label}: {result['tokens']} [{', '.join(parts)}]")
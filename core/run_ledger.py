@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Per-URL stages, in pipeline order
+STAGE_CRAWLED = "crawled"
+STAGE_SCREENSHOT = "screenshot"
+STAGE_ANALYZED = "analyzed"
+STAGE_SCRIPT_GENERATED = "script_generated"
+STAGE_FILES_WRITTEN = "files_written"
+STAGES = (STAGE_CRAWLED, STAGE_SCREENSHOT, STAGE_ANALYZED, STAGE_SCRIPT_GENERATED, STAGE_FILES_WRITTEN)
+
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class RunLedger:
+    """
+    SQLite ledger recording each URL's stage status for a run.
+
+    Every completed stage points at its stored artifact (page data JSON,
+    screenshot, analysis JSON, test script JSON, written files) so a run that
+    dies part-way can be resumed: completed stages are reloaded from their
+    artifacts and only failed or missing stages are redone.
+    """
+
+    def __init__(self, db_path: str, artifacts_dir: str, run_id: Optional[str] = None,
+                 base_url: str = "", resume: bool = False):
+        """
+        Open (or create) the ledger for a run.
+
+        Args:
+            db_path (str): SQLite database file
+            artifacts_dir (str): Directory for stage artifacts written through store_json
+            run_id (str): Run identifier; generated when not given
+            base_url (str): Site the run crawls
+            resume (bool): Require run_id to name an existing run
+        """
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        os.makedirs(artifacts_dir, exist_ok=True)
+        self.db_path = db_path
+        self.artifacts_dir = artifacts_dir
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                base_url TEXT,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS stages (
+                run_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                status TEXT NOT NULL,
+                artifact TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (run_id, url, stage)
+            );
+            """
+        )
+
+        if resume:
+            row = self._conn.execute("SELECT base_url FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            if row is None:
+                raise ValueError(f"No run found with id '{run_id}' in {db_path}")
+            self.run_id = run_id
+            self.base_url = row[0]
+            self._set_run_status("running")
+            logger.info(f"Resuming run {run_id}")
+        else:
+            self.run_id = run_id or datetime.now().strftime("%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:6]
+            self.base_url = base_url
+            now = time.time()
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO runs (run_id, base_url, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (self.run_id, base_url, "running", now, now),
+                )
+                self._conn.commit()
+            logger.info(f"Started run {self.run_id}")
+
+    def mark_done(self, url: str, stage: str, artifact: Any = None) -> None:
+        """Record a completed stage and the artifact it produced."""
+        self._upsert(url, stage, STATUS_DONE, artifact=artifact)
+
+    def mark_failed(self, url: str, stage: str, error: Any) -> None:
+        """Record a failed stage so a resumed run retries it."""
+        self._upsert(url, stage, STATUS_FAILED, error=str(error))
+
+    def is_done(self, url: str, stage: str) -> bool:
+        row = self._get(url, stage)
+        return row is not None and row[0] == STATUS_DONE
+
+    def artifact(self, url: str, stage: str) -> Any:
+        """Return the artifact of a completed stage, or None."""
+        row = self._get(url, stage)
+        if row is None or row[0] != STATUS_DONE or row[1] is None:
+            return None
+        return json.loads(row[1])
+
+    def store_json(self, url: str, stage: str, data: Any) -> str:
+        """Write a stage result as a JSON artifact and mark the stage done."""
+        safe_name = url.replace("https://", "").replace("http://", "").replace("/", "_").replace("?", "_")
+        path = os.path.join(self.artifacts_dir, f"{safe_name}_{stage}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, default=str)
+        self.mark_done(url, stage, path)
+        return path
+
+    def load_json(self, url: str, stage: str) -> Any:
+        """Reload the JSON artifact of a completed stage, or None if it is missing."""
+        path = self.artifact(url, stage)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"Could not reload {stage} artifact for {url}: {e}")
+            return None
+
+    def completed(self, stage: str) -> Dict[str, Any]:
+        """Return {url: artifact} for every URL that completed a stage."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url, artifact FROM stages WHERE run_id = ? AND stage = ? AND status = ?",
+                (self.run_id, stage, STATUS_DONE),
+            ).fetchall()
+        return {url: json.loads(artifact) if artifact is not None else None for url, artifact in rows}
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """Return {stage: {status: count}} for the run."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage, status, COUNT(*) FROM stages WHERE run_id = ? GROUP BY stage, status",
+                (self.run_id,),
+            ).fetchall()
+        result = {}
+        for stage, status, count in rows:
+            result.setdefault(stage, {})[status] = count
+        return result
+
+    def finish(self, status: str = "completed") -> None:
+        self._set_run_status(status)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _get(self, url: str, stage: str):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT status, artifact FROM stages WHERE run_id = ? AND url = ? AND stage = ?",
+                (self.run_id, url, stage),
+            ).fetchone()
+
+    def _upsert(self, url: str, stage: str, status: str, artifact: Any = None, error: Optional[str] = None) -> None:
+        payload = json.dumps(artifact) if artifact is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stages (run_id, url, stage, status, artifact, error, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.run_id, url, stage, status, payload, error, time.time()),
+            )
+            self._conn.commit()
+
+    def _set_run_status(self, status: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE runs SET status = ?, updated_at = ? WHERE run_id = ?",
+                (status, time.time(), self.run_id),
+            )
+            self._conn.commit()
@@ -1,13 +1,226 @@
 import os
 import logging
 import base64
-from PIL import Image
+import hashlib
+import asyncio
+import json
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from PIL import Image, ImageStat
 import io
 
 logger = logging.getLogger(__name__)
 
+# Encoded screenshots are cached in this directory next to their source
+CACHE_DIR_NAME = ".optimized"
+
+# OpenAI high-detail image accounting: base cost plus a cost per 512px tile
+IMAGE_BASE_TOKENS = 85
+IMAGE_TILE_TOKENS = 170
+
+# Encodings of in-memory screenshots (bytes have no file to cache next to)
+MEMORY_CACHE_ENTRIES = 128
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+_memory_cache = OrderedDict()
+_memory_lock = threading.Lock()
+
+
+def _file_hash(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _open_image(source):
+    """Open a screenshot given as a file path or as encoded bytes."""
+    return Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+
+
+def _memory_get(key):
+    with _memory_lock:
+        value = _memory_cache.get(key)
+        if value is not None:
+            _memory_cache.move_to_end(key)
+        return value
+
+
+def _memory_set(key, value):
+    with _memory_lock:
+        _memory_cache[key] = value
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > MEMORY_CACHE_ENTRIES:
+            _memory_cache.popitem(last=False)
+
+
+def _memory_key(data, *params):
+    return (hashlib.sha256(data).hexdigest(),) + params
+
+
+def page_screenshot(page_data):
+    """
+    Return the screenshot of a page: its in-memory bytes when the crawler kept
+    them, otherwise the path of an existing screenshot file, otherwise None.
+    """
+    data = page_data.get("screenshot_bytes")
+    if data:
+        return data
+    path = page_data.get("screenshot_path")
+    if path and os.path.exists(path):
+        return path
+    return None
+
+
+def page_form_screenshots(page_data):
+    """
+    Return the form close-up screenshots of a page: in-memory bytes when the
+    crawler kept them, otherwise the paths of existing form screenshot files.
+    """
+    captures = page_data.get("form_screenshot_bytes")
+    if captures:
+        return list(captures)
+    return [path for path in page_data.get("form_screenshot_paths") or [] if os.path.exists(path)]
+
+
+def screenshot_exists(source):
+    if isinstance(source, (bytes, bytearray)):
+        return bool(source)
+    return bool(source) and os.path.exists(source)
+
+
+def screenshot_label(source):
+    """Describe a screenshot source (path or bytes) for log messages."""
+    if isinstance(source, (bytes, bytearray)):
+        return f"in-memory capture ({len(source) // 1024} KB)"
+    return source
+
+
+def optimized_cache_path(screenshot_path, max_dimension=1280, quality=75, format="JPEG"):
+    """
+    Return the cache file for an optimized screenshot.
+
+    The name is keyed by the source's content hash plus the encoding
+    parameters, so a changed screenshot or different settings never reuse a
+    stale encoding.
+    """
+    source_hash = _file_hash(screenshot_path)[:16]
+    directory = os.path.join(os.path.dirname(screenshot_path), CACHE_DIR_NAME)
+    stem = os.path.splitext(os.path.basename(screenshot_path))[0]
+    name = f"{stem}.{source_hash}.{max_dimension}.q{quality}.{format.lower()}"
+    return os.path.join(directory, name)
+
+
+def _encode_image(source, max_dimension, quality, format):
+    """
+    Resize and encode a screenshot (file path or bytes).
+
+    Returns:
+        bytes: The encoded image
+    """
+    # Open the image
+    with _open_image(source) as img:
+        # Check if resizing is needed
+        width, height = img.size
+        should_resize = width > max_dimension or height > max_dimension
+
+        if should_resize:
+            # Calculate new dimensions while preserving aspect ratio
+            if width > height:
+                new_width = max_dimension
+                new_height = int(height * (max_dimension / width))
+            else:
+                new_height = max_dimension
+                new_width = int(width * (max_dimension / height))
+
+            # Resize the image
+            img = img.resize((new_width, new_height), Image.LANCZOS)
+            logger.info(f"Resized image from {width}x{height} to {new_width}x{new_height}")
+
+        if format.upper() == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+
+        # Convert to desired format in memory
+        buffer = io.BytesIO()
+        img.save(buffer, format=format, optimize=True, quality=quality)
+    return buffer.getvalue()
+
+
+def _encode_to_cache(screenshot_path, max_dimension, quality, format):
+    """
+    Resize and encode a screenshot file and write the result to its cache file.
+
+    Runs in worker processes, so it returns the cache path rather than the
+    (large) encoded data.
+
+    Returns:
+        str: Path of the cached encoding, or None on failure
+    """
+    try:
+        cache_path = optimized_cache_path(screenshot_path, max_dimension, quality, format)
+        if os.path.exists(cache_path):
+            return cache_path
+
+        encoded = _encode_image(screenshot_path, max_dimension, quality, format)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # Write then rename so concurrent readers never see a partial file
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(encoded)
+        os.replace(tmp_path, cache_path)
+        return cache_path
+    except Exception as e:
+        logger.error(f"Error optimizing screenshot {screenshot_path}: {str(e)}", exc_info=True)
+        return None
+
+
+def _encoded_screenshot(source, max_dimension, quality, format):
+    """
+    Return the optimized encoding of a screenshot, from its cache when possible.
+
+    Files are cached on disk next to the source; in-memory screenshots in a
+    small in-process LRU.
+
+    Returns:
+        bytes: The encoded image, or None on failure
+    """
+    if isinstance(source, (bytes, bytearray)):
+        key = _memory_key(source, "optimized", max_dimension, quality, format)
+        encoded = _memory_get(key)
+        if encoded is None:
+            try:
+                encoded = _encode_image(source, max_dimension, quality, format)
+            except Exception as e:
+                logger.error(f"Error optimizing in-memory screenshot: {str(e)}", exc_info=True)
+                return None
+            _memory_set(key, encoded)
+        return encoded
+    cache_path = _encode_to_cache(source, max_dimension, quality, format)
+    if not cache_path:
+        return None
+    with open(cache_path, "rb") as f:
+        return f.read()
+
+
+def _to_base64(encoded, format):
+    base64_string = base64.b64encode(encoded).decode("utf-8")
+    logger.info(f"Optimized image: format={format}, size={len(base64_string) // 1024}KB")
+    return base64_string, format.lower()
+
+
+def _read_cached(cache_path, format):
+    with open(cache_path, "rb") as f:
+        return _to_base64(f.read(), format)
+
+
 def optimize_screenshot(
-    screenshot_path,
+    screenshot,
     max_dimension=1280,
     quality=75,
     format="JPEG"
@@ -18,8 +231,12 @@ def optimize_screenshot(
     2. Converting to specified format with quality setting
     3. Returning as base64 string
 
+    The encoded image is cached (next to the source file, see
+    optimized_cache_path, or in memory for screenshot bytes), so the same
+    screenshot is only decoded and re-encoded once.
+
     Args:
-        screenshot_path (str): Path to the screenshot file
+        screenshot (str | bytes): Path to the screenshot file, or its encoded bytes
         max_dimension (int): Maximum width/height in pixels
         quality (int): JPEG quality (1-100)
         format (str): Image format (JPEG, PNG)
@@ -28,42 +245,457 @@ def optimize_screenshot(
         tuple: (base64_string, format_name)
     """
     try:
-        if not os.path.exists(screenshot_path):
-            logger.error(f"Screenshot file not found: {screenshot_path}")
+        if not screenshot_exists(screenshot):
+            logger.error(f"Screenshot file not found: {screenshot}")
             return None, None
 
-        # Open the image
-        with Image.open(screenshot_path) as img:
-            # Check if resizing is needed
-            width, height = img.size
-            should_resize = width > max_dimension or height > max_dimension
+        encoded = _encoded_screenshot(screenshot, max_dimension, quality, format)
+        if encoded is None:
+            return None, None
+        return _to_base64(encoded, format)
+
+    except Exception as e:
+        logger.error(f"Error optimizing screenshot: {str(e)}", exc_info=True)
+        return None, None
+
+
+def estimate_image_tokens(width, height):
+    """
+    Estimate the prompt tokens a high-detail image costs.
+
+    The image is scaled to fit 2048x2048, then its shortest side to 768px,
+    and charged per 512px square it covers.
+    """
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return IMAGE_BASE_TOKENS + IMAGE_TILE_TOKENS * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def dhash(img, hash_size=8):
+    """Return the difference hash of an image (hash_size^2 adjacent-pixel gradient bits)."""
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
 
-            if should_resize:
-                # Calculate new dimensions while preserving aspect ratio
-                if width > height:
-                    new_width = max_dimension
-                    new_height = int(height * (max_dimension / width))
-                else:
-                    new_height = max_dimension
-                    new_width = int(width * (max_dimension / height))
 
-                # Resize the image
-                img = img.resize((new_width, new_height), Image.LANCZOS)
-                logger.info(f"Resized image from {width}x{height} to {new_width}x{new_height}")
+def _dct_matrix(size):
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size))
+    matrix[0] /= np.sqrt(2)
+    return matrix * np.sqrt(2 / size)
 
-            # Convert to desired format in memory
-            buffer = io.BytesIO()
-            img.save(buffer, format=format, optimize=True, quality=quality)
-            buffer.seek(0)
 
-            # Get base64 string
-            base64_string = base64.b64encode(buffer.read()).decode('utf-8')
-            format_lower = format.lower()
+def phash(img, hash_size=8, highfreq_factor=4):
+    """
+    Return the perceptual hash of an image.
+
+    The image is reduced to a (hash_size * highfreq_factor)^2 grayscale
+    thumbnail, transformed with a 2D DCT, and the hash_size^2 lowest
+    frequencies are compared with their median. Unlike dHash it is robust to
+    small content and compression differences.
+    """
+    size = hash_size * highfreq_factor
+    pixels = np.asarray(img.convert("L").resize((size, size), Image.LANCZOS), dtype=np.float64)
+    dct = _dct_matrix(size)
+    low = (dct @ pixels @ dct.T)[:hash_size, :hash_size]
+    bits = (low > np.median(low)).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
 
-            logger.info(f"Optimized image: format={format}, quality={quality}, size={len(base64_string) // 1024}KB")
 
-            return base64_string, format_lower
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def screenshot_phash(screenshot, max_dimension=1280, quality=75, format="JPEG"):
+    """
+    Perceptual hash of a screenshot (path or bytes) plus its size.
 
+    Hashes the cached optimized encoding, so a large PNG is decoded at most
+    once for both hashing and the vision request.
+
+    Returns:
+        tuple: (hash, (width, height)) of the source image, or (None, None) on failure
+    """
+    try:
+        encoded = _encoded_screenshot(screenshot, max_dimension, quality, format)
+        if encoded is None:
+            return None, None
+        with Image.open(io.BytesIO(encoded)) as img:
+            value = phash(img)
+        with _open_image(screenshot) as source:
+            # Reads only the header
+            size = source.size
+        return value, size
     except Exception as e:
-        logger.error(f"Error optimizing screenshot {screenshot_path}: {str(e)}", exc_info=True)
+        logger.error(f"Error hashing screenshot: {str(e)}")
+        return None, None
+
+
+def tiled_cache_dir(screenshot_path, tile_width=1024, tile_height=768, quality=75,
+                    format="JPEG", token_budget=4000, min_stddev=3.0):
+    """Return the cache directory holding a screenshot's tiles for the given settings."""
+    source_hash = _file_hash(screenshot_path)[:16]
+    stem = os.path.splitext(os.path.basename(screenshot_path))[0]
+    name = (f"{stem}.{source_hash}.tiles.{tile_width}x{tile_height}.q{quality}"
+            f".b{token_budget}.s{min_stddev:g}.{format.lower()}")
+    return os.path.join(os.path.dirname(screenshot_path), CACHE_DIR_NAME, name)
+
+
+def _tile_image(source, tile_width, tile_height, quality, format,
+                token_budget, min_stddev, max_duplicate_distance=4):
+    """
+    Slice a screenshot (path or bytes) into viewport-height tiles and keep the informative ones.
+
+    The page is scaled to tile_width and cut top to bottom. Tiles whose
+    grayscale standard deviation is below min_stddev (blank areas) or whose
+    dHash is within max_duplicate_distance bits of a kept tile (repeated
+    sections) are dropped; tiles stop once token_budget would be exceeded.
+
+    Returns:
+        list: (index, encoded bytes) per kept tile in page order
+    """
+    kept, hashes = [], []
+    dropped = {"blank": 0, "duplicate": 0, "over_budget": 0}
+    tokens_used = 0
+
+    def encode(tile):
+        buffer = io.BytesIO()
+        tile.save(buffer, format=format, optimize=True, quality=quality)
+        return buffer.getvalue()
+
+    with _open_image(source) as img:
+        img = img.convert("RGB")
+        width, height = img.size
+        if width > tile_width:
+            height = int(height * (tile_width / width))
+            width = tile_width
+            img = img.resize((width, height), Image.LANCZOS)
+
+        tops = list(range(0, height, tile_height))
+        for index, top in enumerate(tops):
+            tile = img.crop((0, top, width, min(top + tile_height, height)))
+            gray = tile.convert("L")
+            if ImageStat.Stat(gray).stddev[0] < min_stddev:
+                dropped["blank"] += 1
+                continue
+            tile_hash = dhash(gray)
+            if any(hamming_distance(tile_hash, h) <= max_duplicate_distance for h in hashes):
+                dropped["duplicate"] += 1
+                continue
+            tokens = estimate_image_tokens(*tile.size)
+            if kept and tokens_used + tokens > token_budget:
+                dropped["over_budget"] = len(tops) - index
+                break
+            kept.append((index, encode(tile)))
+            hashes.append(tile_hash)
+            tokens_used += tokens
+
+        if not kept:
+            # A blank page still gets its first tile so the model sees something
+            kept.append((0, encode(img.crop((0, 0, width, min(tile_height, height))))))
+
+    logger.info(f"Tiled screenshot: kept {len(kept)} tiles (~{tokens_used} tokens), dropped {dropped}")
+    return kept
+
+
+def _tile_to_cache(screenshot_path, tile_width, tile_height, quality, format,
+                   token_budget, min_stddev):
+    """
+    Tile a screenshot file and cache the kept tiles next to it.
+
+    Returns:
+        list: Paths of the cached tiles in page order, or None on failure
+    """
+    try:
+        cache_dir = tiled_cache_dir(screenshot_path, tile_width, tile_height, quality,
+                                    format, token_budget, min_stddev)
+        manifest_path = os.path.join(cache_dir, "tiles.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                return [os.path.join(cache_dir, name) for name in json.load(f)["tiles"]]
+
+        tiles = _tile_image(screenshot_path, tile_width, tile_height, quality,
+                            format, token_budget, min_stddev)
+        os.makedirs(cache_dir, exist_ok=True)
+        names = []
+        for index, encoded in tiles:
+            name = f"{index:03d}.{format.lower()}"
+            with open(os.path.join(cache_dir, name), "wb") as f:
+                f.write(encoded)
+            names.append(name)
+        # Manifest last, so a directory without one is never treated as complete
+        tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"tiles": names}, f)
+        os.replace(tmp_path, manifest_path)
+        return [os.path.join(cache_dir, name) for name in names]
+    except Exception as e:
+        logger.error(f"Error tiling screenshot {screenshot_path}: {str(e)}", exc_info=True)
+        return None
+
+
+def _read_tiles(tile_paths, format):
+    tiles = []
+    for path in tile_paths:
+        with open(path, "rb") as f:
+            tiles.append((base64.b64encode(f.read()).decode("utf-8"), format.lower()))
+    return tiles
+
+
+def _tiles_to_base64(tiles, format):
+    return [(base64.b64encode(encoded).decode("utf-8"), format.lower()) for _, encoded in tiles]
+
+
+def tile_screenshot(
+    screenshot,
+    tile_width=1024,
+    tile_height=768,
+    quality=75,
+    format="JPEG",
+    token_budget=4000,
+    min_stddev=3.0
+):
+    """
+    Split a tall screenshot into informative, model-friendly tiles.
+
+    Unlike optimize_screenshot the page is not shrunk to fit max_dimension,
+    so text on long pages stays readable. Tiles are cached next to the source
+    file, or in memory for screenshot bytes.
+
+    Args:
+        screenshot (str | bytes): Path to the screenshot file, or its encoded bytes
+        tile_width (int): Width the page is scaled down to (if wider)
+        tile_height (int): Height of each tile (one viewport)
+        quality (int): JPEG quality (1-100)
+        format (str): Image format (JPEG, PNG)
+        token_budget (int): Maximum estimated image tokens for the page
+        min_stddev (float): Tiles with less grayscale variation count as blank
+
+    Returns:
+        list: (base64_string, format_name) per tile in page order; empty on failure
+    """
+    if not screenshot_exists(screenshot):
+        logger.error(f"Screenshot file not found: {screenshot}")
+        return []
+    params = (tile_width, tile_height, quality, format, token_budget, min_stddev)
+    if isinstance(screenshot, (bytes, bytearray)):
+        key = _memory_key(screenshot, "tiles", *params)
+        tiles = _memory_get(key)
+        if tiles is None:
+            try:
+                tiles = _tile_image(screenshot, *params)
+            except Exception as e:
+                logger.error(f"Error tiling in-memory screenshot: {str(e)}", exc_info=True)
+                return []
+            _memory_set(key, tiles)
+        return _tiles_to_base64(tiles, format)
+    tile_paths = _tile_to_cache(screenshot, *params)
+    return _read_tiles(tile_paths, format) if tile_paths else []
+
+
+async def _run_in_pool(func, *args, max_workers=None):
+    """
+    Run func in a worker process; only when the pool cannot be used (not
+    created, or broken by a dying worker) does it run in a thread instead.
+    Exceptions raised by func itself propagate.
+    """
+    pool = _get_process_pool(max_workers)
+    if pool is not None:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+        except BrokenProcessPool as e:
+            _discard_process_pool(pool, e)
+    return await asyncio.to_thread(func, *args)
+
+
+async def tile_screenshot_async(
+    screenshot,
+    tile_width=1024,
+    tile_height=768,
+    quality=75,
+    format="JPEG",
+    token_budget=4000,
+    min_stddev=3.0,
+    max_workers=None
+):
+    """Tile a screenshot (path or bytes) in a worker process without blocking the event loop."""
+    if not screenshot_exists(screenshot):
+        logger.error(f"Screenshot file not found: {screenshot}")
+        return []
+    params = (tile_width, tile_height, quality, format, token_budget, min_stddev)
+    if isinstance(screenshot, (bytes, bytearray)):
+        key = _memory_key(screenshot, "tiles", *params)
+        tiles = _memory_get(key)
+        if tiles is None:
+            try:
+                tiles = await _run_in_pool(_tile_image, screenshot, *params, max_workers=max_workers)
+            except Exception as e:
+                logger.error(f"Error tiling in-memory screenshot: {str(e)}", exc_info=True)
+                return []
+            _memory_set(key, tiles)
+        return _tiles_to_base64(tiles, format)
+    tile_paths = await _run_in_pool(_tile_to_cache, screenshot, *params, max_workers=max_workers)
+    if not tile_paths:
+        return []
+    return await asyncio.to_thread(_read_tiles, tile_paths, format)
+
+
+def _get_process_pool(max_workers=None):
+    """
+    Return the shared worker pool, or None if processes cannot be started.
+
+    The pool is sized by its first caller and then shared as is: replacing it
+    for another max_workers would cancel the tasks other callers have on it.
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            try:
+                _process_pool = ProcessPoolExecutor(max_workers=max_workers or None)
+            except (OSError, NotImplementedError) as e:
+                logger.warning(f"Process pool unavailable for screenshot processing: {e}")
+                return None
+        return _process_pool
+
+
+def _discard_process_pool(pool, error):
+    """Drop a broken pool so the next caller starts a fresh one."""
+    global _process_pool
+    logger.warning(f"Screenshot worker pool broke, running in a thread instead: {error}")
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False)
+
+
+def shutdown_process_pool():
+    """Stop the worker processes used for screenshot optimization."""
+    global _process_pool
+    with _process_pool_lock:
+        pool, _process_pool = _process_pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+def _map_in_pool(func, paths, args, max_workers=None):
+    """
+    Run func(path, *args) for each path in worker processes; paths the pool
+    cannot process (not available, or broken) run serially.
+    """
+    pool = _get_process_pool(max_workers)
+    results = {}
+    if pool is not None:
+        try:
+            futures = {path: pool.submit(func, path, *args) for path in paths}
+            for path, future in futures.items():
+                results[path] = future.result()
+        except BrokenProcessPool as e:
+            _discard_process_pool(pool, e)
+    return {path: results[path] if path in results else func(path, *args) for path in paths}
+
+
+def optimize_screenshots_batch(
+    screenshot_paths,
+    max_dimension=1280,
+    quality=75,
+    format="JPEG",
+    max_workers=None
+):
+    """
+    Optimize many screenshots in parallel worker processes.
+
+    Decoding and resizing large full-page PNGs is CPU bound, so images that
+    are not cached yet are encoded in a ProcessPoolExecutor and written to the
+    cache; later optimize_screenshot calls for them are cache reads.
+
+    Args:
+        screenshot_paths (list): Screenshot files to optimize
+        max_dimension (int): Maximum width/height in pixels
+        quality (int): JPEG quality (1-100)
+        format (str): Image format (JPEG, PNG)
+        max_workers (int): Worker processes (default: CPU count)
+
+    Returns:
+        dict: {screenshot_path: (base64_string, format_name)}; failures map to (None, None)
+    """
+    paths = [p for p in dict.fromkeys(screenshot_paths) if p and os.path.exists(p)]
+    results = {}
+    if not paths:
+        return results
+
+    cache_paths = _map_in_pool(_encode_to_cache, paths, (max_dimension, quality, format), max_workers)
+    for path, cache_path in cache_paths.items():
+        results[path] = _read_cached(cache_path, format) if cache_path else (None, None)
+    logger.info(f"Optimized {len(paths)} screenshots")
+    return results
+
+
+def tile_screenshots_batch(
+    screenshot_paths,
+    tile_width=1024,
+    tile_height=768,
+    quality=75,
+    format="JPEG",
+    token_budget=4000,
+    min_stddev=3.0,
+    max_workers=None
+):
+    """
+    Tile many screenshots in parallel worker processes (see tile_screenshot).
+
+    Returns:
+        dict: {screenshot_path: [cached tile paths]}; failures map to []
+    """
+    paths = [p for p in dict.fromkeys(screenshot_paths) if p and os.path.exists(p)]
+    if not paths:
+        return {}
+    args = (tile_width, tile_height, quality, format, token_budget, min_stddev)
+    tile_paths = _map_in_pool(_tile_to_cache, paths, args, max_workers)
+    logger.info(f"Tiled {len(paths)} screenshots")
+    return {path: tiles or [] for path, tiles in tile_paths.items()}
+
+
+async def optimize_screenshot_async(
+    screenshot,
+    max_dimension=1280,
+    quality=75,
+    format="JPEG",
+    max_workers=None
+):
+    """
+    Optimize a screenshot (path or bytes) in a worker process without blocking the event loop.
+
+    Returns:
+        tuple: (base64_string, format_name)
+    """
+    if not screenshot_exists(screenshot):
+        logger.error(f"Screenshot file not found: {screenshot}")
+        return None, None
+    if isinstance(screenshot, (bytes, bytearray)):
+        key = _memory_key(screenshot, "optimized", max_dimension, quality, format)
+        encoded = _memory_get(key)
+        if encoded is None:
+            try:
+                encoded = await _run_in_pool(_encode_image, screenshot, max_dimension, quality, format,
+                                             max_workers=max_workers)
+            except Exception as e:
+                logger.error(f"Error optimizing in-memory screenshot: {str(e)}", exc_info=True)
+                return None, None
+            _memory_set(key, encoded)
+        return _to_base64(encoded, format)
+    cache_path = await _run_in_pool(_encode_to_cache, screenshot, max_dimension, quality, format,
+                                    max_workers=max_workers)
+    if not cache_path:
         return None, None
+    return await asyncio.to_thread(_read_cached, cache_path, format)
@@ -1,11 +1,46 @@
 import os
+import gzip
 import logging
 import urllib.parse
-from datetime import datetime
-from typing import List, Dict, Any, Optional
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Union
+from core.url_filter import UrlFilter
 
 logger = logging.getLogger(__name__)
 
+GZIP_MAGIC = b"\x1f\x8b"
+SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+SITEMAP_FIELDS = ("lastmod", "changefreq", "priority")
+
+
+def _sitemap_name(tag: str) -> Optional[str]:
+    """
+    Name of a sitemap protocol element ("{ns}url" -> "url"), or None for
+    elements of other namespaces (image:loc, video:loc, news:..., etc.).
+    """
+    if tag.startswith("{"):
+        namespace, name = tag[1:].split("}", 1)
+        return name if namespace == SITEMAP_NS else None
+    return tag
+
+
+def parse_lastmod(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a sitemap lastmod (W3C datetime: "2024-05-01", "2024-05-01T10:00:00Z", ...)
+    into a UNIX timestamp, or None if it is missing or malformed. Values
+    without a timezone are taken as UTC.
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
 class SitemapLoader:
     """
     Loads pre-generated sitemaps from external sources and makes them available
@@ -18,82 +53,214 @@ class SitemapLoader:
         Args:
             config: Configuration object
         """
-        from config.config import Config
-        self.config = config or Config()
+        self._config = config
+
+    @property
+    def config(self):
+        # Loaded on first use: streaming and filtering do not need the framework configuration
+        if self._config is None:
+            from config.config import Config
+            self._config = Config()
+        return self._config
 
     def load_sitemap_from_file(self, file_path: str) -> List[str]:
         """
         Load URLs from a pre-generated sitemap file.
 
+        Accepts plain-text files (one URL per line), sitemap.xml, sitemap
+        index files and gzipped variants of each; see iter_sitemap.
+
         Args:
             file_path: Path to the sitemap file
 
         Returns:
             List of URLs from the sitemap
         """
+        urls = [entry["url"] for entry in self.load_sitemap_entries(file_path)]
+        return urls
+
+    def load_sitemap_entries(self, file_path: str) -> List[Dict[str, Any]]:
+        """
+        Load sitemap entries (url, lastmod, changefreq, priority) from a file.
+
+        Args:
+            file_path: Path to the sitemap file
+
+        Returns:
+            List of entry dictionaries
+        """
         try:
             logger.info(f"Loading sitemap from {file_path}")
 
             if not os.path.exists(file_path):
                 raise FileNotFoundError(f"Sitemap file not found: {file_path}")
 
-            with open(file_path, 'r', encoding='utf-8') as f:
-                urls = [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
-
-            logger.info(f"Loaded {len(urls)} URLs from sitemap file")
-            return urls
+            entries = list(self.iter_sitemap(file_path))
+            logger.info(f"Loaded {len(entries)} URLs from sitemap file")
+            return entries
 
         except Exception as e:
             logger.error(f"Error loading sitemap from file: {str(e)}")
             raise
 
-    def filter_urls(self, urls: List[str], base_url: Optional[str] = None,
-                   include_patterns: Optional[List[str]] = None,
-                   exclude_patterns: Optional[List[str]] = None) -> List[str]:
+    def iter_sitemap(self, file_path: str, _seen: Optional[set] = None) -> Iterator[Dict[str, Any]]:
         """
-        Filter URLs from the sitemap based on patterns.
+        Lazily yield the entries of a sitemap file.
 
-        Args:
-            urls: List of URLs to filter
-            base_url: Base URL to restrict to (optional)
-            include_patterns: URL patterns to include (optional)
-            exclude_patterns: URL patterns to exclude (optional)
+        XML sitemaps are parsed incrementally (iterparse) and each element is
+        released once read, so memory stays flat for 50k-URL files. Sitemap
+        indexes are followed into the child sitemaps that exist locally: a
+        <loc> is resolved as a path, relative to the index file, or by the
+        file name of its URL next to the index file. Gzip is detected from
+        the file content. Only sitemap-namespace (or unqualified) children
+        of <url>/<sitemap> are read, so image, video and news extension
+        tags never override the page's own <loc>.
 
-        Returns:
-            Filtered list of URLs
+        Yields:
+            dict: {"url", "lastmod", "changefreq", "priority"}; metadata is
+            None where the sitemap does not provide it
         """
-        filtered_urls = []
+        seen = _seen if _seen is not None else set()
+        real_path = os.path.realpath(file_path)
+        if real_path in seen:
+            return
+        seen.add(real_path)
 
-        for url in urls:
-            # Skip empty URLs
-            if not url:
+        with self._open_sitemap(file_path) as f:
+            head = f.peek(64)[:64] if hasattr(f, "peek") else b""
+            if not head.lstrip(b"\xef\xbb\xbf \t\r\n").startswith(b"<"):
+                for line in f:
+                    url = line.decode("utf-8", errors="replace").strip()
+                    if url and not url.startswith("#"):
+                        yield {"url": url, "lastmod": None, "changefreq": None, "priority": None}
+                return
+
+            children = []
+            record = {}
+            # Depth of the open <url>/<sitemap>; only its direct children are read
+            depth = 0
+            entry_depth = None
+            context = ET.iterparse(f, events=("start", "end"))
+            root = None
+            for event, elem in context:
+                name = _sitemap_name(elem.tag)
+                if event == "start":
+                    depth += 1
+                    if root is None:
+                        root = elem
+                    if name in ("url", "sitemap") and entry_depth is None:
+                        record = {}
+                        entry_depth = depth
+                    continue
+                depth -= 1
+                if entry_depth is None:
+                    continue
+                if depth == entry_depth and (name == "loc" or name in SITEMAP_FIELDS):
+                    record[name] = (elem.text or "").strip() or None
+                elif depth == entry_depth - 1 and name in ("url", "sitemap"):
+                    entry_depth = None
+                    if record.get("loc"):
+                        if name == "url":
+                            yield self._entry(record)
+                        else:
+                            children.append(record["loc"])
+                    root.clear()
+
+        for loc in children:
+            child = self._resolve_child_sitemap(loc, file_path)
+            if child is None:
+                logger.warning(f"Skipping sitemap {loc}: not found next to {file_path}")
                 continue
+            logger.info(f"Following sitemap index entry {child}")
+            yield from self.iter_sitemap(child, seen)
+
+    @staticmethod
+    def _entry(record: Dict[str, Optional[str]]) -> Dict[str, Any]:
+        priority = record.get("priority")
+        try:
+            priority = float(priority) if priority is not None else None
+        except ValueError:
+            priority = None
+        return {
+            "url": record["loc"],
+            "lastmod": record.get("lastmod"),
+            "changefreq": record.get("changefreq"),
+            "priority": priority,
+        }
+
+    @staticmethod
+    def _open_sitemap(file_path: str):
+        """Open a sitemap as a binary stream, transparently decompressing gzip."""
+        with open(file_path, "rb") as f:
+            gzipped = f.read(2) == GZIP_MAGIC
+        if gzipped:
+            return gzip.open(file_path, "rb")
+        return open(file_path, "rb")
 
-            # Check if URL belongs to base domain
-            if base_url and not url.startswith(base_url):
+    @staticmethod
+    def _resolve_child_sitemap(loc: str, index_path: str) -> Optional[str]:
+        base_dir = os.path.dirname(os.path.abspath(index_path))
+        parsed = urllib.parse.urlparse(loc)
+        if parsed.scheme in ("http", "https"):
+            candidates = [os.path.join(base_dir, os.path.basename(parsed.path))]
+        else:
+            path = parsed.path if parsed.scheme == "file" else loc
+            candidates = [path, os.path.join(base_dir, path)]
+        for candidate in candidates:
+            if candidate and os.path.isfile(candidate):
+                return candidate
+        return None
+
+    def changed_entries(self, entries, page_index) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the entries that need new tests: those without a usable lastmod
+        and those modified after their tests were last generated (see
+        PageIndex.generated_since). Unchanged URLs are skipped without being
+        fetched.
+        """
+        skipped = 0
+        for entry in entries:
+            modified = parse_lastmod(entry.get("lastmod"))
+            if modified is not None and page_index.generated_since(entry["url"], modified):
+                skipped += 1
                 continue
+            yield entry
+        logger.info(f"Skipped {skipped} sitemap URLs unchanged since their tests were generated")
 
-            # Check include patterns
-            if include_patterns:
-                if not any(pattern in url for pattern in include_patterns):
-                    continue
+    def filter_urls(self, urls: Iterable[str], base_url: Optional[str] = None,
+                   include_patterns: Optional[List[str]] = None,
+                   exclude_patterns: Optional[List[str]] = None,
+                   sample_limit: Optional[int] = None) -> List[str]:
+        """
+        Filter URLs from the sitemap based on patterns, dropping URLs that
+        normalize to one already kept (fragments, trailing slashes, etc.).
 
-            # Check exclude patterns
-            if exclude_patterns:
-                if any(pattern in url for pattern in exclude_patterns):
-                    continue
+        Patterns are UrlFilter rules: plain strings match as substrings, and
+        "prefix:", "glob:" and "re:" select path-prefix, glob and regex rules;
+        "@K" after an include rule keeps at most K URLs for it.
 
-            filtered_urls.append(url)
+        Args:
+            urls: URLs to filter (any iterable, e.g. a sitemap stream)
+            base_url: Base URL to restrict to (optional)
+            include_patterns: URL patterns to include (optional)
+            exclude_patterns: URL patterns to exclude (optional)
+            sample_limit: Keep at most this many URLs per include pattern (optional)
 
-        logger.info(f"Filtered {len(urls)} URLs down to {len(filtered_urls)} URLs")
+        Returns:
+            Filtered list of URLs
+        """
+        url_filter = UrlFilter(include_patterns, exclude_patterns, base_url=base_url, sample_limit=sample_limit)
+        filtered_urls = list(url_filter.filter(urls))
+        logger.info(f"Filtered {url_filter.stats['seen']} URLs down to {len(filtered_urls)} URLs")
         return filtered_urls
 
-    def prepare_sitemap_for_testing(self, urls: List[str], output_dir: Optional[str] = None) -> Dict[str, Dict]:
+    def prepare_sitemap_for_testing(self, urls: List[Union[str, Dict[str, Any]]],
+                                    output_dir: Optional[str] = None) -> Dict[str, Dict]:
         """
         Prepare a sitemap dictionary for the test generator.
 
         Args:
-            urls: List of URLs to include in the sitemap
+            urls: URLs, or sitemap entries whose lastmod/changefreq/priority are kept
             output_dir: Directory to save prepared sitemap data
 
         Returns:
@@ -103,9 +270,10 @@ class SitemapLoader:
         os.makedirs(output_dir, exist_ok=True)
 
         sitemap = {}
-        timestamp = datetime.now().strftime("%Y-%m-%d")
 
-        for url in urls:
+        for item in urls:
+            entry = item if isinstance(item, dict) else {"url": item}
+            url = entry["url"]
             # Create a safe filename from URL
             safe_filename = url.replace("https://", "").replace("http://", "").replace("/", "_")
             if not safe_filename:
@@ -120,8 +288,9 @@ class SitemapLoader:
             sitemap[url] = {
                 "url": url,
                 "title": page_title,
-                "lastmod": timestamp,
-                "changefreq": "weekly"
+                "lastmod": entry.get("lastmod"),
+                "changefreq": entry.get("changefreq"),
+                "priority": entry.get("priority"),
             }
 
         # Save the prepared sitemap
@@ -132,3 +301,30 @@ class SitemapLoader:
 
         logger.info(f"Prepared sitemap with {len(sitemap)} URLs, saved to {sitemap_path}")
         return sitemap
+
+
+def main(argv=None):
+    """Stream the filtered URLs of a sitemap file to stdout (used by sitemap_to_tests.sh)."""
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Filter the URLs of a sitemap file")
+    parser.add_argument("sitemap_file", help="Text, XML, sitemap index or gzipped sitemap")
+    parser.add_argument("--base-url", default=None, help="Keep only URLs starting with this prefix")
+    parser.add_argument("--include", action="append", default=[], help="Include rule ([substr|prefix|glob|re:]pattern[@K])")
+    parser.add_argument("--exclude", action="append", default=[], help="Exclude rule")
+    parser.add_argument("--sample", type=int, default=None, help="At most this many URLs per include rule")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many URLs")
+    args = parser.parse_args(argv)
+
+    loader = SitemapLoader()
+    url_filter = UrlFilter(args.include, args.exclude, base_url=args.base_url, sample_limit=args.sample)
+    urls = url_filter.filter(entry["url"] for entry in loader.iter_sitemap(args.sitemap_file))
+    for count, url in enumerate(urls, 1):
+        sys.stdout.write(url + "\n")
+        if args.limit and count >= args.limit:
+            break
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import json
+import re
+from typing import Any, Dict, List
+
+# One structured-output response carries the page analysis and the test files
+TEST_SCRIPT_FIELDS = ("feature_file", "step_definitions", "page_object")
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+
+TEST_SCRIPT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "key_elements": _STRING_LIST,
+        "unique_identifiers": _STRING_LIST,
+        "smoke_test_steps": _STRING_LIST,
+        # Strict schemas cannot have free-form keys, so locators are pairs
+        "locator_strategies": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"element": {"type": "string"}, "locator": {"type": "string"}},
+                "required": ["element", "locator"],
+                "additionalProperties": False,
+            },
+        },
+        "feature_file": {"type": "string"},
+        "step_definitions": {"type": "string"},
+        "page_object": {"type": "string"},
+    },
+    "required": ["key_elements", "unique_identifiers", "smoke_test_steps", "locator_strategies",
+                 "feature_file", "step_definitions", "page_object"],
+    "additionalProperties": False,
+}
+
+_FENCE = re.compile(r"^\s*```[\w-]*\s*\n?|\n?\s*```\s*$")
+_GHERKIN_STEP = re.compile(r"^\s*(Given|When|Then|And|But)\s+\S", re.MULTILINE)
+_JAVA_STEP_ANNOTATION = re.compile(r"@(Given|When|Then|And|But)\s*\(")
+_JAVA_CLASS = re.compile(r"\bclass\s+\w+")
+# String/char literals and comments, removed before counting braces
+_JAVA_NON_CODE = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|//[^\n]*|/\*.*?\*/', re.DOTALL)
+
+
+def test_script_response_format(name: str = "smoke_test_script") -> Dict[str, Any]:
+    """response_format argument of a chat completion returning TEST_SCRIPT_SCHEMA."""
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": TEST_SCRIPT_SCHEMA}}
+
+
+def strip_code_fence(text: str) -> str:
+    """Remove a markdown code fence wrapped around a generated file."""
+    return _FENCE.sub("", text).strip() if isinstance(text, str) else text
+
+
+def parse_test_script(content: str) -> Any:
+    """Parse a structured-output response; generated files lose any code fences."""
+    data = json.loads(content)
+    if isinstance(data, dict):
+        for field in TEST_SCRIPT_FIELDS:
+            if isinstance(data.get(field), str):
+                data[field] = strip_code_fence(data[field])
+    return data
+
+
+def _balanced_braces(code: str) -> bool:
+    depth = 0
+    for char in _JAVA_NON_CODE.sub("", code):
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth < 0:
+                return False
+    return depth == 0
+
+
+def validate_test_script(data: Any, language: str = "java") -> List[str]:
+    """
+    Check a parsed single-pass response without calling the LLM.
+
+    Returns:
+        list: Problems found; empty when the feature file, step definitions
+        and page object are usable
+    """
+    if not isinstance(data, dict):
+        return ["response is not a JSON object"]
+    problems = []
+    for field in TEST_SCRIPT_SCHEMA["required"]:
+        expected = str if field in TEST_SCRIPT_FIELDS else list
+        if not isinstance(data.get(field), expected):
+            problems.append(f"{field} is missing or not a {expected.__name__}")
+    if problems:
+        return problems
+
+    feature = data["feature_file"]
+    if not re.search(r"^\s*Feature:", feature, re.MULTILINE):
+        problems.append("feature_file has no Feature: line")
+    if not re.search(r"^\s*Scenario( Outline)?:", feature, re.MULTILINE):
+        problems.append("feature_file has no scenario")
+    if not _GHERKIN_STEP.search(feature):
+        problems.append("feature_file has no Given/When/Then steps")
+
+    steps, page_object = data["step_definitions"], data["page_object"]
+    if not steps.strip():
+        problems.append("step_definitions is empty")
+    if not page_object.strip():
+        problems.append("page_object is empty")
+    if language == "java":
+        if not _JAVA_STEP_ANNOTATION.search(steps):
+            problems.append("step_definitions has no Cucumber step annotations")
+        if not _JAVA_CLASS.search(page_object):
+            problems.append("page_object declares no class")
+        for field in ("step_definitions", "page_object"):
+            if not _balanced_braces(data[field]):
+                problems.append(f"{field} has unbalanced braces")
+    return problems
+
+
+def locator_map(pairs: List[Dict[str, str]]) -> Dict[str, str]:
+    """Turn the schema's locator pairs into the analysis' {element: locator} dict."""
+    return {pair["element"]: pair["locator"] for pair in pairs
+            if isinstance(pair, dict) and pair.get("element") and pair.get("locator")}
@@ -5,7 +5,10 @@ import os
 import json
 import logging
 from config.config import Config
+from core.batch_jobs import BatchDeferred
+from core.clustering import cluster_pages, scenario_outline
 from core.llm_analyzer import LLMAnalyzer
+from core.screenshot_utils import page_screenshot, screenshot_label
 from core.utils.path_utils import ensure_directory_exists, normalize_path
 
 logger = logging.getLogger(__name__)
@@ -34,6 +37,7 @@ class TestGenerator:
         framework="cucumber",
         language="java",
         use_vision=False,
+        cluster_templates=False,
     ):
         """
         Generate test scripts for discovered pages.
@@ -45,6 +49,8 @@ class TestGenerator:
             framework (str): Test framework to generate for
             language (str): Programming language to use
             use_vision (bool): Whether to use vision-enhanced analysis
+            cluster_templates (bool): Analyze one page per DOM template and run its
+                feature as a Scenario Outline over the template's other URLs
 
         Returns:
             dict: Dictionary of generated test files
@@ -78,10 +84,34 @@ class TestGenerator:
             logger.error("No page data provided")
             return {}
 
+        # Analyze one representative per page template; the rest go into its Examples table
+        pages_to_process = all_pages
+        cluster_urls = {}
+        if cluster_templates:
+            clusters = cluster_pages(all_pages, threshold=self.config.TEMPLATE_SIMILARITY_THRESHOLD)
+            cluster_urls = {cluster.representative: cluster.urls for cluster in clusters}
+            pages_to_process = {url: all_pages[url] for url in cluster_urls}
+
+        # Small pages taking the standard (text-only) analysis share batched requests
+        batched_analyses = {}
+        # A batch job (batch_requests set) already bundles every request
+        if (self.config.ANALYSIS_BATCH_SIZE > 1 and not self.config.SINGLE_PASS_GENERATION
+                and self.llm_analyzer.batch_requests is None):
+            batched = [
+                (url, page_data) for url, page_data in pages_to_process.items()
+                if "analysis" not in page_data and not (use_vision and page_screenshot(page_data) is not None)
+                and (discovered_pages_data is not None or all(key in page_data for key in ["url", "title"]))
+            ]
+            if len(batched) > 1:
+                analyses = self.llm_analyzer.analyze_pages([page_data for _, page_data in batched])
+                batched_analyses = {url: analysis for (url, _), analysis in zip(batched, analyses)}
+                logger.info(f"Batched analysis: {self.llm_analyzer.batch_stats}")
+
         # Generate tests for each page
         successful_pages = 0
         failed_pages = 0
-        for url, page_data in all_pages.items():
+        deferred_pages = 0
+        for url, page_data in pages_to_process.items():
             try:
                 # Skip if page data is incomplete (unless it's pre-analyzed data)
                 if discovered_pages_data is None and not all(key in page_data for key in ["url", "title"]):
@@ -90,87 +120,105 @@ class TestGenerator:
 
                 logger.info(f"Generating tests for {url}")
 
-                # If this is pre-analyzed data, use it directly
-                if discovered_pages_data:
-                    # Check if we already have analysis data embedded in the page data
-                    if "analysis" in page_data:
-                        logger.info(f"Using pre-generated analysis for {url}")
-                        page_analysis = page_data["analysis"]
+                # Single pass: page features to test files in one structured-output request
+                test_script = None
+                if self.config.SINGLE_PASS_GENERATION and "analysis" not in page_data and "user_flow" not in page_data:
+                    test_script = self.llm_analyzer.generate_test_script_single_pass(
+                        page_data, framework, language,
+                        use_vision=use_vision and page_screenshot(page_data) is not None,
+                    )
+
+                if test_script is None:
+                    # If this is pre-analyzed data, use it directly
+                    if discovered_pages_data:
+                        # Check if we already have analysis data embedded in the page data
+                        if "analysis" in page_data:
+                            logger.info(f"Using pre-generated analysis for {url}")
+                            page_analysis = page_data["analysis"]
+                        else:
+                            # Otherwise check for screenshot and do vision analysis if needed
+                            screenshot = page_screenshot(page_data)
+
+                            if use_vision and screenshot is not None:
+                                logger.info(f"Using vision-enhanced analysis for {url} with screenshot: {screenshot_label(screenshot)}")
+                                try:
+                                    # Use vision-based analysis
+                                    page_analysis = self.llm_analyzer.analyze_page_with_vision(page_data)
+                                    logger.info(f"Vision analysis completed successfully for {url}")
+                                except BatchDeferred:
+                                    raise
+                                except Exception as vision_err:
+                                    logger.error(f"Vision analysis failed for {url}: {str(vision_err)}")
+                                    logger.info(f"Falling back to standard analysis for {url}")
+                                    page_analysis = self.llm_analyzer.analyze_page(page_data)
+                            else:
+                                if use_vision:
+                                    logger.warning(f"Vision analysis requested but screenshot not available for {url}")
+                                logger.info(f"Using standard analysis for {url}")
+                                page_analysis = batched_analyses.get(url) or self.llm_analyzer.analyze_page(page_data)
                     else:
-                        # Otherwise check for screenshot and do vision analysis if needed
-                        has_screenshot = "screenshot_path" in page_data and os.path.exists(page_data["screenshot_path"])
-
-                        if use_vision and has_screenshot:
-                            logger.info(f"Using vision-enhanced analysis for {url} with screenshot: {page_data['screenshot_path']}")
-                            try:
-                                # Use vision-based analysis
-                                page_analysis = self.llm_analyzer.analyze_page_with_vision(page_data)
-                                logger.info(f"Vision analysis completed successfully for {url}")
-                            except Exception as vision_err:
-                                logger.error(f"Vision analysis failed for {url}: {str(vision_err)}")
-                                logger.info(f"Falling back to standard analysis for {url}")
-                                page_analysis = self.llm_analyzer.analyze_page(page_data)
+                        # Otherwise analyze page with LLM
+                        if use_vision and page_screenshot(page_data) is not None:
+                            logger.info(f"Using vision-enhanced analysis for {url}")
+                            page_analysis = self.llm_analyzer.analyze_page_with_vision(page_data)
                         else:
-                            if use_vision:
-                                logger.warning(f"Vision analysis requested but screenshot not available for {url}")
                             logger.info(f"Using standard analysis for {url}")
-                            page_analysis = self.llm_analyzer.analyze_page(page_data)
-                else:
-                    # Otherwise analyze page with LLM
-                    if use_vision and "screenshot_path" in page_data and os.path.exists(page_data["screenshot_path"]):
-                        logger.info(f"Using vision-enhanced analysis for {url}")
-                        page_analysis = self.llm_analyzer.analyze_page_with_vision(page_data)
-                    else:
-                        logger.info(f"Using standard analysis for {url}")
-                        page_analysis = self.llm_analyzer.analyze_page(page_data)
-
-                # Generate test script with raw page data included for user flow extraction
-                if "user_flow" in page_data:
-                    # Store the raw page data that contains user flow information
-                    page_analysis["raw_page_data"] = page_data
-
-                # Use the raw approach to test generation to avoid JSON parsing issues
-                try:
-                    # Add the url to the analysis if not present
-                    if "url" not in page_analysis:
-                        page_analysis["url"] = url
-
-                    # Add the title to the analysis if not present
-                    if "title" not in page_analysis and "title" in page_data:
-                        page_analysis["title"] = page_data["title"]
-
-                    logger.info(f"Generating raw test script for {url}")
-                    test_script = self.llm_analyzer.generate_test_script_with_retry(
-                        page_analysis,
-                        framework,
-                        max_retries=1
-                    )
-
-                    # Ensure test_script has the minimal required fields
-                    if not all(key in test_script for key in ["feature_file", "step_definitions", "page_object"]):
-                        logger.warning(f"Test script for {url} is missing required fields, creating basic fallback")
-
+                            page_analysis = batched_analyses.get(url) or self.llm_analyzer.analyze_page(page_data)
+
+                    # Generate test script with raw page data included for user flow extraction
+                    if "user_flow" in page_data:
+                        # Store the raw page data that contains user flow information
+                        page_analysis["raw_page_data"] = page_data
+
+                    # Use the raw approach to test generation to avoid JSON parsing issues
+                    try:
+                        # Add the url to the analysis if not present
+                        if "url" not in page_analysis:
+                            page_analysis["url"] = url
+
+                        # Add the title to the analysis if not present
+                        if "title" not in page_analysis and "title" in page_data:
+                            page_analysis["title"] = page_data["title"]
+
+                        logger.info(f"Generating raw test script for {url}")
+                        test_script = self.llm_analyzer.generate_test_script_with_retry(
+                            page_analysis,
+                            framework,
+                            max_retries=1
+                        )
+
+                        # Ensure test_script has the minimal required fields
+                        if not all(key in test_script for key in ["feature_file", "step_definitions", "page_object"]):
+                            logger.warning(f"Test script for {url} is missing required fields, creating basic fallback")
+
+                            # Create a basic fallback
+                            title = page_data.get('title', 'Unknown Page')
+                            test_script = {
+                                "url": url,
+                                "title": title,
+                                "feature_file": f"Feature: Basic test for {title}\n\nScenario: Verify page loads\n  Given I open the url \"{url}\"\n  Then I expect the page title contains \"{title}\"",
+                                "step_definitions": f"// Basic step definitions for {url}",
+                                "page_object": f"// Basic page object for {url}"
+                            }
+                    except BatchDeferred:
+                        raise
+                    except Exception as script_gen_error:
+                        logger.error(f"Failed to generate test script for {url}: {str(script_gen_error)}")
                         # Create a basic fallback
                         title = page_data.get('title', 'Unknown Page')
                         test_script = {
                             "url": url,
                             "title": title,
-                            "feature_file": f"Feature: Basic test for {title}\n\nScenario: Verify page loads\n  Given I open the url \"{url}\"\n  Then I expect the page title contains \"{title}\"",
-                            "step_definitions": f"// Basic step definitions for {url}",
-                            "page_object": f"// Basic page object for {url}"
+                            "error": str(script_gen_error),
+                            "feature_file": f"Feature: Error fallback for {title}\n\nScenario: Verify page loads\n  Given I open the url \"{url}\"\n  Then I expect the page title contains \"{title}\"",
+                            "step_definitions": f"// Error in generation for {url}: {str(script_gen_error)}",
+                            "page_object": f"// Error in generation for {url}: {str(script_gen_error)}"
                         }
-                except Exception as script_gen_error:
-                    logger.error(f"Failed to generate test script for {url}: {str(script_gen_error)}")
-                    # Create a basic fallback
-                    title = page_data.get('title', 'Unknown Page')
-                    test_script = {
-                        "url": url,
-                        "title": title,
-                        "error": str(script_gen_error),
-                        "feature_file": f"Feature: Error fallback for {title}\n\nScenario: Verify page loads\n  Given I open the url \"{url}\"\n  Then I expect the page title contains \"{title}\"",
-                        "step_definitions": f"// Error in generation for {url}: {str(script_gen_error)}",
-                        "page_object": f"// Error in generation for {url}: {str(script_gen_error)}"
-                    }
+
+                members = cluster_urls.get(url, [])
+                if len(members) > 1:
+                    test_script["feature_file"] = scenario_outline(test_script.get("feature_file", ""), url, members)
+                    test_script["cluster_urls"] = members
 
                 # Add to generated tests
                 generated_tests[url] = test_script
@@ -183,6 +231,10 @@ class TestGenerator:
                     logger.error(f"Failed to save test files for {url}: {str(save_error)}")
                     failed_pages += 1
 
+            except BatchDeferred:
+                # Waiting on a batch job's response; the page is written in a later round
+                deferred_pages += 1
+                continue
             except Exception as e:
                 logger.error(f"Unhandled error generating tests for {url}: {str(e)}")
                 failed_pages += 1
@@ -190,6 +242,9 @@ class TestGenerator:
 
         # Log summary of processing
         logger.info(f"Test generation complete: {successful_pages} successful, {failed_pages} failed out of {len(all_pages)} total pages")
+        if deferred_pages:
+            logger.info(f"{deferred_pages} page(s) wait for batch job responses")
+        logger.info(f"LLM token usage: {self.llm_analyzer.usage_summary()}")
 
         # Generate test suite file
         try:
@@ -696,7 +751,8 @@ public class BaseTest {
         language="java",
         use_vision=False,
         max_pages=None,
-        web_crawler=None
+        web_crawler=None,
+        page_index=None
     ):
         """
         Generate tests from a pre-generated sitemap.
@@ -709,6 +765,8 @@ public class BaseTest {
             use_vision: Whether to use vision-enhanced analysis
             max_pages: Maximum number of pages to process
             web_crawler: Optional WebCrawler instance to use
+            page_index: Optional PageIndex; sitemap URLs whose lastmod predates
+                their generated tests are skipped
 
         Returns:
             dict: Dictionary of generated test files
@@ -726,8 +784,10 @@ public class BaseTest {
         if isinstance(sitemap, str):
             # It's a file path
             sitemap_loader = SitemapLoader(self.config)
-            urls = sitemap_loader.load_sitemap_from_file(sitemap)
-            sitemap_data = sitemap_loader.prepare_sitemap_for_testing(urls, os.path.dirname(output_dir))
+            entries = sitemap_loader.iter_sitemap(sitemap)
+            if page_index is not None:
+                entries = sitemap_loader.changed_entries(entries, page_index)
+            sitemap_data = sitemap_loader.prepare_sitemap_for_testing(entries, os.path.dirname(output_dir))
         else:
             # It's already a dictionary
             sitemap_data = sitemap
@@ -0,0 +1,190 @@
+import logging
+import re
+from collections import Counter
+from typing import Iterable, Iterator, Optional, Sequence
+
+from core.frontier import normalize_url
+
+logger = logging.getLogger(__name__)
+
+# "<scheme>://<host>" at the start of a URL; path rules are anchored after it
+_ORIGIN = r"^[A-Za-z][A-Za-z0-9+.-]*://[^/?#]*"
+_LIMIT_SUFFIX = re.compile(r"@(\d+)$")
+RULE_KINDS = ("substr", "prefix", "glob", "re")
+
+
+def glob_to_regex(pattern: str) -> str:
+    """
+    Translate a URL glob into a regex body: "**" matches anything, "*"
+    anything but "/", "?" one character other than "/".
+    """
+    out = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(out)
+
+
+class UrlRule:
+    """
+    One include/exclude rule, written as "[kind:]pattern[@K]".
+
+    Kinds: substr (default; the pattern occurs anywhere in the URL), prefix
+    (the URL path starts with the pattern), glob (the whole path, or the
+    whole URL if the pattern contains "://", matches the glob) and re (a
+    regular expression searched in the URL). "@K" caps the URLs an include
+    rule lets through at K.
+    """
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, sep, pattern = spec.partition(":")
+        if not sep or kind not in RULE_KINDS:
+            kind, pattern = "substr", spec
+        self.limit = None
+        match = _LIMIT_SUFFIX.search(pattern)
+        if match and kind != "re":
+            self.limit = int(match.group(1))
+            pattern = pattern[:match.start()]
+        self.kind = kind
+        self.pattern = pattern
+        self.regex = self._to_regex()
+        re.compile(self.regex)  # Report invalid rules when they are parsed
+
+    def _to_regex(self) -> str:
+        if self.kind == "substr":
+            return re.escape(self.pattern)
+        if self.kind == "prefix":
+            return _ORIGIN + re.escape(self.pattern)
+        if self.kind == "glob":
+            if "://" in self.pattern:
+                return "^" + glob_to_regex(self.pattern) + r"\Z"
+            return _ORIGIN + glob_to_regex(self.pattern) + r"(?:[?#].*)?\Z"
+        return self.pattern
+
+    def __repr__(self) -> str:
+        return f"UrlRule({self.spec!r})"
+
+
+# Flags of a rule pattern without inline flags of its own
+_PLAIN_FLAGS = re.compile("", re.DOTALL).flags
+
+
+class _RuleSet:
+    """
+    Finds the rule a URL matches. Rules are compiled into one alternation
+    whose named group tells which rule matched; a regex rule that cannot
+    share a pattern (groups, backreferences, inline global flags) makes the
+    set fall back to searching the rules one by one, in order.
+    """
+
+    def __init__(self, rules: Sequence[UrlRule]):
+        self.patterns = [re.compile(rule.regex, re.DOTALL) for rule in rules]
+        self.combined = None
+        if all(p.groups == 0 and p.flags == _PLAIN_FLAGS for p in self.patterns):
+            try:
+                self.combined = re.compile(
+                    "|".join(f"(?P<r{i}>{rule.regex})" for i, rule in enumerate(rules)), re.DOTALL)
+            except re.error:
+                self.combined = None
+        if self.combined is None and len(self.patterns) > 1:
+            logger.debug("URL rules matched one by one: a regex rule cannot be combined")
+
+    def search(self, url: str) -> Optional[int]:
+        """Index of the rule matching url, None if none match."""
+        if self.combined is not None:
+            match = self.combined.search(url)
+            return None if match is None else int(match.lastgroup[1:])
+        for index, pattern in enumerate(self.patterns):
+            if pattern.search(url):
+                return index
+        return None
+
+
+class UrlFilter:
+    """
+    Compiled include/exclude filter for large URL lists.
+
+    All include rules are compiled into a single regex and all exclude rules
+    into another, so each URL costs two regex searches however many rules
+    there are (regex rules with groups or inline flags are searched one by
+    one instead). filter() is a generator: URLs stream through and only the
+    normalized keys of kept URLs (for de-duplication) and per-rule counters
+    are held in memory.
+    """
+
+    def __init__(self, include: Optional[Iterable[str]] = None,
+                 exclude: Optional[Iterable[str]] = None,
+                 base_url: Optional[str] = None, sample_limit: Optional[int] = None,
+                 dedupe: bool = True):
+        """
+        Initialize the filter.
+
+        Args:
+            include: Include rules; a URL must match one when any are given
+            exclude: Exclude rules; a URL matching any is dropped
+            base_url: Keep only URLs starting with this prefix
+            sample_limit: Default cap on URLs per include rule (rules' own @K wins)
+            dedupe: Drop URLs that normalize to one already kept
+        """
+        self.include = [UrlRule(spec) for spec in include or []]
+        self.exclude = [UrlRule(spec) for spec in exclude or []]
+        self.base_url = base_url or None
+        self.sample_limit = sample_limit
+        self.dedupe = dedupe
+        self._include = _RuleSet(self.include) if self.include else None
+        self._exclude = _RuleSet(self.exclude) if self.exclude else None
+        self._limits = [rule.limit if rule.limit is not None else sample_limit for rule in self.include]
+        self.stats = {"seen": 0, "kept": 0, "sampled_out": 0, "duplicates": 0}
+
+    def _matched_rule(self, url: str) -> Optional[int]:
+        """Index of the include rule matching url, -1 without include rules, None if none match."""
+        if self._include is None:
+            return -1
+        return self._include.search(url)
+
+    def matches(self, url: str) -> bool:
+        """True if url passes the base URL, exclude and include rules (ignores sampling)."""
+        if not url or (self.base_url and not url.startswith(self.base_url)):
+            return False
+        if self._exclude is not None and self._exclude.search(url) is not None:
+            return False
+        return self._matched_rule(url) is not None
+
+    def filter(self, urls: Iterable[str]) -> Iterator[str]:
+        """Yield the URLs that pass the rules, per-rule sampling and de-duplication."""
+        counts = Counter()
+        seen = set()
+        for url in urls:
+            self.stats["seen"] += 1
+            if not url or (self.base_url and not url.startswith(self.base_url)):
+                continue
+            if self._exclude is not None and self._exclude.search(url) is not None:
+                continue
+            rule = self._matched_rule(url)
+            if rule is None:
+                continue
+            limit = self._limits[rule] if rule >= 0 else self.sample_limit
+            if limit is not None and counts[rule] >= limit:
+                self.stats["sampled_out"] += 1
+                continue
+            if self.dedupe:
+                key = normalize_url(url)
+                if key in seen:
+                    self.stats["duplicates"] += 1
+                    continue
+                seen.add(key)
+            counts[rule] += 1
+            self.stats["kept"] += 1
+            yield url
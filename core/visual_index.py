@@ -0,0 +1,84 @@
+import copy
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+
+
+class VisualAnalysisIndex:
+    """
+    Index of perceptual screenshot hashes to the vision analysis made for them.
+
+    Lookups find any stored hash within max_distance bits (Hamming) of the
+    query. Hashes are split into max_distance + 1 chunks: two hashes within
+    that distance must agree exactly on at least one chunk, so only pages
+    sharing a chunk bucket are compared. Pages whose heights differ by more
+    than size_tolerance never match, which keeps short error shells and long
+    listing pages apart even when their thumbnails look alike.
+    """
+
+    def __init__(self, max_distance: int = 4, size_tolerance: float = 0.05):
+        """
+        Initialize the index.
+
+        Args:
+            max_distance (int): Maximum Hamming distance to reuse an analysis
+            size_tolerance (float): Maximum relative width/height difference
+        """
+        self.max_distance = max(0, min(max_distance, HASH_BITS - 1))
+        self.size_tolerance = size_tolerance
+        self.stats = {"lookups": 0, "hits": 0}
+        self._chunks = self._chunk_bounds(self.max_distance + 1)
+        self._buckets = defaultdict(list)
+        self._entries = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _chunk_bounds(count: int):
+        step = HASH_BITS / count
+        return [(round(i * step), round((i + 1) * step)) for i in range(count)]
+
+    def _keys(self, value: int):
+        for index, (start, end) in enumerate(self._chunks):
+            yield index, (value >> start) & ((1 << (end - start)) - 1)
+
+    def _same_size(self, a: Tuple[int, int], b: Tuple[int, int]) -> bool:
+        return all(abs(x - y) <= self.size_tolerance * max(x, y) for x, y in zip(a, b))
+
+    def lookup(self, value: Optional[int], size: Optional[Tuple[int, int]]) -> Optional[Dict[str, Any]]:
+        """Return a copy of the analysis of a visually matching screenshot, or None."""
+        if value is None or size is None:
+            return None
+        with self._lock:
+            self.stats["lookups"] += 1
+            checked = set()
+            for key in self._keys(value):
+                for entry_id in self._buckets[key]:
+                    if entry_id in checked:
+                        continue
+                    checked.add(entry_id)
+                    stored_value, stored_size, analysis = self._entries[entry_id]
+                    if bin(value ^ stored_value).count("1") <= self.max_distance and self._same_size(size, stored_size):
+                        self.stats["hits"] += 1
+                        return copy.deepcopy(analysis)
+        return None
+
+    def add(self, value: Optional[int], size: Optional[Tuple[int, int]], analysis: Dict[str, Any]) -> None:
+        """Remember the analysis made for a screenshot."""
+        if value is None or size is None or not analysis:
+            return
+        with self._lock:
+            entry_id = len(self._entries)
+            self._entries.append((value, tuple(size), copy.deepcopy(analysis)))
+            for key in self._keys(value):
+                self._buckets[key].append(entry_id)
+
+    def summary(self) -> Dict[str, Any]:
+        """Return lookup/hit counters and the hit rate."""
+        lookups = self.stats["lookups"]
+        hit_rate = self.stats["hits"] / lookups if lookups else 0.0
+        return dict(self.stats, entries=len(self._entries), hit_rate=round(hit_rate, 3))
@@ -11,9 +11,17 @@ from datetime import datetime
 import asyncio
 
 from config.config import Config
+from core.browser_pool import BrowserPool
 from core.crawler import PlaywrightCrawler
 from core.llm_analyzer import LLMAnalyzer
 from core.test_generator import TestGenerator
+from core.clustering import cluster_pages, scenario_outline
+from core.fingerprint import PageIndex
+from core.politeness import HostPolitenessScheduler
+from core.pipeline import (SmokeTestPipeline, analyze_and_generate, batch_analyze, files_already_written, page_meta,
+                           write_test_files_recorded)
+from core.run_ledger import RunLedger
+from core.screenshot_utils import optimize_screenshots_batch, shutdown_process_pool, tile_screenshots_batch
 
 # Configure logging
 logging.basicConfig(
@@ -30,6 +38,33 @@ OUTPUT_DIR = os.getenv("OUTPUT_DIR", "output")
 TESTS_DIR = os.path.join(OUTPUT_DIR, "tests")
 os.makedirs(TESTS_DIR, exist_ok=True)
 
+async def process_page(llm_analyzer, url, page_data, ledger=None, page_index=None, cluster=None,
+                       page_analysis=None):
+    """
+    Analyze one crawled page, generate its test script and save the files.
+
+    cluster maps every page sharing the page's template to its page_meta; the
+    feature is then written as a Scenario Outline over all of them and each
+    page is recorded in the PageIndex against the written files. page_analysis
+    skips the analysis when the page was already analyzed in a batch.
+    """
+    try:
+        if files_already_written(url, ledger):
+            logger.info(f"Skipping {url}: test files already written in this run")
+            return
+        if page_data.get("unchanged"):
+            logger.info(f"Skipping {url}: structure unchanged since its tests were generated")
+            return
+        test_script_info = await analyze_and_generate(llm_analyzer, page_data, ledger, page_analysis)
+        if cluster and len(cluster) > 1:
+            feature = scenario_outline(test_script_info.get("feature_file", ""), url, list(cluster))
+            test_script_info = dict(test_script_info, feature_file=feature, cluster_urls=list(cluster))
+        write_test_files_recorded(url, test_script_info, TESTS_DIR, ledger, page_index, page_meta(page_data),
+                                  members=cluster)
+    except Exception as e:
+        # One failing page must not abort the other pages of the run
+        logger.error(f"Failed to generate tests for {url}: {str(e)}", exc_info=True)
+
 async def main():
     parser = argparse.ArgumentParser(description="LLM Smoke Test Framework (Playwright Edition)")
     parser.add_argument("vision-e2e", help="Run end-to-end vision-based smoke test generation", nargs=1)
@@ -37,62 +72,197 @@ async def main():
     parser.add_argument("--page-only", action="store_true", help="Only generate a test for the initial page (no crawling)")
     parser.add_argument("--site", action="store_true", help="Crawl and generate tests for the entire site (default)")
     parser.add_argument("--max-pages", type=int, default=None, help="Maximum number of pages to crawl and generate tests for")
+    parser.add_argument("--crawl-concurrency", type=int, default=None, help="Number of pages to crawl in parallel (default: CRAWL_CONCURRENCY or 1)")
+    parser.add_argument("--respect-robots", action="store_true", help="Skip URLs disallowed by robots.txt and honor its Crawl-delay")
+    parser.add_argument("--pipeline", action="store_true", help="Stream crawled pages through analysis and file writing while the crawl runs")
+    parser.add_argument("--analysis-workers", type=int, default=None, help="Concurrent analysis workers in --pipeline mode")
+    parser.add_argument("--writer-workers", type=int, default=None, help="Concurrent file writers in --pipeline mode")
+    parser.add_argument("--analysis-batch-size", type=int, default=None, help="Pack up to N small text-only pages into one analysis request (default: ANALYSIS_BATCH_SIZE)")
+    parser.add_argument("--single-pass", action="store_true", help="Generate each page's analysis and test files in one structured-output request")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the on-disk LLM response cache")
+    parser.add_argument("--refresh-cache", action="store_true", help="Ignore cached LLM responses and store fresh ones")
+    parser.add_argument("--incremental", action="store_true", help="Only regenerate tests for pages whose structure changed since the last run")
+    parser.add_argument("--cluster-templates", action="store_true", help="Analyze one page per DOM template and parametrize its feature over the template's other URLs")
+    parser.add_argument("--save-screenshots", action="store_true", help="Save captured screenshots under output/screenshots (kept in memory only by default)")
+    parser.add_argument("--screenshot-mode", choices=["full_page", "viewport", "main"], default=None, help="Screenshot capture: full page, above-the-fold viewport or main content clip (default: SCREENSHOT_MODE)")
+    parser.add_argument("--form-screenshots", action="store_true", help="Also capture a close-up of each visible form for vision analysis")
+    parser.add_argument("--run-id", default=None, help="Identifier for this run in the run ledger (default: generated)")
+    parser.add_argument("--resume", metavar="RUN_ID", default=None, help="Resume an interrupted run, redoing only failed or missing stages")
     args = parser.parse_args()
 
     website_url = args.website_url
     logger.info(f"Starting crawl for: {website_url}")
 
-    llm_analyzer = LLMAnalyzer(Config())
+    config = Config()
+    if args.no_cache:
+        config.LLM_CACHE_ENABLED = False
+    if args.refresh_cache:
+        config.LLM_CACHE_REFRESH = True
+    if args.analysis_batch_size:
+        config.ANALYSIS_BATCH_SIZE = args.analysis_batch_size
+    if args.single_pass:
+        config.SINGLE_PASS_GENERATION = True
+    crawl_concurrency = args.crawl_concurrency or config.CRAWL_CONCURRENCY
+    # The crawler stays on base_url's host, so a per-host cap below the
+    # worker count limits the whole crawl
+    max_per_host = config.CRAWL_MAX_PER_HOST or crawl_concurrency
+    if max_per_host < crawl_concurrency and not args.page_only:
+        logger.warning(
+            f"CRAWL_MAX_PER_HOST={max_per_host} is lower than the crawl concurrency ({crawl_concurrency}); "
+            f"at most {max_per_host} page(s) load at a time"
+        )
+    # One browser for the whole run: crawler workers and the analyzer's
+    # screenshot fallback lease contexts from it
+    browser_pool = BrowserPool(
+        size=config.BROWSER_CONTEXTS or crawl_concurrency + 1,
+        headless=config.HEADLESS,
+        storage_state_path=config.SESSION_STATE_PATH if config.SESSION_REUSE else None,
+    )
+    await browser_pool.start()
+    llm_analyzer = LLMAnalyzer(config, browser_pool=browser_pool)
+    ledger = RunLedger(
+        config.RUN_LEDGER_PATH,
+        config.page_data_path,
+        run_id=args.resume or args.run_id,
+        base_url=website_url,
+        resume=bool(args.resume),
+    )
+    logger.info(f"Run id: {ledger.run_id} (resume with --resume {ledger.run_id})")
+    page_index = PageIndex(config.PAGE_INDEX_PATH)
+    incremental = args.incremental or config.INCREMENTAL_CRAWL
+    crawler_options = dict(
+        capture_screenshots=config.CAPTURE_SCREENSHOTS,
+        block_resources=config.CRAWL_BLOCK_RESOURCES,
+        blocked_resource_types=config.CRAWL_BLOCKED_RESOURCE_TYPES,
+        blocked_hosts=config.CRAWL_BLOCKED_HOSTS,
+        crawl_wait_until=config.CRAWL_WAIT_UNTIL,
+        screenshot_wait_until=config.SCREENSHOT_WAIT_UNTIL,
+        screenshot_format=config.SCREENSHOT_FORMAT,
+        screenshot_quality=config.SCREENSHOT_CAPTURE_QUALITY,
+        persist_screenshots=args.save_screenshots or config.SAVE_SCREENSHOTS,
+        screenshot_mode=args.screenshot_mode or config.SCREENSHOT_MODE,
+        main_content_selectors=config.SCREENSHOT_MAIN_SELECTORS,
+        screenshot_max_height=config.SCREENSHOT_CLIP_MAX_HEIGHT,
+        capture_form_screenshots=args.form_screenshots or config.SCREENSHOT_FORMS,
+        max_form_screenshots=config.SCREENSHOT_MAX_FORMS,
+        ledger=ledger,
+        page_index=page_index,
+        incremental=incremental,
+        browser_pool=browser_pool,
+        politeness=HostPolitenessScheduler(
+            max_per_host=max_per_host,
+            min_delay=config.CRAWL_MIN_DELAY,
+            max_delay=config.CRAWL_MAX_DELAY,
+            latency_factor=config.CRAWL_LATENCY_FACTOR,
+            respect_robots=args.respect_robots or config.CRAWL_RESPECT_ROBOTS,
+        ),
+        throttle_retries=config.CRAWL_THROTTLE_RETRIES,
+    )
 
     if args.page_only:
         # Only process the initial page
         logger.info("Generating test for the initial page only (--page-only mode)...")
         # Simulate a single-page crawl result
-        crawler = PlaywrightCrawler(website_url, max_pages=1)
-        page_data_dict = await crawler.crawl(single_page_only=True)
+        crawler = PlaywrightCrawler(website_url, max_pages=1, **crawler_options)
     else:
         # Site-wide crawl (default)
         max_pages = args.max_pages if args.max_pages else 100
-        crawler = PlaywrightCrawler(website_url, max_pages=max_pages)
-        page_data_dict = await crawler.crawl()
+        crawler = PlaywrightCrawler(
+            website_url,
+            max_pages=max_pages,
+            concurrency=crawl_concurrency,
+            prioritize_depth=config.CRAWL_PRIORITIZE_DEPTH,
+            **crawler_options,
+        )
 
-    for url, page_data in page_data_dict.items():
-        screenshot_path = page_data.get("screenshot_path")
-        safe_name = url.replace("https://", "").replace("http://", "").replace("/", "_").replace("?", "_")
+    cluster_templates = args.cluster_templates or config.TEMPLATE_CLUSTERING
+    if args.pipeline and cluster_templates:
+        logger.warning("Template clustering needs the full crawl and is not applied in --pipeline mode")
+    if args.pipeline and config.ANALYSIS_BATCH_SIZE > 1:
+        logger.warning("Batched analysis needs the full crawl and is not applied in --pipeline mode")
 
-        # 1. Perform analysis (vision-based if screenshot is available)
-        if screenshot_path and os.path.exists(screenshot_path):
-            logger.info(f"Performing vision-based analysis for {url} using screenshot: {screenshot_path}")
-            page_analysis = llm_analyzer.analyze_page_with_vision(page_data)
+    try:
+        if args.pipeline:
+            # Crawl, analysis and file writing run concurrently over bounded queues
+            pipeline = SmokeTestPipeline(
+                crawler,
+                llm_analyzer,
+                TESTS_DIR,
+                analysis_workers=args.analysis_workers or config.PIPELINE_ANALYSIS_WORKERS,
+                writer_workers=args.writer_workers or config.PIPELINE_WRITER_WORKERS,
+                queue_size=config.PIPELINE_QUEUE_SIZE,
+                ledger=ledger,
+                page_index=page_index,
+            )
+            await pipeline.run(single_page_only=args.page_only)
         else:
-            logger.info(f"Performing standard analysis for {url} (no screenshot available)")
-            page_analysis = llm_analyzer.analyze_page(page_data)
-
-        # 2. Generate test script from analysis (force Selenium/Java)
-        logger.info(f"Generating test script for {url}...")
-        test_script_info = llm_analyzer.generate_test_script(page_analysis, framework="selenium", language="java")
-        logger.info(f"LLM test_script_info: {test_script_info}")
-        logger.info(f"Raw LLM output:\n{test_script_info.get('feature_file', '')}")
-
-        # 3. Save feature file
-        test_file = os.path.join(TESTS_DIR, f"{safe_name}_smoketest.feature")
-        with open(test_file, "w", encoding="utf-8") as f:
-            f.write(test_script_info.get("feature_file", ""))
-        logger.info(f"Saved smoke test for {url} to {test_file}")
-
-        # 4. Save step definitions (Java example)
-        if "step_definitions" in test_script_info:
-            steps_file = os.path.join(TESTS_DIR, f"{safe_name}_steps.java")
-            with open(steps_file, "w", encoding="utf-8") as f:
-                f.write(test_script_info["step_definitions"])
-            logger.info(f"Saved step definitions for {url} to {steps_file}")
-
-        # 5. Save page object (Java example)
-        if "page_object" in test_script_info:
-            page_file = os.path.join(TESTS_DIR, f"{safe_name}_page.java")
-            with open(page_file, "w", encoding="utf-8") as f:
-                f.write(test_script_info["page_object"])
-            logger.info(f"Saved page object for {url} to {page_file}")
+            page_data_dict = await crawler.crawl(single_page_only=args.page_only)
+
+            if cluster_templates:
+                clusters = cluster_pages(page_data_dict, threshold=config.TEMPLATE_SIMILARITY_THRESHOLD)
+                work = [
+                    (c.representative, page_data_dict[c.representative],
+                     {u: page_meta(page_data_dict[u]) for u in c.urls})
+                    for c in clusters
+                ]
+            else:
+                work = [(url, page_data, None) for url, page_data in page_data_dict.items()]
+
+            # Encode on-disk screenshots up front across worker processes; vision analysis then
+            # reads the cache. In-memory captures are encoded when their page is analyzed.
+            screenshot_paths = [
+                page_data["screenshot_path"] for _, page_data, _ in work
+                if page_data.get("screenshot_path") and not page_data.get("screenshot_bytes")
+                and not page_data.get("unchanged")
+            ]
+            if screenshot_paths and config.SCREENSHOT_TILING:
+                await asyncio.to_thread(
+                    tile_screenshots_batch,
+                    screenshot_paths,
+                    tile_width=config.SCREENSHOT_TILE_WIDTH,
+                    tile_height=config.SCREENSHOT_TILE_HEIGHT,
+                    quality=config.SCREENSHOT_QUALITY,
+                    token_budget=config.SCREENSHOT_TOKEN_BUDGET,
+                    min_stddev=config.SCREENSHOT_TILE_MIN_STDDEV,
+                    max_workers=config.SCREENSHOT_WORKERS or None,
+                )
+            elif screenshot_paths:
+                await asyncio.to_thread(
+                    optimize_screenshots_batch,
+                    screenshot_paths,
+                    max_dimension=config.SCREENSHOT_MAX_DIMENSION,
+                    quality=config.SCREENSHOT_QUALITY,
+                    max_workers=config.SCREENSHOT_WORKERS or None,
+                )
+
+            # Small text-only pages share analysis requests when batching is enabled
+            analyses = {}
+            if config.ANALYSIS_BATCH_SIZE > 1 and not config.SINGLE_PASS_GENERATION:
+                analyses = await batch_analyze(llm_analyzer, [
+                    page_data for url, page_data, _ in work
+                    if not page_data.get("unchanged") and not files_already_written(url, ledger)
+                ], ledger)
+
+            # Pages are analyzed concurrently; the analyzer's scheduler bounds in-flight LLM requests
+            await asyncio.gather(*(
+                process_page(llm_analyzer, url, page_data, ledger, page_index, cluster, analyses.get(url))
+                for url, page_data, cluster in work
+            ))
+        logger.info(f"LLM cache: {llm_analyzer.cache.summary()}")
+        logger.info(f"LLM scheduler: {llm_analyzer.scheduler.stats}")
+        logger.info(f"LLM token usage: {llm_analyzer.usage_summary()}")
+        if llm_analyzer.visual_index:
+            logger.info(f"Visual dedup: {llm_analyzer.visual_index.summary()}")
+        if incremental:
+            logger.info(f"Incremental crawl: {page_index.stats}")
+    finally:
+        ledger.finish()
+        logger.info(f"Run {ledger.run_id} stages: {ledger.summary()}")
+        ledger.close()
+        page_index.close()
+        await browser_pool.close()
+        shutdown_process_pool()
+        llm_analyzer.cache.close()
     logger.info("All done!")
 
 if __name__ == "__main__":
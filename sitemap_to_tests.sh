@@ -1,4 +1,10 @@
 #!/bin/bash
+#
+# Usage: ./sitemap_to_tests.sh [sitemap_file] [base_url] [output_dir] [framework] [language] [use_vision] [max_pages]
+#
+# Writes the sitemap's URLs starting with base_url (all URLs when empty), at
+# most max_pages of them, to <output_dir>/filtered_sitemap.txt for
+# TestGenerator.generate_tests_from_sitemap.
 
 # Get the directory where this script is located
 SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" &> /dev/null && pwd )"
@@ -26,29 +32,27 @@ echo "Max pages: $MAX_PAGES"
 # Create output directory if it doesn't exist
 mkdir -p "$OUTPUT_DIR"
 
-# Filter sitemap if base_url is provided
+# Filter by base URL and limit the number of URLs in one streaming pass
+# (handles text, XML, sitemap index and gzipped sitemaps)
+FILTERED_SITEMAP="$OUTPUT_DIR/filtered_sitemap.txt"
+FILTER_ARGS=()
 if [ -n "$BASE_URL" ]; then
-    FILTERED_SITEMAP="$OUTPUT_DIR/filtered_sitemap.txt"
-    echo "Filtering sitemap for URLs containing $BASE_URL..."
-    grep "$BASE_URL" "$SITEMAP_FILE" > "$FILTERED_SITEMAP"
-    SITEMAP_FILE="$FILTERED_SITEMAP"
+    echo "Filtering sitemap for URLs starting with $BASE_URL..."
+    FILTER_ARGS+=(--base-url "$BASE_URL")
 fi
-
-# Limit number of URLs if needed
 if [ -n "$MAX_PAGES" ]; then
-    LIMITED_SITEMAP="$OUTPUT_DIR/limited_sitemap.txt"
     echo "Limiting sitemap to $MAX_PAGES URLs..."
-    head -n "$MAX_PAGES" "$SITEMAP_FILE" > "$LIMITED_SITEMAP"
-    SITEMAP_FILE="$LIMITED_SITEMAP"
+    FILTER_ARGS+=(--limit "$MAX_PAGES")
 fi
+PYTHONPATH="$SCRIPT_DIR${PYTHONPATH:+:$PYTHONPATH}" python -m core.sitemap_loader "$SITEMAP_FILE" "${FILTER_ARGS[@]}" > "$FILTERED_SITEMAP"
+SITEMAP_FILE="$FILTERED_SITEMAP"
 
-# Run the appropriate command
+# run.py has no sitemap mode; tests are generated from the filtered list in Python
 if [ "$USE_VISION" = "true" ]; then
-    python "$SCRIPT_DIR/run.py" vision-e2e --sitemap-file "$SITEMAP_FILE" \
-        -o "$OUTPUT_DIR" -f "$FRAMEWORK" -l "$LANGUAGE"
+    VISION_ARG="True"
 else
-    python "$SCRIPT_DIR/run.py" e2e --sitemap-file "$SITEMAP_FILE" \
-        -o "$OUTPUT_DIR" -f "$FRAMEWORK" -l "$LANGUAGE"
+    VISION_ARG="False"
 fi
-
-echo "Test generation complete. Results saved to $OUTPUT_DIR"
+echo "Filtered sitemap saved to $SITEMAP_FILE ($(wc -l < "$SITEMAP_FILE") URLs). Generate tests from it with:"
+echo "  TestGenerator().generate_tests_from_sitemap(\"$SITEMAP_FILE\", output_dir=\"$OUTPUT_DIR\","
+echo "      framework=\"$FRAMEWORK\", language=\"$LANGUAGE\", use_vision=$VISION_ARG, web_crawler=...)"
@@ -0,0 +1,112 @@
+import json
+import os
+from types import SimpleNamespace
+
+from core.batch_jobs import (
+    OFFLINE_RESPONSE,
+    BatchRequestFile,
+    LocalBatchRunner,
+    parse_batch_output,
+    run_batch_generation,
+    scratch_cache,
+)
+from core.llm_cache import LLMResponseCache
+
+
+def output_line(custom_id, content=None, status_code=200, error=None):
+    response = None
+    if status_code is not None:
+        response = {"status_code": status_code,
+                    "body": {"choices": [{"message": {"role": "assistant", "content": content}}]}}
+    return json.dumps({"custom_id": custom_id, "response": response, "error": error})
+
+
+class FakeGenerator:
+    """Generator whose pages each need one LLM response, looked up like the analyzer does."""
+
+    def __init__(self, cache, keys):
+        self.llm_analyzer = SimpleNamespace(cache=cache, batch_requests=None)
+        self.keys = keys
+        self.calls = 0
+
+    def generate_tests(self, **kwargs):
+        self.calls += 1
+        generated = {}
+        for key in self.keys:
+            content = self.llm_analyzer.cache.get(key)
+            if content is None and self.llm_analyzer.batch_requests is not None:
+                self.llm_analyzer.batch_requests.add(key, {"messages": [{"role": "user", "content": key}]})
+                continue
+            generated[key] = content
+        return generated
+
+
+def test_parse_batch_output_keeps_successful_lines():
+    text = "\n".join([
+        output_line("a", "answer a"),
+        "",
+        output_line("b", status_code=500, error={"message": "server error"}),
+        output_line("c", status_code=None, error={"message": "expired"}),
+        json.dumps({"custom_id": "d", "response": {"status_code": 200, "body": {"choices": []}}}),
+    ])
+    assert parse_batch_output(text) == {"a": "answer a"}
+
+
+def test_request_file_writes_each_key_once(tmp_path):
+    requests = BatchRequestFile(str(tmp_path / "jobs" / "requests.jsonl"))
+    requests.add("k1", {"model": "m"})
+    requests.add("k1", {"model": "m"})
+    requests.add("k2", {"model": "m"})
+    lines = [json.loads(line) for line in open(requests.path, encoding="utf-8")]
+    assert requests.count == 2
+    assert [line["custom_id"] for line in lines] == ["k1", "k2"]
+    assert lines[0]["url"] == "/v1/chat/completions"
+
+
+def test_local_runner_answers_every_request(tmp_path):
+    requests = BatchRequestFile(str(tmp_path / "requests.jsonl"))
+    requests.add("k1", {"messages": [{"role": "user", "content": "one"}]})
+    requests.add("k2", {"messages": [{"role": "user", "content": "two"}]})
+
+    results = LocalBatchRunner().run(requests.path)
+    assert results == {"k1": OFFLINE_RESPONSE, "k2": OFFLINE_RESPONSE}
+    assert os.path.exists(tmp_path / "requests.output.jsonl")
+
+
+def test_local_runner_reports_responder_errors_as_failed_requests(tmp_path):
+    def responder(body):
+        if body["messages"][0]["content"] == "bad":
+            raise RuntimeError("no answer")
+        return "ok"
+
+    requests = BatchRequestFile(str(tmp_path / "requests.jsonl"))
+    requests.add("good", {"messages": [{"role": "user", "content": "good"}]})
+    requests.add("bad", {"messages": [{"role": "user", "content": "bad"}]})
+    assert LocalBatchRunner(responder).run(requests.path) == {"good": "ok"}
+
+
+def test_batch_generation_reads_its_responses_under_refresh(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite"))
+    cache.set("stale", "old answer")
+    cache.close()
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite"), refresh=True)
+    generator = FakeGenerator(cache, ["page", "stale"])
+
+    generated = run_batch_generation(generator, LocalBatchRunner(lambda body: "new answer"), str(tmp_path / "jobs"))
+    assert generated == {"page": "new answer", "stale": "new answer"}
+    assert generator.calls == 2
+    # Only the keys the batch stored bypass refresh
+    assert cache.refresh is True
+    assert cache.get("other") is None
+
+
+def test_scratch_cache_keeps_dry_run_answers_out_of_the_persistent_cache(tmp_path):
+    persistent = LLMResponseCache(str(tmp_path / "cache.sqlite"))
+    generator = FakeGenerator(persistent, ["page"])
+
+    with scratch_cache(generator.llm_analyzer) as cache:
+        assert cache is not persistent
+        generated = run_batch_generation(generator, LocalBatchRunner(), str(tmp_path / "jobs"))
+    assert generated == {"page": OFFLINE_RESPONSE}
+    assert generator.llm_analyzer.cache is persistent
+    assert persistent.get("page") is None
@@ -0,0 +1,100 @@
+from core.clustering import cluster_pages, scenario_outline
+
+URLS = ["https://shop.example.com/p/1", "https://shop.example.com/p/2"]
+
+
+def product_page(n):
+    return {
+        "headings": [{"level": 1, "text": f"Product {n}"}],
+        "forms": [{"method": "post", "inputs": [{"type": "number", "name": f"qty{n}"}]}],
+        "elements": [
+            {"path": "main/div/button", "type": "submit", "name": "add-to-cart"},
+            {"path": "main/div/a", "type": "", "name": f"review-{n}"},
+            {"path": "footer/a", "type": "", "name": "contact"},
+        ],
+    }
+
+
+def contact_page():
+    return {
+        "headings": [{"level": 2, "text": "Contact"}],
+        "forms": [{"method": "get", "inputs": [{"type": "email", "name": "email"}]}],
+        "elements": [
+            {"path": "main/form/textarea", "type": "", "name": "message"},
+            {"path": "main/form/button", "type": "submit", "name": "send"},
+        ],
+    }
+
+
+def test_pages_of_one_template_share_a_cluster():
+    pages = {URLS[0]: product_page(1), URLS[1]: product_page(2),
+             "https://shop.example.com/contact": contact_page()}
+    clusters = cluster_pages(pages)
+
+    assert [c.representative for c in clusters] == [URLS[0], "https://shop.example.com/contact"]
+    assert clusters[0].urls == URLS
+
+
+def test_scenario_becomes_outline_over_cluster_urls():
+    feature = (
+        "Feature: Product\n\n"
+        "  Scenario: Title shows\n"
+        f"    Given I open the url \"{URLS[0]}\"\n"
+        "    Then I see the title\n"
+    )
+    result = scenario_outline(feature, URLS[0], URLS)
+
+    assert "  Scenario Outline: Title shows" in result
+    assert '    Given I open the url "<url>"' in result
+    assert result.count("Examples:") == 1
+    assert all(f"      | {url} |" in result for url in URLS)
+
+
+def test_existing_examples_gain_a_url_column():
+    feature = (
+        "Feature: Product\n\n"
+        "  Scenario Outline: Search\n"
+        "    When I search for \"<term>\"\n\n"
+        "    Examples:\n"
+        "      | term |\n"
+        "      | shoe |\n"
+        "      | hat |\n"
+    )
+    result = scenario_outline(feature, URLS[0], URLS)
+    lines = result.splitlines()
+
+    assert result.count("Examples:") == 1
+    assert '    Given I open the url "<url>"' in lines
+    table = lines[lines.index("    Examples:") + 1:]
+    assert table == [
+        "      | url | term |",
+        f"      | {URLS[0]} | shoe |",
+        f"      | {URLS[0]} | hat |",
+        f"      | {URLS[1]} | shoe |",
+        f"      | {URLS[1]} | hat |",
+    ]
+
+
+def test_background_navigation_moves_into_each_outline():
+    feature = (
+        "Feature: Product\n\n"
+        "  Background:\n"
+        f"    Given I open the url \"{URLS[0]}/\"\n"
+        "    And I accept cookies\n\n"
+        "  Scenario: Title shows\n"
+        "    Given the page is loaded\n"
+        "    Then I see the title\n"
+    )
+    result = scenario_outline(feature, URLS[0], URLS)
+
+    assert "Background:" not in result
+    assert (
+        '    Given I open the url "<url>/"\n'
+        "    And I accept cookies\n"
+        "    And the page is loaded\n"
+    ) in result
+
+
+def test_single_page_cluster_is_left_alone():
+    feature = "Feature: Product\n\n  Scenario: Title shows\n    Then I see the title\n"
+    assert scenario_outline(feature, URLS[0], URLS[:1]) == feature
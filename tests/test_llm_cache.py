@@ -0,0 +1,67 @@
+import time
+
+from core.llm_cache import LLMResponseCache
+
+
+def make_cache(tmp_path, **kwargs):
+    return LLMResponseCache(str(tmp_path / "cache.sqlite"), **kwargs)
+
+
+def test_make_key_is_order_independent_and_content_sensitive():
+    key = LLMResponseCache.make_key(model="m", prompt="p", max_tokens=10)
+    assert key == LLMResponseCache.make_key(max_tokens=10, prompt="p", model="m")
+    assert key != LLMResponseCache.make_key(model="m", prompt="p2", max_tokens=10)
+
+
+def test_set_then_get_hits(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set("k", "response")
+    assert cache.get("k") == "response"
+    assert cache.get("missing") is None
+    assert cache.summary()["hits"] == 1
+    assert cache.summary()["misses"] == 1
+
+
+def test_entries_persist_across_instances(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set("k", "response")
+    cache.close()
+    assert make_cache(tmp_path).get("k") == "response"
+
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = make_cache(tmp_path, enabled=False)
+    cache.set("k", "response")
+    assert cache.get("k") is None
+
+
+def test_refresh_skips_lookups_but_stores(tmp_path):
+    cache = make_cache(tmp_path, refresh=True)
+    cache.set("k", "fresh")
+    assert cache.get("k") is None
+    assert make_cache(tmp_path).get("k") == "fresh"
+
+
+def test_expired_entries_miss(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path, ttl_seconds=10)
+    cache.set("k", "response")
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 60)
+    assert cache.get("k") is None
+    assert cache.stats["evictions"] == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: clock[0])
+    cache = make_cache(tmp_path, max_bytes=10)
+    cache.set("old", "aaaa")
+    clock[0] += 1
+    cache.set("used", "bbbb")
+    clock[0] += 1
+    assert cache.get("old") == "aaaa"  # now more recently used than "used"
+    clock[0] += 1
+    cache.set("new", "cccc")
+    assert cache.get("used") is None
+    assert cache.get("old") == "aaaa"
+    assert cache.get("new") == "cccc"
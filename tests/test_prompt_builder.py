@@ -0,0 +1,65 @@
+from core import prompt_builder
+from core.llm_scheduler import estimate_tokens
+from core.prompt_builder import PromptBuilder, compact_items, compact_lines, count_tokens
+
+
+def test_compact_lines_renders_nested_values_and_skips_empty_ones():
+    value = {"title": "Shop", "empty": "", "links": ["a", "b"], "form": {"id": "login", "inputs": []}}
+    assert compact_lines(value) == ["title: Shop", "links:", "  - a", "  - b", "form:", "  id: login"]
+    assert compact_lines([]) == []
+
+
+def test_compact_items_keeps_each_entry_whole():
+    items = compact_items([{"name": "buy", "selector": "#buy"}, "plain", None])
+    assert items == ["- name: buy\n  selector: #buy", "- plain"]
+    assert compact_items({"btn": "id", "none": None}) == ["btn: id"]
+
+
+def test_fixed_text_is_always_kept_and_items_fill_the_budget():
+    header = "PAGE URL: https://example.com"
+    items = [f"- element {i}" for i in range(50)]
+    budget = count_tokens(header + "\n") + count_tokens("ELEMENTS:\n\n") + 5 * count_tokens(items[0] + "\n")
+    result = PromptBuilder(budget).add_text("header", header).add_items("elements", items, header="ELEMENTS:").build()
+
+    assert result["prompt"].startswith(header)
+    assert result["tokens"] <= budget
+    assert 0 < result["sections"]["elements"]["kept"] < 50
+    assert result["sections"]["elements"]["total"] == 50
+
+
+def test_lower_priority_values_fill_first_but_keep_their_position():
+    builder = PromptBuilder(count_tokens("B:\n- b\n\n") + 1)
+    builder.add_items("a", ["- a" * 20], priority=1, header="A:")
+    builder.add_items("b", ["- b"], priority=0, header="B:")
+    result = builder.build()
+
+    assert result["prompt"] == "B:\n- b"
+    assert result["sections"]["a"]["kept"] == 0
+
+
+def test_smaller_later_items_still_fill_the_budget():
+    big = "- " + "x" * 400
+    budget = count_tokens("- small\n") * 3
+    result = PromptBuilder(budget).add_items("items", [big, "- small", "- small"]).build()
+
+    assert result["sections"]["items"]["kept"] == 2
+    assert big not in result["prompt"]
+
+
+def test_empty_sections_are_omitted():
+    result = PromptBuilder(100).add_text("header", "H").add_items("none", [], header="NONE:").build()
+    assert result["prompt"] == "H"
+
+
+def test_count_tokens_falls_back_to_an_estimate_when_the_encoding_cannot_load(monkeypatch):
+    class OfflineTiktoken:
+        @staticmethod
+        def encoding_for_model(model):
+            raise OSError("network unreachable")
+
+    monkeypatch.setattr(prompt_builder, "tiktoken", OfflineTiktoken)
+    prompt_builder._encoding.cache_clear()
+    try:
+        assert count_tokens("x" * 40, model="offline-model") == estimate_tokens("x" * 40)
+    finally:
+        prompt_builder._encoding.cache_clear()
@@ -0,0 +1,55 @@
+import pytest
+
+from core.run_ledger import RunLedger, STAGE_ANALYZED, STAGE_CRAWLED
+
+
+def make_ledger(tmp_path, **kwargs):
+    return RunLedger(str(tmp_path / "ledger.sqlite"), str(tmp_path / "artifacts"), **kwargs)
+
+
+def test_stages_start_missing_and_record_done_or_failed(tmp_path):
+    ledger = make_ledger(tmp_path, base_url="https://example.com")
+    url = "https://example.com/a"
+    assert not ledger.is_done(url, STAGE_CRAWLED)
+
+    ledger.mark_done(url, STAGE_CRAWLED, {"path": "page.json"})
+    ledger.mark_failed(url, STAGE_ANALYZED, RuntimeError("boom"))
+
+    assert ledger.is_done(url, STAGE_CRAWLED)
+    assert ledger.artifact(url, STAGE_CRAWLED) == {"path": "page.json"}
+    assert not ledger.is_done(url, STAGE_ANALYZED)
+    assert ledger.artifact(url, STAGE_ANALYZED) is None
+    assert ledger.summary() == {STAGE_CRAWLED: {"done": 1}, STAGE_ANALYZED: {"failed": 1}}
+
+
+def test_store_json_round_trips_and_lists_completed(tmp_path):
+    ledger = make_ledger(tmp_path)
+    url = "https://example.com/a?b=1"
+    path = ledger.store_json(url, STAGE_ANALYZED, {"title": "A"})
+
+    assert ledger.load_json(url, STAGE_ANALYZED) == {"title": "A"}
+    assert ledger.completed(STAGE_ANALYZED) == {url: path}
+    assert ledger.load_json("https://example.com/other", STAGE_ANALYZED) is None
+
+
+def test_resume_sees_previous_run_state(tmp_path):
+    ledger = make_ledger(tmp_path, base_url="https://example.com")
+    ledger.mark_done("https://example.com/a", STAGE_CRAWLED)
+    run_id = ledger.run_id
+    ledger.close()
+
+    resumed = make_ledger(tmp_path, run_id=run_id, resume=True)
+    assert resumed.base_url == "https://example.com"
+    assert resumed.is_done("https://example.com/a", STAGE_CRAWLED)
+
+
+def test_resume_of_unknown_run_fails(tmp_path):
+    with pytest.raises(ValueError):
+        make_ledger(tmp_path, run_id="missing", resume=True)
+
+
+def test_runs_are_isolated(tmp_path):
+    first = make_ledger(tmp_path, run_id="first")
+    first.mark_done("https://example.com/a", STAGE_CRAWLED)
+    second = make_ledger(tmp_path, run_id="second")
+    assert not second.is_done("https://example.com/a", STAGE_CRAWLED)
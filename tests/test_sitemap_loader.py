@@ -0,0 +1,85 @@
+import gzip
+from types import SimpleNamespace
+
+import pytest
+
+from core.sitemap_loader import SitemapLoader, parse_lastmod
+
+URLSET = """<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
+        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1"
+        xmlns:video="http://www.google.com/schemas/sitemap-video/1.1">
+  <url>
+    <loc>https://example.com/a</loc>
+    <lastmod>2024-05-01</lastmod>
+    <changefreq>daily</changefreq>
+    <priority>0.8</priority>
+    <image:image>
+      <image:loc>https://cdn.example.com/a.jpg</image:loc>
+    </image:image>
+    <video:video>
+      <video:content_loc>https://cdn.example.com/a.mp4</video:content_loc>
+      <video:player_loc>https://cdn.example.com/player</video:player_loc>
+    </video:video>
+  </url>
+  <url>
+    <loc>https://example.com/b</loc>
+  </url>
+</urlset>
+"""
+
+
+@pytest.fixture
+def loader(tmp_path):
+    return SitemapLoader(SimpleNamespace(OUTPUT_DIR=str(tmp_path)))
+
+
+def write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_plain_text_sitemap_skips_blank_and_comment_lines(loader, tmp_path):
+    path = write(tmp_path / "urls.txt", "https://example.com/a\n\n# note\nhttps://example.com/b\n")
+    assert loader.load_sitemap_from_file(path) == ["https://example.com/a", "https://example.com/b"]
+
+
+def test_xml_entries_keep_metadata(loader, tmp_path):
+    entries = list(loader.iter_sitemap(write(tmp_path / "sitemap.xml", URLSET)))
+    assert entries[0] == {"url": "https://example.com/a", "lastmod": "2024-05-01",
+                          "changefreq": "daily", "priority": 0.8}
+    assert entries[1] == {"url": "https://example.com/b", "lastmod": None,
+                          "changefreq": None, "priority": None}
+
+
+def test_extension_tags_do_not_override_the_page_loc(loader, tmp_path):
+    urls = [e["url"] for e in loader.iter_sitemap(write(tmp_path / "sitemap.xml", URLSET))]
+    assert urls == ["https://example.com/a", "https://example.com/b"]
+
+
+def test_sitemap_without_namespace(loader, tmp_path):
+    path = write(tmp_path / "sitemap.xml", "<urlset><url><loc>https://example.com/a</loc></url></urlset>")
+    assert loader.load_sitemap_from_file(path) == ["https://example.com/a"]
+
+
+def test_gzipped_index_follows_local_children_once(loader, tmp_path):
+    write(tmp_path / "pages.xml", URLSET)
+    index = (
+        '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        "<sitemap><loc>https://example.com/pages.xml</loc></sitemap>"
+        "<sitemap><loc>https://example.com/missing.xml</loc></sitemap>"
+        "<sitemap><loc>https://example.com/index.xml.gz</loc></sitemap>"
+        "</sitemapindex>"
+    )
+    with gzip.open(tmp_path / "index.xml.gz", "wt", encoding="utf-8") as f:
+        f.write(index)
+
+    urls = loader.load_sitemap_from_file(str(tmp_path / "index.xml.gz"))
+    assert urls == ["https://example.com/a", "https://example.com/b"]
+
+
+def test_parse_lastmod():
+    assert parse_lastmod("2024-05-01") == parse_lastmod("2024-05-01T00:00:00Z")
+    assert parse_lastmod("2024-05-01T02:00:00+02:00") == parse_lastmod("2024-05-01")
+    assert parse_lastmod("yesterday") is None
+    assert parse_lastmod(None) is None
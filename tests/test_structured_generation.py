@@ -0,0 +1,84 @@
+import json
+
+import core.structured_generation as structured
+
+FEATURE = """Feature: Login page smoke test
+  Scenario: Login page loads
+    Given I open the url "https://example.com/login"
+    Then I expect the page title contains "Login"
+"""
+
+STEPS = """public class LoginSteps {
+    @Given("I open the url {string}")
+    public void iOpenTheUrl(String url) {
+        driver.get(url); // opens "{url}"
+    }
+}"""
+
+PAGE_OBJECT = """public class LoginPage {
+    private final String heading = "h1 { not a brace }";
+}"""
+
+
+def valid_script(**overrides):
+    data = {
+        "key_elements": ["Login form"],
+        "unique_identifiers": ["Title: Login"],
+        "smoke_test_steps": ["Open the page", "Check the title"],
+        "locator_strategies": [{"element": "Login form", "locator": "css=form#login"}],
+        "feature_file": FEATURE,
+        "step_definitions": STEPS,
+        "page_object": PAGE_OBJECT,
+    }
+    data.update(overrides)
+    return data
+
+
+def test_response_format_wraps_the_strict_schema():
+    response_format = structured.test_script_response_format()
+    assert response_format["type"] == "json_schema"
+    assert response_format["json_schema"]["strict"] is True
+    assert response_format["json_schema"]["schema"] is structured.TEST_SCRIPT_SCHEMA
+
+
+def test_parse_strips_code_fences_from_files():
+    content = json.dumps(valid_script(feature_file="```gherkin\n" + FEATURE + "```", page_object="```java\n" + PAGE_OBJECT + "\n```"))
+    data = structured.parse_test_script(content)
+    assert data["feature_file"] == FEATURE.strip()
+    assert data["page_object"] == PAGE_OBJECT
+
+
+def test_valid_script_has_no_problems():
+    assert structured.validate_test_script(valid_script()) == []
+
+
+def test_missing_and_mistyped_fields_are_reported():
+    data = valid_script(smoke_test_steps="Open the page")
+    del data["page_object"]
+    problems = structured.validate_test_script(data)
+    assert "smoke_test_steps is missing or not a list" in problems
+    assert "page_object is missing or not a str" in problems
+    assert structured.validate_test_script(["not", "an", "object"]) == ["response is not a JSON object"]
+
+
+def test_feature_without_scenario_or_steps_is_rejected():
+    problems = structured.validate_test_script(valid_script(feature_file="Feature: Empty\n"))
+    assert "feature_file has no scenario" in problems
+    assert "feature_file has no Given/When/Then steps" in problems
+
+
+def test_java_checks_report_missing_annotations_classes_and_braces():
+    problems = structured.validate_test_script(valid_script(
+        step_definitions="public class Steps {\n    public void open() {\n}",
+        page_object="// TODO: page object",
+    ))
+    assert "step_definitions has no Cucumber step annotations" in problems
+    assert "step_definitions has unbalanced braces" in problems
+    assert "page_object declares no class" in problems
+    # Other languages only get the language-independent checks
+    assert structured.validate_test_script(valid_script(step_definitions="steps", page_object="page"), "python") == []
+
+
+def test_locator_map_skips_incomplete_pairs():
+    pairs = [{"element": "Login form", "locator": "css=form"}, {"element": "", "locator": "css=a"}, "bad"]
+    assert structured.locator_map(pairs) == {"Login form": "css=form"}
@@ -0,0 +1,74 @@
+import pytest
+
+from core.url_filter import UrlFilter, UrlRule, glob_to_regex
+
+URLS = [
+    "https://shop.example.com/",
+    "https://shop.example.com/products/1",
+    "https://shop.example.com/products/2",
+    "https://shop.example.com/products/3",
+    "https://shop.example.com/products/1/reviews",
+    "https://shop.example.com/blog/post-1",
+    "https://shop.example.com/checkout?step=1",
+    "https://other.example.com/products/9",
+]
+
+
+def kept(url_filter, urls=URLS):
+    return list(url_filter.filter(urls))
+
+
+def test_rule_kinds():
+    assert UrlRule("checkout").kind == "substr"
+    assert UrlRule("prefix:/products").kind == "prefix"
+    assert UrlRule("glob:/products/*@2").limit == 2
+    assert UrlRule("re:item-\\d{2}@1").limit is None  # "@" belongs to the regex
+    assert glob_to_regex("/a/*/b/**") == "/a/[^/]*/b/.*"
+    with pytest.raises(Exception):
+        UrlRule("re:(unclosed")
+
+
+def test_substring_prefix_and_glob_rules():
+    assert kept(UrlFilter(["checkout"])) == ["https://shop.example.com/checkout?step=1"]
+    assert kept(UrlFilter(["prefix:/blog"])) == ["https://shop.example.com/blog/post-1"]
+    # "*" stops at "/", so reviews pages do not match
+    assert kept(UrlFilter(["glob:/products/*"], base_url="https://shop.example.com")) == URLS[1:4]
+
+
+def test_exclude_and_base_url():
+    url_filter = UrlFilter(exclude=["prefix:/products", "checkout"], base_url="https://shop.example.com")
+    assert kept(url_filter) == ["https://shop.example.com/", "https://shop.example.com/blog/post-1"]
+
+
+def test_per_rule_limits_and_default_sample_limit():
+    url_filter = UrlFilter(["glob:/products/*@2", "prefix:/blog", "prefix:/checkout"], sample_limit=1)
+    assert kept(url_filter) == [
+        "https://shop.example.com/products/1",
+        "https://shop.example.com/products/2",
+        "https://shop.example.com/blog/post-1",
+        "https://shop.example.com/checkout?step=1",
+    ]
+    assert url_filter.stats["sampled_out"] == 2
+
+
+def test_duplicates_are_dropped_after_normalization():
+    urls = ["https://shop.example.com/a", "https://shop.example.com/a#top", "https://shop.example.com/a/"]
+    url_filter = UrlFilter()
+    assert kept(url_filter, urls) == ["https://shop.example.com/a"]
+    assert url_filter.stats["duplicates"] == 2
+    assert len(kept(UrlFilter(dedupe=False), urls)) == 3
+
+
+def test_inline_flag_rule_matches_case_insensitively():
+    url_filter = UrlFilter(["re:(?i)/PRODUCTS/\\d$", "prefix:/blog"], base_url="https://shop.example.com")
+    assert kept(url_filter) == URLS[1:4] + ["https://shop.example.com/blog/post-1"]
+
+
+def test_backreference_rule_is_matched_on_its_own():
+    urls = ["https://shop.example.com/a/a", "https://shop.example.com/a/b", "https://shop.example.com/blog/x"]
+    assert kept(UrlFilter(["re:/(\\w)/\\1$", "prefix:/blog"]), urls) == [urls[0], urls[2]]
+
+
+def test_rules_reusing_a_group_name_keep_their_order_and_limits():
+    url_filter = UrlFilter(["re:/(?P<section>products)/\\d$", "re:/(?P<section>blog)/"], sample_limit=1)
+    assert kept(url_filter) == ["https://shop.example.com/products/1", "https://shop.example.com/blog/post-1"]